@@ -1,6 +1,97 @@
 from django.contrib import admin
-from .models import Categoria, Conta, Transacao
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
-admin.site.register(Categoria)
-admin.site.register(Conta)
-admin.site.register(Transacao)
\ No newline at end of file
+from .models import Categoria, Conta, GastoCategoria, Orcamento, Recorrencia, Transacao
+
+
+class PaginadorEstimado(Paginator):
+    """
+    No Postgres, usa a estimativa do planejador (EXPLAIN) em vez de COUNT(*)
+    quando o resultado é grande. Abaixo de LIMITE_EXATO a contagem é exata.
+    """
+    LIMITE_EXATO = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plano = cursor.fetchone()[0]
+        estimativa = int(plano[0]['Plan']['Plan Rows'])
+
+        if estimativa < self.LIMITE_EXATO:
+            return super().count
+        return estimativa
+
+
+@admin.register(Categoria)
+class CategoriaAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'usuario', 'dt_criacao')
+    list_select_related = ('usuario',)
+    search_fields = ('nome',)
+    raw_id_fields = ('usuario',)
+
+
+@admin.register(Conta)
+class ContaAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'instituicao', 'usuario', 'saldo_inicial')
+    list_select_related = ('usuario',)
+    search_fields = ('nome', 'instituicao')
+    raw_id_fields = ('usuario',)
+
+
+@admin.register(Transacao)
+class TransacaoAdmin(admin.ModelAdmin):
+    list_display = ('data', 'descricao', 'valor', 'tipo', 'conta', 'categoria')
+    # ✅ Evita N+1 no __str__ de conta/categoria em cada linha
+    list_select_related = ('conta', 'categoria')
+    # Filtros apenas em colunas indexadas (FKs carregariam todas as contas/categorias na lateral)
+    list_filter = ('tipo',)
+    date_hierarchy = 'data'
+    search_fields = ('=hash_id', 'descricao')
+    # ✅ Busca sob demanda em vez de um <select> com todas as contas/categorias
+    autocomplete_fields = ('conta', 'categoria')
+    ordering = ('-data', '-id')
+
+    paginator = PaginadorEstimado
+    show_full_result_count = False  # Evita um segundo COUNT(*) da tabela inteira
+    list_per_page = 50
+
+
+@admin.register(Recorrencia)
+class RecorrenciaAdmin(admin.ModelAdmin):
+    list_display = ('descricao', 'valor', 'tipo', 'frequencia', 'proxima_data', 'ativa', 'conta')
+    list_select_related = ('conta',)
+    list_filter = ('ativa', 'frequencia')
+    search_fields = ('descricao',)
+    autocomplete_fields = ('conta', 'categoria')
+    readonly_fields = ('proxima_data',)
+
+
+@admin.register(Orcamento)
+class OrcamentoAdmin(admin.ModelAdmin):
+    list_display = ('categoria', 'mes', 'valor', 'usuario')
+    list_select_related = ('categoria', 'usuario')
+    date_hierarchy = 'mes'
+    autocomplete_fields = ('categoria',)
+
+
+@admin.register(GastoCategoria)
+class GastoCategoriaAdmin(admin.ModelAdmin):
+    # Mantido pelas transações (e pelo comando reconciliar_gastos): só leitura
+    list_display = ('categoria', 'mes', 'total', 'quantidade')
+    list_select_related = ('categoria',)
+    date_hierarchy = 'mes'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
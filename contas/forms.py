@@ -1,5 +1,8 @@
 from django import forms
-from .models import Transacao, Conta, Categoria
+from .models import Transacao, Conta, Categoria, Recorrencia, Orcamento
+from .referencias import obter_referencias
+
+OPCAO_VAZIA = [('', '---------')]
 
 
 class TransacaoForm(forms.ModelForm):
@@ -21,10 +24,92 @@ class TransacaoForm(forms.ModelForm):
             self.fields['conta'].queryset = Conta.objects.filter(usuario=user)
             self.fields['categoria'].queryset = Categoria.objects.filter(usuario=user)
 
+            # ✅ As opções vêm do cache de referências: renderizar não consulta o banco
+            # (o queryset continua valendo para validar o que for enviado)
+            referencias = obter_referencias(user.id)
+            self.fields['conta'].choices = OPCAO_VAZIA + referencias.contas
+            self.fields['categoria'].choices = OPCAO_VAZIA + referencias.categorias
+
+        # Aplica classe CSS
+        for field in self.fields.values():
+            field.widget.attrs['class'] = 'form-control'
+
+
+class RecorrenciaForm(forms.ModelForm):
+    class Meta:
+        model = Recorrencia
+        fields = ['descricao', 'valor', 'tipo', 'conta', 'categoria', 'frequencia', 'intervalo', 'data_inicio', 'data_fim']
+        labels = {
+            'intervalo': "A cada (semanas/meses/anos)",
+            'data_inicio': "Primeira ocorrência",
+            'data_fim': "Última ocorrência (opcional)",
+        }
+        widgets = {
+            'data_inicio': forms.DateInput(attrs={'type': 'date'}),
+            'data_fim': forms.DateInput(attrs={'type': 'date'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+
+        # ✅ SEGURANÇA: Filtra apenas contas e categorias do usuário logado
+        if user:
+            self.fields['conta'].queryset = Conta.objects.filter(usuario=user)
+            self.fields['categoria'].queryset = Categoria.objects.filter(usuario=user)
+
+            referencias = obter_referencias(user.id)
+            self.fields['conta'].choices = OPCAO_VAZIA + referencias.contas
+            self.fields['categoria'].choices = OPCAO_VAZIA + referencias.categorias
+
         # Aplica classe CSS
         for field in self.fields.values():
             field.widget.attrs['class'] = 'form-control'
 
+    def clean(self):
+        dados = super().clean()
+        if dados.get('data_fim') and dados.get('data_inicio') and dados['data_fim'] < dados['data_inicio']:
+            self.add_error('data_fim', "A última ocorrência não pode ser antes da primeira.")
+        return dados
+
+
+class OrcamentoForm(forms.ModelForm):
+    mes = forms.DateField(
+        label="Mês",
+        input_formats=['%Y-%m'],
+        widget=forms.DateInput(attrs={'type': 'month'}, format='%Y-%m'),
+    )
+
+    class Meta:
+        model = Orcamento
+        fields = ['categoria', 'mes', 'valor']
+        labels = {'valor': "Limite de despesas"}
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+
+        # ✅ SEGURANÇA: Filtra apenas categorias do usuário logado
+        if user:
+            self.fields['categoria'].queryset = Categoria.objects.filter(usuario=user)
+            self.fields['categoria'].choices = OPCAO_VAZIA + obter_referencias(user.id).categorias
+
+        # Aplica classe CSS
+        for field in self.fields.values():
+            field.widget.attrs['class'] = 'form-control'
+
+    def clean_mes(self):
+        return self.cleaned_data['mes'].replace(day=1)
+
+    def clean(self):
+        dados = super().clean()
+        # Já existe orçamento para a categoria no mês: o formulário passa a editá-lo
+        if dados.get('categoria') and dados.get('mes'):
+            existente = Orcamento.objects.filter(categoria=dados['categoria'], mes=dados['mes']).first()
+            if existente is not None:
+                self.instance = existente
+        return dados
+
 
 class CategoriaForm(forms.ModelForm):
     class Meta:
@@ -64,7 +149,48 @@ class UploadFileForm(forms.Form):
         # ✅ SEGURANÇA: Filtra apenas contas do usuário logado
         if user:
             self.fields['conta'].queryset = Conta.objects.filter(usuario=user)
+            self.fields['conta'].choices = OPCAO_VAZIA + obter_referencias(user.id).contas
 
         # Aplica classe CSS
         for field in self.fields.values():
-            field.widget.attrs['class'] = 'form-control'
\ No newline at end of file
+            field.widget.attrs['class'] = 'form-control'
+
+
+class MultiplosArquivosInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultiplosArquivosField(forms.FileField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultiplosArquivosInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        limpar = super().clean
+        if isinstance(data, (list, tuple)):
+            return [limpar(arquivo, initial) for arquivo in data]
+        return [limpar(data, initial)]
+
+
+class UploadLoteForm(forms.Form):
+    arquivos = MultiplosArquivosField(
+        label="Selecione os Extratos (PDFs, Imagens ou um .zip)",
+        widget=MultiplosArquivosInput(attrs={'accept': 'application/pdf, image/*, .zip'})
+    )
+    conta = forms.ModelChoiceField(
+        queryset=Conta.objects.none(),
+        label="Para qual conta?"
+    )
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+
+        # ✅ SEGURANÇA: Filtra apenas contas do usuário logado
+        if user:
+            self.fields['conta'].queryset = Conta.objects.filter(usuario=user)
+            self.fields['conta'].choices = OPCAO_VAZIA + obter_referencias(user.id).contas
+
+        # Aplica classe CSS
+        for field in self.fields.values():
+            field.widget.attrs['class'] = 'form-control'
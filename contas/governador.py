@@ -0,0 +1,377 @@
+"""
+Governador das chamadas ao Gemini.
+
+Todas as chamadas à IA passam por aqui:
+- um único cliente por processo (reaproveita conexões HTTP);
+- um balde de tokens global que limita as requisições por minuto: até
+  REQUISICOES_POR_MINUTO de uma vez, repostas uma a uma em 60/limite segundos
+  (sem o estouro de 2x na virada do minuto de uma janela fixa). Cada chamada
+  ao provedor consome um token: o upload, a geração e cada retentativa. O
+  estado é um único horário no cache, lido e gravado atomicamente: num script
+  Lua com Redis, ou sob uma trava de arquivo nos demais;
+- contadores de vagas e métricas no cache (incr/decr do Redis, ou sob a
+  mesma trava de arquivo);
+- limite de chamadas simultâneas no total e por usuário;
+- retentativas com backoff exponencial quando o provedor responde 429;
+- métricas do tempo de espera na fila.
+
+Sem Redis, o cache e a trava são da máquina: os limites valem entre os
+workers de um servidor, não entre servidores. Com mais de uma máquina, use
+REDIS_URL.
+
+Para testes e testes de carga existe o `ClienteFalso`, que imita a parte da
+interface do google-genai usada pelo projeto e pode simular erros 429.
+"""
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PADRAO = {
+    'CACHE': 'default',
+    'REQUISICOES_POR_MINUTO': 10,   # Tamanho do balde (0 = sem limite)
+    'MAX_SIMULTANEAS': 4,           # Chamadas em andamento no total
+    'MAX_POR_USUARIO': 1,           # Chamadas em andamento por usuário
+    'ESPERA_MAXIMA': 30.0,          # Segundos na fila antes de desistir
+    'INTERVALO_FILA': 0.25,         # Segundos entre tentativas de pegar vaga
+    'TENTATIVAS': 4,                # Tentativas em caso de 429
+    'BACKOFF_BASE': 1.0,
+    'BACKOFF_MAXIMO': 20.0,
+    'TTL_VAGA': 600,                # Libera vagas "presas" por processos que morreram
+    'CLIENTE_FALSO': False,
+    'FALSO_TAXA_429': 0.0,
+    'FALSO_LATENCIA': 0.0,
+}
+
+
+class IAOcupada(Exception):
+    """A IA não pôde ser chamada: fila cheia ou limite do provedor esgotado."""
+
+
+def config(chave):
+    personalizada = getattr(settings, 'GEMINI_GOVERNADOR', {})
+    return personalizada.get(chave, CONFIG_PADRAO[chave])
+
+
+def _cache():
+    return caches[config('CACHE')]
+
+
+# --- CLIENTE COMPARTILHADO ---
+_cliente = None
+_cliente_lock = threading.Lock()
+
+
+def obter_cliente():
+    """Retorna o cliente do processo (criado na primeira chamada) ou None sem chave de API."""
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _cliente = _criar_cliente()
+    return _cliente
+
+
+def redefinir_cliente():
+    global _cliente
+    with _cliente_lock:
+        _cliente = None
+
+
+def _criar_cliente():
+    if config('CLIENTE_FALSO'):
+        return ClienteFalso(taxa_429=config('FALSO_TAXA_429'), latencia=config('FALSO_LATENCIA'))
+
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        return None
+
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+
+# --- CONTADORES NO CACHE ---
+def _incrementar(chave, delta=1, timeout=None):
+    cache = _cache()
+    with _atomico(cache):
+        cache.add(chave, 0, timeout=timeout)
+        try:
+            return cache.incr(chave, delta)
+        except ValueError:
+            # A chave expirou entre o add e o incr
+            cache.set(chave, delta, timeout=timeout)
+            return delta
+
+
+# --- BALDE DE TOKENS ---
+# Guarda só o "horário teórico" (TAT) em que o balde estaria cheio de novo:
+# cada token empurra o TAT em `intervalo`; falta token quando o TAT passa de
+# agora + (capacidade - intervalo). Equivale a um balde de `limite` tokens
+# reposto continuamente, com um único valor para ler e gravar.
+CHAVE_BALDE = 'ia:balde'
+
+_SCRIPT_BALDE = """
+local t = redis.call('TIME')
+local agora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local intervalo = tonumber(ARGV[1])
+local capacidade = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1])) or agora
+if tat < agora then tat = agora end
+if tat - agora > capacidade - intervalo then return 0 end
+redis.call('SET', KEYS[1], tostring(tat + intervalo), 'EX', math.ceil(capacidade) + 1)
+return 1
+"""
+
+_trava_local = threading.Lock()
+CAMINHO_TRAVA = os.path.join(tempfile.gettempdir(), 'financeiro-ia.lock')
+
+
+@contextmanager
+def _trava_maquina():
+    """Exclusão mútua entre threads e entre os workers da máquina (flock)."""
+    with _trava_local:
+        try:
+            import fcntl
+        except ImportError:  # Windows: só entre threads
+            yield
+            return
+        with open(CAMINHO_TRAVA, 'a') as arquivo:
+            fcntl.flock(arquivo, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _atomico(cache):
+    """incr/decr do Redis já são atômicos; nos demais caches (get + set), só sob a trava."""
+    if isinstance(cache, RedisCache):
+        yield
+    else:
+        with _trava_maquina():
+            yield
+
+
+def _consumir_token():
+    """Tenta retirar um token do balde."""
+    limite = config('REQUISICOES_POR_MINUTO')
+    if not limite:
+        return True
+    intervalo = 60.0 / limite
+    capacidade = 60.0  # limite * intervalo
+    cache = _cache()
+
+    if isinstance(cache, RedisCache):
+        # Leitura e gravação no próprio Redis, num passo só (e com o relógio dele)
+        chave = cache.make_and_validate_key(CHAVE_BALDE)
+        cliente = cache._cache.get_client(chave, write=True)
+        return bool(cliente.eval(_SCRIPT_BALDE, 1, chave, intervalo, capacidade))
+
+    with _trava_maquina():
+        agora = time.time()
+        tat = max(cache.get(CHAVE_BALDE) or agora, agora)
+        if tat - agora > capacidade - intervalo:
+            return False
+        cache.set(CHAVE_BALDE, tat + intervalo, timeout=int(capacidade) + 1)
+        return True
+
+
+def _ocupar_vaga(chave, limite):
+    if not limite:
+        return True
+    ttl = config('TTL_VAGA')
+    if _incrementar(chave, timeout=ttl) <= limite:
+        _cache().touch(chave, ttl)
+        return True
+    _liberar_vaga(chave, limite)
+    return False
+
+
+def _liberar_vaga(chave, limite):
+    if not limite:
+        return
+    cache = _cache()
+    with _atomico(cache):
+        try:
+            if cache.decr(chave) < 0:
+                cache.set(chave, 0, timeout=config('TTL_VAGA'))
+        except ValueError:
+            pass
+
+
+def _registrar_espera(segundos):
+    _incrementar('ia:metricas:esperas')
+    _incrementar('ia:metricas:espera_ms_total', int(segundos * 1000))
+    cache = _cache()
+    if segundos * 1000 > cache.get('ia:metricas:espera_ms_max', 0):
+        cache.set('ia:metricas:espera_ms_max', int(segundos * 1000), timeout=None)
+    if segundos >= 1:
+        logger.info("Chamada à IA esperou %.2fs na fila", segundos)
+
+
+def metricas():
+    """Resumo das métricas da fila (compartilhado entre processos se o cache for)."""
+    cache = _cache()
+    nomes = ['esperas', 'espera_ms_total', 'espera_ms_max', 'rejeicoes', 'retentativas', 'limites_429']
+    valores = {nome: cache.get(f'ia:metricas:{nome}', 0) for nome in nomes}
+    valores['espera_ms_media'] = (
+        valores['espera_ms_total'] / valores['esperas'] if valores['esperas'] else 0
+    )
+    valores['ativas'] = cache.get('ia:ativas:global', 0)
+    return valores
+
+
+# --- FILA ---
+@contextmanager
+def reservar(usuario_id=None):
+    """
+    Espera uma vaga (do usuário e global). Os tokens do balde são consumidos
+    por chamada, em `com_retentativas`. Levanta IAOcupada se não conseguir
+    dentro de ESPERA_MAXIMA.
+    """
+    max_usuario = config('MAX_POR_USUARIO') if usuario_id is not None else 0
+    max_global = config('MAX_SIMULTANEAS')
+    chave_usuario = f'ia:ativas:u:{usuario_id}'
+    chave_global = 'ia:ativas:global'
+
+    inicio = time.monotonic()
+    while True:
+        if _ocupar_vaga(chave_usuario, max_usuario):
+            if _ocupar_vaga(chave_global, max_global):
+                break
+            _liberar_vaga(chave_usuario, max_usuario)
+
+        if time.monotonic() - inicio >= config('ESPERA_MAXIMA'):
+            _incrementar('ia:metricas:rejeicoes')
+            raise IAOcupada("Muitas importações em andamento. Tente novamente em instantes.")
+        time.sleep(config('INTERVALO_FILA') * random.uniform(0.5, 1.5))
+
+    _registrar_espera(time.monotonic() - inicio)
+    try:
+        yield
+    finally:
+        _liberar_vaga(chave_global, max_global)
+        _liberar_vaga(chave_usuario, max_usuario)
+
+
+# --- RETENTATIVAS ---
+def eh_limite_de_taxa(erro):
+    return getattr(erro, 'code', None) == 429 or getattr(erro, 'status', None) == 'RESOURCE_EXHAUSTED'
+
+
+def _esperar_token():
+    """Espera um token do balde por até ESPERA_MAXIMA."""
+    inicio = time.monotonic()
+    while not _consumir_token():
+        if time.monotonic() - inicio >= config('ESPERA_MAXIMA'):
+            _incrementar('ia:metricas:rejeicoes')
+            raise IAOcupada("Limite de requisições da IA atingido. Tente novamente em instantes.")
+        time.sleep(config('INTERVALO_FILA') * random.uniform(0.5, 1.5))
+
+
+def com_retentativas(funcao):
+    """
+    Executa `funcao(cliente)` repetindo com backoff exponencial se o provedor
+    responder 429. Cada tentativa é uma chamada ao provedor e leva um token.
+    """
+    cliente = obter_cliente()
+    tentativas = config('TENTATIVAS')
+    for tentativa in range(tentativas):
+        _esperar_token()
+        try:
+            return funcao(cliente)
+        except Exception as erro:
+            if not eh_limite_de_taxa(erro):
+                raise
+            _incrementar('ia:metricas:limites_429')
+            if tentativa == tentativas - 1:
+                raise IAOcupada("Limite de requisições da IA atingido. Tente novamente em instantes.") from erro
+
+            espera = min(config('BACKOFF_MAXIMO'), config('BACKOFF_BASE') * 2 ** tentativa)
+            espera *= random.uniform(0.5, 1.0)  # Jitter para os workers não voltarem juntos
+            _incrementar('ia:metricas:retentativas')
+            logger.warning("IA respondeu 429, nova tentativa em %.2fs", espera)
+            time.sleep(espera)
+
+
+def executar(funcao, usuario_id=None):
+    """Atalho: reserva uma vaga e executa `funcao(cliente)` com retentativas."""
+    with reservar(usuario_id):
+        return com_retentativas(funcao)
+
+
+# --- CLIENTE FALSO ---
+class ErroLimiteFalso(Exception):
+    code = 429
+    status = 'RESOURCE_EXHAUSTED'
+
+
+class ClienteFalso:
+    """
+    Imita `genai.Client` sem acessar a rede.
+
+    `falhas` faz as N primeiras chamadas responderem 429; `taxa_429` sorteia
+    429 com essa probabilidade em cada chamada.
+    """
+
+    def __init__(self, falhas=0, taxa_429=0.0, latencia=0.0, resposta=None):
+        self.falhas = falhas
+        self.taxa_429 = taxa_429
+        self.latencia = latencia
+        self.resposta = resposta
+        self.chamadas = 0
+        self.files = SimpleNamespace(upload=self._upload)
+        self.models = SimpleNamespace(
+            generate_content=self._generate_content,
+            generate_content_stream=self._generate_content_stream,
+        )
+
+    def _simular(self):
+        self.chamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self.falhas > 0:
+            self.falhas -= 1
+            raise ErroLimiteFalso("429 RESOURCE_EXHAUSTED (simulado)")
+        if self.taxa_429 and random.random() < self.taxa_429:
+            raise ErroLimiteFalso("429 RESOURCE_EXHAUSTED (simulado)")
+
+    def _upload(self, file=None, config=None):
+        self._simular()
+        return SimpleNamespace(name='files/falso', uri='falso://arquivo', mime_type=getattr(config, 'mime_type', None))
+
+    def _generate_content(self, model=None, contents=None, config=None):
+        self._simular()
+        return SimpleNamespace(text=self._texto())
+
+    def _generate_content_stream(self, model=None, contents=None, config=None):
+        # Como no SDK real, nada acontece até o primeiro pedaço ser pedido
+        self._simular()
+        texto = self._texto()
+        for inicio in range(0, len(texto), 40):
+            yield SimpleNamespace(text=texto[inicio:inicio + 40])
+
+    def _texto(self):
+        texto = self.resposta
+        if texto is None:
+            texto = json.dumps([{
+                'data': date.today().isoformat(),
+                'descricao': 'Transação simulada',
+                'valor': 10.0,
+                'tipo': 'D',
+                'categoria': 'Importados',
+            }], ensure_ascii=False)
+        return texto
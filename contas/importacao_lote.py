@@ -0,0 +1,267 @@
+"""
+Importação em lote: vários extratos (PDFs, imagens ou arquivos .zip) de uma vez.
+
+1. Os uploads são gravados em um diretório temporário; arquivos .zip são
+   descompactados entrada por entrada, em blocos, com limites de quantidade,
+   tamanho e taxa de compressão (o tamanho declarado no .zip não é confiável).
+2. O pré-processamento das imagens (CPU) roda num pool de processos.
+3. As chamadas à IA rodam em threads, no máximo MAX_POR_USUARIO do
+   governador ao mesmo tempo (as demais esperariam a vaga do usuário).
+4. As transações de todos os arquivos viram uma única prévia, sem as
+   repetidas entre extratos sobrepostos e sem as que já existem na conta.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+from . import governador
+from .governador import IAOcupada
+from .utils import (
+    EXTENSOES_IMAGEM, MIME_TYPES, ArquivoNaoSuportado, _extrair_transacoes, precisa_converter, preprocessar_imagem,
+)
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PADRAO = {
+    'MAX_ARQUIVOS': 24,
+    'MAX_BYTES_ARQUIVO': 20 * 1024 * 1024,
+    'MAX_BYTES_TOTAL': 100 * 1024 * 1024,
+    'MAX_TAXA_COMPRESSAO': 100,     # Acima disso a entrada do .zip é recusada (zip bomb)
+    'PROCESSOS': 2,                 # Pool de pré-processamento (1 = no próprio processo)
+    'IA_SIMULTANEAS': 4,            # Teto de threads; o governador ainda limita por usuário
+}
+
+EXTENSOES_ACEITAS = set(MIME_TYPES) | EXTENSOES_IMAGEM
+TAMANHO_BLOCO = 64 * 1024
+
+
+class LoteInvalido(Exception):
+    """O lote enviado passa de algum dos limites."""
+
+
+def config(chave):
+    personalizada = getattr(settings, 'IMPORTACAO_LOTE', {})
+    return personalizada.get(chave, CONFIG_PADRAO[chave])
+
+
+# --- 1. ARQUIVOS ---
+class _Orcamento:
+    """Conta arquivos e bytes gravados para aplicar os limites do lote."""
+
+    def __init__(self):
+        self.arquivos = 0
+        self.bytes = 0
+
+    def novo_arquivo(self, nome):
+        self.arquivos += 1
+        if self.arquivos > config('MAX_ARQUIVOS'):
+            raise LoteInvalido(f"O lote pode ter no máximo {config('MAX_ARQUIVOS')} extratos.")
+
+    def copiar(self, blocos, destino, nome):
+        gravados = 0
+        for bloco in blocos:
+            gravados += len(bloco)
+            self.bytes += len(bloco)
+            if gravados > config('MAX_BYTES_ARQUIVO'):
+                raise LoteInvalido(f"{nome}: arquivo grande demais.")
+            if self.bytes > config('MAX_BYTES_TOTAL'):
+                raise LoteInvalido("O lote passou do tamanho máximo.")
+            destino.write(bloco)
+
+
+def expandir_uploads(arquivos, diretorio):
+    """Grava os uploads (e o conteúdo dos .zip) em `diretorio`. Retorna [(nome, caminho, ext)]."""
+    orcamento = _Orcamento()
+    entradas = []
+    for arquivo in arquivos:
+        ext = os.path.splitext(arquivo.name)[1].lower()
+        if ext == '.zip':
+            entradas.extend(_extrair_zip(arquivo, diretorio, orcamento))
+        elif ext in EXTENSOES_ACEITAS:
+            orcamento.novo_arquivo(arquivo.name)
+            caminho = _caminho_novo(diretorio, ext)
+            with open(caminho, 'wb') as destino:
+                orcamento.copiar(arquivo.chunks(), destino, arquivo.name)
+            entradas.append((arquivo.name, caminho, ext))
+    return entradas
+
+
+def _extrair_zip(arquivo, diretorio, orcamento):
+    try:
+        pacote = zipfile.ZipFile(arquivo)
+    except zipfile.BadZipFile:
+        raise LoteInvalido(f"{arquivo.name}: arquivo .zip inválido.")
+
+    with pacote:
+        for info in pacote.infolist():
+            nome = os.path.basename(info.filename)
+            ext = os.path.splitext(nome)[1].lower()
+            # Pastas, lixo do macOS e tipos não suportados (inclusive .zip dentro de .zip)
+            if info.is_dir() or not nome or nome.startswith('.') or '__MACOSX' in info.filename \
+                    or ext not in EXTENSOES_ACEITAS or info.flag_bits & 0x1:  # 0x1 = criptografada
+                continue
+            if info.file_size > info.compress_size * config('MAX_TAXA_COMPRESSAO') + TAMANHO_BLOCO:
+                raise LoteInvalido(f"{nome}: taxa de compressão suspeita.")
+
+            orcamento.novo_arquivo(nome)
+            caminho = _caminho_novo(diretorio, ext)
+            # Lê a entrada em blocos: o limite vale para o que sai de fato, não para o cabeçalho
+            with pacote.open(info) as origem, open(caminho, 'wb') as destino:
+                orcamento.copiar(iter(lambda: origem.read(TAMANHO_BLOCO), b''), destino, nome)
+            yield nome, caminho, ext
+
+
+def _caminho_novo(diretorio, ext):
+    descritor, caminho = tempfile.mkstemp(suffix=ext, dir=diretorio)
+    os.close(descritor)
+    return caminho
+
+
+# --- 2. PRÉ-PROCESSAMENTO (pool de processos) ---
+def _preparar_imagem(caminho, dpi, qualidade):
+    """Roda num processo do pool: grava a versão reduzida ao lado e devolve (caminho, ext)."""
+    with open(caminho, 'rb') as arquivo:
+        processada = preprocessar_imagem(arquivo, dpi=dpi, qualidade=qualidade)
+    ext = os.path.splitext(caminho)[1]
+    # BMP/TIFF viram JPEG mesmo sem reduzir: a IA não os aceita
+    if processada is None or (len(processada) >= os.path.getsize(caminho) and not precisa_converter(ext)):
+        return caminho, ext
+
+    reduzida = os.path.splitext(caminho)[0] + '-reduzida.jpg'
+    with open(reduzida, 'wb') as destino:
+        destino.write(processada)
+    return reduzida, '.jpg'
+
+
+def preprocessar(entradas):
+    """Substitui as imagens pela versão reduzida; PDFs seguem como estão."""
+    indices = [i for i, (_, _, ext) in enumerate(entradas) if ext in EXTENSOES_IMAGEM]
+    if not indices:
+        return entradas
+
+    # Os processos recebem dpi/qualidade prontos: não precisam carregar o Django
+    dpi = getattr(settings, 'IA_IMAGEM_DPI', 200)
+    qualidade = getattr(settings, 'IA_IMAGEM_QUALIDADE', 85)
+    caminhos = [entradas[i][1] for i in indices]
+
+    processos = min(config('PROCESSOS'), len(indices))
+    if processos > 1:
+        # "spawn": o processo web tem threads, e fork com threads pode travar
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as pool:
+            preparados = list(pool.map(_preparar_imagem, caminhos, [dpi] * len(caminhos),
+                                       [qualidade] * len(caminhos)))
+    else:
+        preparados = [_preparar_imagem(caminho, dpi, qualidade) for caminho in caminhos]
+
+    entradas = list(entradas)
+    for i, (caminho, ext) in zip(indices, preparados):
+        entradas[i] = (entradas[i][0], caminho, ext)
+    return entradas
+
+
+# --- 3. IA (threads, sob o governador) ---
+def _extrair_arquivo(caminho, ext, nomes_categorias, usuario_id):
+    with governador.reservar(usuario_id):
+        return list(_extrair_transacoes(caminho, ext, nomes_categorias))
+
+
+def extrair_lote(entradas, nomes_categorias, usuario_id):
+    """Chama a IA para cada arquivo. Retorna ({índice: [transações]}, {nome: erro})."""
+    simultaneas = max(1, min(config('IA_SIMULTANEAS'), governador.config('MAX_POR_USUARIO') or len(entradas)))
+    resultados, falhas = {}, {}
+
+    with ThreadPoolExecutor(max_workers=simultaneas) as pool:
+        futuros = {
+            pool.submit(_extrair_arquivo, caminho, ext, nomes_categorias, usuario_id): (indice, nome)
+            for indice, (nome, caminho, ext) in enumerate(entradas)
+        }
+        for futuro, (indice, nome) in futuros.items():
+            try:
+                resultados[indice] = futuro.result()
+            except (IAOcupada, ArquivoNaoSuportado) as e:
+                falhas[nome] = str(e)
+            except Exception as e:
+                logger.exception("Erro na geração da IA (%s): %s", nome, e)
+                falhas[nome] = "A IA não conseguiu ler o arquivo."
+    return resultados, falhas
+
+
+# --- 4. PRÉVIA ÚNICA ---
+def _chave(item):
+    try:
+        valor = Decimal(str(item.get('valor'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        valor = item.get('valor')
+    descricao = ' '.join(str(item.get('descricao') or '').lower().split())
+    return str(item.get('data')), valor, descricao
+
+
+def mesclar(resultados, conta):
+    """
+    Junta as transações de todos os arquivos em ordem de data, sem repetições
+    (extratos sobrepostos) e sem as que já estão na conta.
+
+    A comparação é por quantidade: duas compras iguais no mesmo extrato (mesmo
+    dia, valor e descrição) continuam sendo duas. Entre arquivos vale a maior
+    quantidade vista num extrato só, descontadas as que a conta já tem.
+    """
+    from .models import Transacao
+
+    itens = [item for indice in sorted(resultados) for item in resultados[indice]]
+    for item in itens:
+        if isinstance(item.get('data'), date):
+            item['data'] = item['data'].strftime('%Y-%m-%d')
+
+    datas = sorted(str(item['data']) for item in itens if item.get('data'))
+    existentes = Counter()
+    if datas:
+        # Uma consulta só, limitada ao período do lote
+        try:
+            inicio = date.fromisoformat(datas[0]) - timedelta(days=1)
+            fim = date.fromisoformat(datas[-1]) + timedelta(days=1)
+            existentes = Counter(
+                _chave({'data': data.isoformat(), 'valor': valor, 'descricao': descricao})
+                for data, valor, descricao in Transacao.objects.filter(
+                    conta=conta, data__range=(inicio, fim)
+                ).values_list('data', 'valor', 'descricao')
+            )
+        except ValueError:
+            pass
+
+    quantidades = Counter()
+    for indice in resultados:
+        for chave, quantidade in Counter(_chave(item) for item in resultados[indice]).items():
+            quantidades[chave] = max(quantidades[chave], quantidade)
+    faltam = quantidades - existentes  # Counter: só ficam as positivas
+
+    unicos = []
+    for item in sorted(itens, key=lambda i: str(i.get('data'))):
+        chave = _chave(item)
+        if faltam[chave] > 0:
+            faltam[chave] -= 1
+            unicos.append(item)
+    return unicos
+
+
+def processar_lote(arquivos, conta, nomes_categorias, usuario_id):
+    """Fluxo completo. Retorna (prévia, falhas por arquivo)."""
+    if governador.obter_cliente() is None:
+        logger.error("Chave API não encontrada.")
+        return [], {}
+
+    with tempfile.TemporaryDirectory(prefix='importacao-lote-') as diretorio:
+        entradas = expandir_uploads(arquivos, diretorio)
+        if not entradas:
+            raise LoteInvalido("Nenhum extrato (PDF ou imagem) encontrado no envio.")
+        entradas = preprocessar(entradas)
+        resultados, falhas = extrair_lote(entradas, nomes_categorias, usuario_id)
+    return mesclar(resultados, conta), falhas
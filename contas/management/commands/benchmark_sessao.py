@@ -0,0 +1,82 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment,
+)
+
+from contas.models import Categoria, Conta, Transacao
+
+ESTRATEGIAS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+ENDPOINTS = {
+    'listagem_transacoes': '/',
+    'transacoes_api': '/api/transacoes/',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara as estratégias de sessão: consultas ao banco (total e de sessão) e tempo "
+        "por requisição em listagem_transacoes e transacoes_api. Roda num banco de teste."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=50, help="Requisições medidas por endpoint")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        config_antiga = setup_databases(verbosity=0, interactive=False)
+        try:
+            # Cache local e isolado para cada alias (default, fragmentos...): não mistura
+            # com o cache da aplicação e os templates continuam achando os seus
+            caches_locais = {
+                alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'benchmark-{alias}'}
+                for alias in settings.CACHES
+            }
+            with override_settings(CACHES=caches_locais):
+                self._medir(options['requisicoes'])
+        finally:
+            teardown_databases(config_antiga, verbosity=0)
+            teardown_test_environment()
+
+    def _medir(self, requisicoes):
+        usuario = User.objects.create_user('benchmark', password='benchmark-123')
+        conta = Conta.objects.create(usuario=usuario, nome='Conta')
+        categoria = Categoria.objects.create(usuario=usuario, nome='Categoria')
+        for dia in range(1, 21):
+            Transacao.objects.create(conta=conta, categoria=categoria, data=f'2025-01-{dia:02d}',
+                                     valor=dia, descricao=f'Item {dia}')
+
+        self.stdout.write(f"{'estratégia':<11} {'endpoint':<20} {'consultas/req':>13} "
+                          f"{'sessão/req':>10} {'ms/req':>8}")
+        for nome, engine in ESTRATEGIAS.items():
+            with override_settings(SESSION_ENGINE=engine,
+                                   MESSAGE_STORAGE='django.contrib.messages.storage.cookie.CookieStorage'):
+                cliente = Client()
+                cliente.force_login(usuario)
+
+                for endpoint, caminho in ENDPOINTS.items():
+                    cliente.get(caminho, secure=True)  # Aquece caches (sessão e referências)
+
+                    inicio = time.perf_counter()
+                    with CaptureQueriesContext(connection) as consultas:
+                        for _ in range(requisicoes):
+                            resposta = cliente.get(caminho, secure=True)
+                            assert resposta.status_code == 200, resposta.status_code
+                    decorrido = time.perf_counter() - inicio
+
+                    de_sessao = sum('django_session' in q['sql'] for q in consultas.captured_queries)
+                    self.stdout.write(
+                        f"{nome:<11} {endpoint:<20} {len(consultas) / requisicoes:>13.1f} "
+                        f"{de_sessao / requisicoes:>10.1f} {decorrido / requisicoes * 1000:>8.2f}"
+                    )
@@ -0,0 +1,177 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from contas.sqlite import aplicar_pragmas
+
+# Cópia enxuta de contas_transacao, com o índice usado pelo painel
+ESQUEMA = """
+CREATE TABLE transacao (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    usuario_id INTEGER NOT NULL,
+    conta_id INTEGER NOT NULL,
+    categoria_id INTEGER,
+    data DATE NOT NULL,
+    descricao VARCHAR(200),
+    valor DECIMAL NOT NULL,
+    tipo VARCHAR(1) NOT NULL,
+    hash_id VARCHAR(32) UNIQUE
+);
+CREATE INDEX transacao_usuario_data_idx ON transacao (usuario_id, data);
+"""
+
+# Mesmo formato das consultas de transacoes_api: totais por tipo, por categoria e a lista do mês
+LEITURAS = [
+    "SELECT tipo, SUM(valor) FROM transacao WHERE usuario_id = ? AND data BETWEEN ? AND ? GROUP BY tipo",
+    "SELECT categoria_id, SUM(valor) FROM transacao WHERE usuario_id = ? AND data BETWEEN ? AND ? "
+    "AND tipo = 'D' GROUP BY categoria_id ORDER BY 2 DESC",
+    "SELECT id, data, descricao, valor, tipo, categoria_id, conta_id FROM transacao "
+    "WHERE usuario_id = ? AND data BETWEEN ? AND ? ORDER BY data DESC",
+]
+
+INICIO = date(2024, 1, 1)
+DIAS = 730
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o SQLite padrão com o ajustado (settings.SQLITE_PRAGMAS): leitores do painel "
+        "rodando junto com escritores em lote (importações). Usa um banco temporário."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=100000, help="Transações no banco inicial")
+        parser.add_argument('--usuarios', type=int, default=50)
+        parser.add_argument('--leitores', type=int, default=4, help="Threads lendo")
+        parser.add_argument('--escritores', type=int, default=2, help="Threads gravando")
+        parser.add_argument('--lote', type=int, default=200, help="Linhas por transação de escrita")
+        parser.add_argument('--duracao', type=float, default=5.0, help="Segundos por cenário")
+
+    def handle(self, *args, **options):
+        self.options = options
+        pragmas = getattr(settings, 'SQLITE_PRAGMAS', None) or {}
+        cenarios = [
+            ('padrão', {}),
+            ('otimizado', pragmas),
+        ]
+        if not pragmas:
+            self.stdout.write(self.style.WARNING("SQLITE_PRAGMAS vazio: os dois cenários serão iguais."))
+
+        self.stdout.write(f"{'cenário':<10} {'leituras/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'máx ms':>8} "
+                          f"{'linhas gravadas/s':>18} {'locked':>7}")
+        with tempfile.TemporaryDirectory(prefix='benchmark-sqlite-') as diretorio:
+            for nome, pragmas_cenario in cenarios:
+                caminho = os.path.join(diretorio, f'{nome}.sqlite3')
+                self._preparar(caminho, pragmas_cenario)
+                resultado = self._rodar(caminho, pragmas_cenario)
+                self._imprimir(nome, resultado)
+
+    # --- BANCO INICIAL ---
+    def _conectar(self, caminho, pragmas):
+        # timeout=5 é o padrão do módulo sqlite3 e o que o Django usa sem OPTIONS
+        conexao = sqlite3.connect(caminho, timeout=5, isolation_level=None, check_same_thread=False)
+        aplicar_pragmas(conexao.cursor(), pragmas)
+        return conexao
+
+    def _linhas(self, quantidade, semente):
+        aleatorio = random.Random(semente)
+        for _ in range(quantidade):
+            yield (
+                aleatorio.randint(1, self.options['usuarios']),
+                1,
+                aleatorio.randint(1, 10),
+                (INICIO + timedelta(days=aleatorio.randrange(DIAS))).isoformat(),
+                f"Compra {aleatorio.random():.10f}",
+                round(aleatorio.uniform(1, 500), 2),
+                aleatorio.choice('DDDR'),
+            )
+
+    def _inserir(self, conexao, linhas):
+        conexao.execute('BEGIN IMMEDIATE')
+        conexao.executemany(
+            "INSERT INTO transacao (usuario_id, conta_id, categoria_id, data, descricao, valor, tipo) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", linhas,
+        )
+        conexao.execute('COMMIT')
+
+    def _preparar(self, caminho, pragmas):
+        conexao = self._conectar(caminho, pragmas)
+        conexao.executescript(ESQUEMA)
+        self._inserir(conexao, self._linhas(self.options['linhas'], semente=1))
+        conexao.execute('ANALYZE')
+        conexao.close()
+
+    # --- CARGA CONCORRENTE ---
+    def _rodar(self, caminho, pragmas):
+        fim = time.monotonic() + self.options['duracao']
+        latencias, gravadas, erros = [], [0], [0]
+        trava = threading.Lock()
+
+        def leitor(semente):
+            aleatorio = random.Random(semente)
+            conexao = self._conectar(caminho, pragmas)
+            minhas = []
+            while time.monotonic() < fim:
+                inicio_mes = INICIO + timedelta(days=aleatorio.randrange(0, DIAS - 31))
+                parametros = (aleatorio.randint(1, self.options['usuarios']),
+                              inicio_mes.isoformat(), (inicio_mes + timedelta(days=30)).isoformat())
+                inicio = time.perf_counter()
+                try:
+                    for sql in LEITURAS:
+                        conexao.execute(sql, parametros).fetchall()
+                except sqlite3.OperationalError:
+                    with trava:
+                        erros[0] += 1
+                    continue
+                minhas.append(time.perf_counter() - inicio)
+            conexao.close()
+            with trava:
+                latencias.extend(minhas)
+
+        def escritor(semente):
+            conexao = self._conectar(caminho, pragmas)
+            lote = 0
+            while time.monotonic() < fim:
+                lote += 1
+                try:
+                    self._inserir(conexao, list(self._linhas(self.options['lote'], semente * 100000 + lote)))
+                except sqlite3.OperationalError:
+                    if conexao.in_transaction:
+                        conexao.execute('ROLLBACK')
+                    with trava:
+                        erros[0] += 1
+                    continue
+                with trava:
+                    gravadas[0] += self.options['lote']
+            conexao.close()
+
+        threads = [threading.Thread(target=leitor, args=(i,)) for i in range(self.options['leitores'])]
+        threads += [threading.Thread(target=escritor, args=(i + 1,)) for i in range(self.options['escritores'])]
+        inicio = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencias, gravadas[0], erros[0], time.monotonic() - inicio
+
+    def _imprimir(self, nome, resultado):
+        latencias, gravadas, erros, decorrido = resultado
+        if latencias:
+            ordenadas = sorted(latencias)
+            p50 = statistics.median(ordenadas) * 1000
+            p95 = ordenadas[int(len(ordenadas) * 0.95) - 1] * 1000
+            maximo = ordenadas[-1] * 1000
+        else:
+            p50 = p95 = maximo = 0
+        self.stdout.write(
+            f"{nome:<10} {len(latencias) / decorrido:>10.1f} {p50:>8.2f} {p95:>8.2f} {maximo:>8.1f} "
+            f"{gravadas / decorrido:>18.0f} {erros:>7}"
+        )
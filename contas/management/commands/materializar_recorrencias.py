@@ -0,0 +1,28 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from contas.recorrencias import TAMANHO_LOTE, materializar
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria as transações das recorrências vencidas de todos os usuários. Idempotente: "
+        "pode rodar várias vezes ao dia (cron) sem duplicar lançamentos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ate', type=date.fromisoformat, help="Data de referência (AAAA-MM-DD), padrão hoje")
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help="Regras por lote")
+        parser.add_argument('--tempo-maximo', type=float, help="Para depois de N segundos (o resto fica para a próxima)")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        regras, transacoes, lotes = materializar(
+            ate=options['ate'], tamanho_lote=options['lote'], tempo_maximo=options['tempo_maximo'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {transacoes} transações criadas a partir de {regras} recorrências "
+            f"({lotes} lotes) em {time.perf_counter() - inicio:.2f}s"
+        ))
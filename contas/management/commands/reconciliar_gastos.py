@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from contas.orcamentos import reconciliar
+
+
+class Command(BaseCommand):
+    help = (
+        "Confere os contadores de gasto por categoria/mês (GastoCategoria) contra as transações. "
+        "Com --corrigir, regrava os que estiverem diferentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', type=int, help="Só as categorias deste usuário (id)")
+        parser.add_argument('--corrigir', action='store_true', help="Regrava os contadores divergentes")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        divergencias = reconciliar(usuario_id=options['usuario'], corrigir=options['corrigir'])
+
+        for categoria_id, mes, contador, real in divergencias[:50]:
+            self.stdout.write(
+                f"categoria {categoria_id} {mes:%m/%Y}: contador R$ {contador[0]} ({contador[1]}) "
+                f"x transações R$ {real[0]} ({real[1]})"
+            )
+        if len(divergencias) > 50:
+            self.stdout.write(f"... e mais {len(divergencias) - 50}")
+
+        decorrido = time.perf_counter() - inicio
+        if not divergencias:
+            self.stdout.write(self.style.SUCCESS(f"✅ Contadores em dia ({decorrido:.2f}s)"))
+        elif options['corrigir']:
+            self.stdout.write(self.style.SUCCESS(f"🔧 {len(divergencias)} contadores corrigidos ({decorrido:.2f}s)"))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {len(divergencias)} contadores divergentes ({decorrido:.2f}s). Rode com --corrigir."
+            ))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from contas.sqlite import manutencao
+
+
+class Command(BaseCommand):
+    help = (
+        "Roda PRAGMA optimize e um checkpoint do WAL no SQLite. Com --intervalo, repete "
+        "a cada N segundos (para rodar como processo auxiliar ou num cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=int, default=0, help="Segundos entre execuções (0 = uma vez)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"Banco atual é {connection.vendor}: nada a fazer.")
+
+        while True:
+            inicio = time.perf_counter()
+            with connection.cursor() as cursor:
+                paginas_wal, copiadas = manutencao(cursor)
+            self.stdout.write(
+                f"🧹 optimize + checkpoint: {copiadas}/{paginas_wal} páginas do WAL copiadas "
+                f"em {(time.perf_counter() - inicio) * 1000:.1f} ms"
+            )
+            if not options['intervalo']:
+                break
+            connection.close()  # Não segura a conexão entre uma rodada e outra
+            time.sleep(options['intervalo'])
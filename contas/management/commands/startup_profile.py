@@ -0,0 +1,82 @@
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Linha do -X importtime: "import time:   self |   cumulativo | <recuo>pacote"
+LINHA_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)')
+
+# O que um worker faz ao subir: configura o Django, carrega a aplicação WSGI e as URLs
+CODIGO_BOOT = (
+    "import os, importlib, django;"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings!r});"
+    "django.setup();"
+    "importlib.import_module({alvo!r});"
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+
+class Command(BaseCommand):
+    help = "Mede o custo de import na subida de um worker (python -X importtime) e acusa regressões."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alvo', default='financeiro.wsgi', help="Módulo carregado após o django.setup()")
+        parser.add_argument('--top', type=int, default=15, help="Quantos itens mostrar em cada ranking")
+        parser.add_argument('--limite-ms', type=float, help="Falha se o tempo total de import passar disso")
+        parser.add_argument(
+            '--proibidos', default='google.genai,PIL',
+            help="Módulos (separados por vírgula) que não podem ser carregados na subida",
+        )
+
+    def handle(self, *args, **options):
+        codigo = CODIGO_BOOT.format(settings=os.environ.get('DJANGO_SETTINGS_MODULE', 'financeiro.settings'),
+                                    alvo=options['alvo'])
+        processo = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', codigo],
+            capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        if processo.returncode != 0:
+            raise CommandError(f"A inicialização falhou:\n{processo.stderr[-2000:]}")
+
+        modulos = []  # (modulo, self_us, cumulativo_us, profundidade)
+        for linha in processo.stderr.splitlines():
+            encontrado = LINHA_IMPORTTIME.match(linha)
+            if encontrado:
+                proprio, cumulativo, recuo, modulo = encontrado.groups()
+                modulos.append((modulo, int(proprio), int(cumulativo), (len(recuo) - 1) // 2))
+
+        total_us = sum(cumulativo for _, _, cumulativo, profundidade in modulos if profundidade == 0)
+
+        por_pacote = defaultdict(int)
+        for modulo, proprio, _, _ in modulos:
+            por_pacote[modulo.split('.')[0]] += proprio
+
+        top = options['top']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Subida de '{options['alvo']}': {len(modulos)} módulos, {total_us / 1000:.1f} ms em imports"
+        ))
+
+        self.stdout.write("\nPor pacote (tempo próprio somado):")
+        for pacote, proprio in sorted(por_pacote.items(), key=lambda p: -p[1])[:top]:
+            self.stdout.write(f"  {proprio / 1000:8.1f} ms  {pacote}")
+
+        self.stdout.write("\nMódulos mais caros (cumulativo):")
+        for modulo, _, cumulativo, _ in sorted(modulos, key=lambda m: -m[2])[:top]:
+            self.stdout.write(f"  {cumulativo / 1000:8.1f} ms  {modulo}")
+
+        erros = []
+        carregados = {modulo for modulo, _, _, _ in modulos}
+        for proibido in filter(None, (p.strip() for p in options['proibidos'].split(','))):
+            if any(m == proibido or m.startswith(proibido + '.') for m in carregados):
+                erros.append(f"'{proibido}' foi importado na subida (deveria ser carregado sob demanda)")
+
+        if options['limite_ms'] is not None and total_us / 1000 > options['limite_ms']:
+            erros.append(f"Imports levaram {total_us / 1000:.1f} ms (limite: {options['limite_ms']:.1f} ms)")
+
+        if erros:
+            raise CommandError("\n".join(erros))
+        self.stdout.write(self.style.SUCCESS("\n✅ Nenhuma regressão encontrada."))
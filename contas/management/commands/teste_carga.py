@@ -0,0 +1,352 @@
+import http.cookiejar
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from contas.models import Categoria, Conta
+
+PREFIXO_USUARIO = 'carga_'
+
+# Mistura de tráfego: (ação, peso)
+MISTURA = [
+    ('api', 60),
+    ('criar', 15),
+    ('editar', 10),
+    ('excluir', 5),
+    ('importar', 10),
+]
+
+# Como subir o servidor em cada modo (a partir da raiz do projeto)
+MODOS = {
+    'sync': ['gunicorn', 'financeiro.wsgi', '-c', 'gunicorn.conf.py', '-k', 'sync'],
+    'gthread': ['gunicorn', 'financeiro.wsgi', '-c', 'gunicorn.conf.py', '-k', 'gthread'],
+    'asgi': ['gunicorn', 'financeiro.asgi', '-c', 'gunicorn.conf.py', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+class SemRedirecionamento(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # O 302 é a resposta esperada dos formulários; não seguimos
+
+
+class UsuarioSintetico:
+    """Um navegador simplificado: cookies de sessão/CSRF e as transações que já viu."""
+
+    def __init__(self, base_url, username, senha, conta_id, categoria_id):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.senha = senha
+        self.conta_id = conta_id
+        self.categoria_id = categoria_id
+        self.ids_transacoes = []
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), SemRedirecionamento
+        )
+
+    def _csrf(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def requisicao(self, caminho, dados=None, arquivo=None):
+        url = self.base_url + caminho
+        cabecalhos = {'Referer': url}
+        corpo = None
+
+        if arquivo is not None:
+            fronteira = uuid.uuid4().hex
+            corpo = _multipart(fronteira, {**dados, 'csrfmiddlewaretoken': self._csrf()}, arquivo)
+            cabecalhos['Content-Type'] = f'multipart/form-data; boundary={fronteira}'
+        elif dados is not None:
+            corpo = urllib.parse.urlencode({**dados, 'csrfmiddlewaretoken': self._csrf()}, doseq=True).encode()
+            cabecalhos['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        pedido = urllib.request.Request(url, data=corpo, headers=cabecalhos)
+        try:
+            with self.opener.open(pedido, timeout=60) as resposta:
+                return resposta.status, resposta.read()
+        except urllib.error.HTTPError as erro:
+            return erro.code, erro.read()
+
+    def login(self):
+        self.requisicao('/accounts/login/')
+        status, _ = self.requisicao('/accounts/login/', {'username': self.username, 'password': self.senha})
+        if status != 302:
+            raise CommandError(f"Login de {self.username} falhou (HTTP {status})")
+
+    # --- AÇÕES ---
+    def api(self):
+        hoje = date.today()
+        params = urllib.parse.urlencode({
+            'ano': random.choice([hoje.year - 1, hoje.year]),
+            'mes': random.randint(1, 12),
+            'ano_inteiro': random.choice(['false', 'false', 'true']),
+        })
+        status, corpo = self.requisicao(f'/api/transacoes/?{params}')
+        if status == 200:
+            ids = [t['id'] for t in json.loads(corpo)['transacoes']]
+            if ids:
+                self.ids_transacoes = ids
+        return status
+
+    def _dados_transacao(self):
+        return {
+            'data': date.today().replace(day=random.randint(1, 28)).isoformat(),
+            'descricao': f'Carga {uuid.uuid4().hex[:12]}',
+            'valor': f'{random.uniform(1, 500):.2f}',
+            'tipo': random.choice(['D', 'D', 'R']),
+            'conta': self.conta_id,
+            'categoria': self.categoria_id,
+        }
+
+    def criar(self):
+        return self.requisicao('/nova-transacao/', self._dados_transacao())[0]
+
+    def editar(self):
+        if not self.ids_transacoes:
+            return self.criar()
+        pk = random.choice(self.ids_transacoes)
+        return self.requisicao(f'/update/{pk}/', self._dados_transacao())[0]
+
+    def excluir(self):
+        if not self.ids_transacoes:
+            return self.criar()
+        pk = self.ids_transacoes.pop(random.randrange(len(self.ids_transacoes)))
+        return self.requisicao(f'/delete/{pk}/')[0]
+
+    def importar(self):
+        # Upload (a IA é o ClienteFalso do servidor) seguido da confirmação da prévia
+        status, _ = self.requisicao(
+            '/importar/', {'conta': self.conta_id},
+            arquivo=('arquivo', 'extrato.pdf', 'application/pdf', b'%PDF-1.4 carga'),
+        )
+        if status != 200:
+            return status
+        linha = self._dados_transacao()
+        return self.requisicao('/importar/', {
+            'confirmar_dados': '1',
+            'data': linha['data'], 'descricao': linha['descricao'], 'valor': linha['valor'],
+            'tipo': linha['tipo'], 'categoria': self.categoria_id,
+        })[0]
+
+
+def _multipart(fronteira, campos, arquivo):
+    partes = []
+    for nome, valor in campos.items():
+        partes.append(
+            f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'.encode()
+        )
+    campo, nome_arquivo, tipo, conteudo = arquivo
+    partes.append(
+        f'--{fronteira}\r\nContent-Disposition: form-data; name="{campo}"; filename="{nome_arquivo}"\r\n'
+        f'Content-Type: {tipo}\r\n\r\n'.encode() + conteudo + b'\r\n'
+    )
+    partes.append(f'--{fronteira}--\r\n'.encode())
+    return b''.join(partes)
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    indice = max(0, min(len(valores_ordenados) - 1, round(p / 100 * len(valores_ordenados)) - 1))
+    return valores_ordenados[indice]
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga ponta a ponta: N usuários sintéticos fazendo tráfego misto "
+        "(API do painel, criar/editar/excluir, importação com IA simulada). "
+        "Mede vazão, p50/p95/p99 e taxa de erro por endpoint e compara modos do gunicorn."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Servidor já em execução (com GEMINI_CLIENTE_FALSO=True e DEBUG=True)")
+        parser.add_argument('--modos', default='sync',
+                            help=f"Sobe um servidor por modo e compara ({', '.join(MODOS)}; asgi precisa do "
+                                 "uvicorn, fora do requirements). Ignorado com --url")
+        parser.add_argument('--usuarios', type=int, default=10)
+        parser.add_argument('--duracao', type=float, default=30, help="Segundos de carga por modo")
+        parser.add_argument('--workers', type=int, default=2, help="Workers do gunicorn nos servidores iniciados aqui")
+        parser.add_argument('--porta', type=int, default=8765)
+        parser.add_argument('--latencia-ia', type=float, default=0.5, help="Latência simulada da IA (s)")
+        parser.add_argument('--rpm-ia', type=int, default=0,
+                            help="Limite de requisições/min do governador da IA (0 = sem limite)")
+        parser.add_argument('--senha', default='carga-senha-123')
+        parser.add_argument('--limpar', action='store_true',
+                            help="Remove no final os usuários sintéticos criados nesta execução")
+
+    def handle(self, *args, **options):
+        credenciais, criados = self._preparar_usuarios(options['usuarios'], options['senha'])
+        resultados = {}
+        try:
+            if options['url']:
+                resultados['servidor'] = self._rodar(options['url'], credenciais, options)
+            else:
+                for modo in filter(None, (m.strip() for m in options['modos'].split(','))):
+                    if modo not in MODOS:
+                        raise CommandError(f"Modo desconhecido: {modo}")
+                    with self._servidor(modo, options) as base_url:
+                        resultados[modo] = self._rodar(base_url, credenciais, options)
+        finally:
+            if options['limpar']:
+                # Só os desta execução: usuários carga_* que já existiam (de outra rodada ou reais) ficam
+                User.objects.filter(id__in=criados).delete()
+
+        if len(resultados) > 1:
+            self._comparar(resultados)
+
+    # --- PREPARAÇÃO ---
+    def _preparar_usuarios(self, quantidade, senha):
+        """Retorna ([(username, conta_id, categoria_id)], ids dos usuários criados agora)."""
+        credenciais, criados = [], []
+        for i in range(quantidade):
+            usuario, criado = User.objects.get_or_create(username=f'{PREFIXO_USUARIO}{i}')
+            if criado:
+                criados.append(usuario.id)
+            if criado or not usuario.check_password(senha):
+                usuario.set_password(senha)
+                usuario.save()
+            conta, _ = Conta.objects.get_or_create(usuario=usuario, nome='Conta Carga')
+            categoria, _ = Categoria.objects.get_or_create(usuario=usuario, nome='Categoria Carga')
+            credenciais.append((usuario.username, conta.id, categoria.id))
+        return credenciais, criados
+
+    def _servidor(self, modo, options):
+        comando = self
+
+        class Servidor:
+            def __enter__(self_):
+                comando_servidor = MODOS[modo]
+                if importlib.util.find_spec('gunicorn') is None:
+                    raise CommandError("gunicorn não está instalado.")
+                if modo == 'asgi' and importlib.util.find_spec('uvicorn') is None:
+                    raise CommandError("O modo asgi precisa do uvicorn (pip install uvicorn).")
+
+                env = {
+                    **os.environ,
+                    'DEBUG': 'True',  # Sem redirecionamento para HTTPS
+                    'GEMINI_CLIENTE_FALSO': 'True',
+                    'GEMINI_FALSO_LATENCIA': str(options['latencia_ia']),
+                    'GEMINI_MAX_SIMULTANEAS': str(options['usuarios']),
+                    'GEMINI_RPM': str(options['rpm_ia']),
+                    'WEB_CONCURRENCY': str(options['workers']),
+                }
+                base_url = f"http://127.0.0.1:{options['porta']}"
+                comando.stdout.write(f"\n▶ Subindo servidor '{modo}' em {base_url}...")
+                self_.processo = subprocess.Popen(
+                    [sys.executable, '-m'] + comando_servidor + ['--bind', f"127.0.0.1:{options['porta']}",
+                                                                 '--access-logfile', '/dev/null'],
+                    cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                )
+                limite = time.monotonic() + 30
+                while time.monotonic() < limite:
+                    try:
+                        urllib.request.urlopen(base_url + '/accounts/login/', timeout=1).close()
+                        return base_url
+                    except (urllib.error.URLError, ConnectionError):
+                        if self_.processo.poll() is not None:
+                            raise CommandError(f"O servidor '{modo}' não subiu:\n{self_.processo.stderr.read().decode()[-2000:]}")
+                        time.sleep(0.3)
+                self_.__exit__()
+                raise CommandError(f"O servidor '{modo}' não respondeu em 30s")
+
+            def __exit__(self_, *exc):
+                self_.processo.terminate()
+                try:
+                    self_.processo.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    self_.processo.kill()
+
+        return Servidor()
+
+    # --- EXECUÇÃO ---
+    def _rodar(self, base_url, credenciais, options):
+        latencias = defaultdict(list)
+        erros = defaultdict(int)
+        trava = threading.Lock()
+
+        usuarios = [UsuarioSintetico(base_url, nome, options['senha'], conta_id, categoria_id)
+                    for nome, conta_id, categoria_id in credenciais]
+        for usuario in usuarios:
+            usuario.login()
+
+        acoes = [acao for acao, _ in MISTURA]
+        pesos = [peso for _, peso in MISTURA]
+        fim = time.monotonic() + options['duracao']
+
+        def trabalhar(usuario):
+            while time.monotonic() < fim:
+                acao = random.choices(acoes, pesos)[0]
+                inicio = time.perf_counter()
+                try:
+                    status = getattr(usuario, acao)()
+                except Exception:
+                    status = 0
+                decorrido = time.perf_counter() - inicio
+                with trava:
+                    latencias[acao].append(decorrido)
+                    if not (200 <= status < 400):
+                        erros[acao] += 1
+
+        inicio = time.monotonic()
+        threads = [threading.Thread(target=trabalhar, args=(u,)) for u in usuarios]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.monotonic() - inicio
+
+        return self._relatorio(latencias, erros, duracao)
+
+    def _relatorio(self, latencias, erros, duracao):
+        self.stdout.write(f"\n{'endpoint':<10} {'reqs':>6} {'req/s':>7} {'erros':>7} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        resumo = {'reqs': 0, 'erros': 0, 'todas': []}
+        for acao, _ in MISTURA:
+            valores = sorted(latencias.get(acao, []))
+            if not valores:
+                continue
+            resumo['reqs'] += len(valores)
+            resumo['erros'] += erros[acao]
+            resumo['todas'].extend(valores)
+            self.stdout.write(
+                f"{acao:<10} {len(valores):>6} {len(valores) / duracao:>7.1f} "
+                f"{erros[acao] / len(valores):>7.1%} "
+                f"{percentil(valores, 50) * 1000:>8.0f} {percentil(valores, 95) * 1000:>8.0f} "
+                f"{percentil(valores, 99) * 1000:>8.0f}"
+            )
+
+        todas = sorted(resumo['todas'])
+        resumo.update(
+            vazao=resumo['reqs'] / duracao,
+            taxa_erro=resumo['erros'] / resumo['reqs'] if resumo['reqs'] else 0,
+            p50=percentil(todas, 50), p95=percentil(todas, 95), p99=percentil(todas, 99),
+        )
+        self.stdout.write(
+            f"{'TOTAL':<10} {resumo['reqs']:>6} {resumo['vazao']:>7.1f} {resumo['taxa_erro']:>7.1%} "
+            f"{resumo['p50'] * 1000:>8.0f} {resumo['p95'] * 1000:>8.0f} {resumo['p99'] * 1000:>8.0f}"
+        )
+        return resumo
+
+    def _comparar(self, resultados):
+        self.stdout.write(self.style.MIGRATE_HEADING("\nComparação entre modos"))
+        self.stdout.write(f"{'modo':<10} {'req/s':>7} {'erros':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for modo, r in sorted(resultados.items(), key=lambda item: -item[1]['vazao']):
+            self.stdout.write(
+                f"{modo:<10} {r['vazao']:>7.1f} {r['taxa_erro']:>7.1%} {r['p50'] * 1000:>8.0f} "
+                f"{r['p95'] * 1000:>8.0f} {r['p99'] * 1000:>8.0f}"
+            )
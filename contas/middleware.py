@@ -0,0 +1,15 @@
+from django.middleware.gzip import GZipMiddleware
+
+
+class CompressaoJSONMiddleware(GZipMiddleware):
+    """
+    GZip só para respostas JSON da API. HTML fica de fora (tokens CSRF no corpo
+    comprimido abrem espaço para o ataque BREACH), estáticos já saem
+    comprimidos pelo WhiteNoise e o stream da importação (SSE) precisa chegar
+    pedaço a pedaço.
+    """
+
+    def process_response(self, request, response):
+        if not response.get('Content-Type', '').startswith('application/json'):
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contas', '0005_alter_categoria_id_alter_conta_id_alter_transacao_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['data'], name='transacao_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['tipo', 'data'], name='transacao_tipo_data_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+# Linhas por UPDATE: cada lote é commitado separadamente para não segurar
+# um lock longo nem um log de transação gigante em tabelas grandes
+TAMANHO_LOTE = 10000
+
+
+def preencher_usuario(apps, schema_editor):
+    Transacao = apps.get_model('contas', 'Transacao')
+    Conta = apps.get_model('contas', 'Conta')
+
+    dono = Conta.objects.filter(pk=OuterRef('conta_id')).values('usuario_id')[:1]
+    ultimo_id = Transacao.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+
+    for inicio in range(0, ultimo_id + 1, TAMANHO_LOTE):
+        with transaction.atomic():
+            Transacao.objects.filter(
+                id__gte=inicio, id__lt=inicio + TAMANHO_LOTE, usuario__isnull=True
+            ).update(usuario_id=Subquery(dono))
+
+
+class Migration(migrations.Migration):
+    # Cada lote roda na sua própria transação (ver TAMANHO_LOTE)
+    atomic = False
+
+    dependencies = [
+        ('contas', '0007_transacao_usuario'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_usuario, migrations.RunPython.noop),
+        # Índice criado depois do preenchimento (mais rápido que mantê-lo a cada lote)
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['usuario', 'data'], name='transacao_usuario_data_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contas', '0008_preencher_transacao_usuario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Exclusao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('transacao', 'Transação'), ('conta', 'Conta'), ('categoria', 'Categoria')], max_length=10)),
+                ('objeto_id', models.BigIntegerField()),
+                ('excluido_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='conta',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='transacao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='transacao',
+            name='chave_cliente',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='categoria',
+            index=models.Index(fields=['usuario', 'atualizado_em'], name='categoria_usuario_atual_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conta',
+            index=models.Index(fields=['usuario', 'atualizado_em'], name='conta_usuario_atual_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['usuario', 'atualizado_em'], name='transacao_usuario_atual_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='transacao',
+            constraint=models.UniqueConstraint(fields=('usuario', 'chave_cliente'), name='transacao_chave_cliente_unica'),
+        ),
+        migrations.AddField(
+            model_name='exclusao',
+            name='usuario',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='exclusao',
+            index=models.Index(fields=['usuario', 'excluido_em'], name='exclusao_usuario_excl_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contas', '0009_sincronizacao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recorrencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descricao', models.CharField(max_length=200)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('tipo', models.CharField(choices=[('R', 'Receita'), ('D', 'Despesa')], default='D', max_length=1)),
+                ('frequencia', models.CharField(choices=[('semanal', 'Semanal'), ('mensal', 'Mensal'), ('anual', 'Anual')], default='mensal', max_length=10)),
+                ('intervalo', models.PositiveSmallIntegerField(default=1)),
+                ('data_inicio', models.DateField()),
+                ('data_fim', models.DateField(blank=True, null=True)),
+                ('proxima_data', models.DateField(editable=False)),
+                ('ativa', models.BooleanField(default=True)),
+                ('dt_criacao', models.DateTimeField(auto_now_add=True)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='contas.categoria')),
+                ('conta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contas.conta')),
+                ('usuario', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('ativa', True)), fields=['proxima_data', 'id'], name='recorrencia_devidas_idx')],
+            },
+        ),
+    ]
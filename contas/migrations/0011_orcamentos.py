@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contas', '0010_recorrencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GastoCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('categoria', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='contas.categoria')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('categoria', 'mes'), name='gasto_categoria_mes_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Orcamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contas.categoria')),
+                ('usuario', models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario', 'mes'], name='orcamento_usuario_mes_idx')],
+                'constraints': [models.UniqueConstraint(fields=('categoria', 'mes'), name='orcamento_categoria_mes_unico')],
+            },
+        ),
+    ]
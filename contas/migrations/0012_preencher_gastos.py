@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def preencher_gastos(apps, schema_editor):
+    # Contadores iniciais a partir das despesas já lançadas (uma consulta agrupada)
+    Transacao = apps.get_model('contas', 'Transacao')
+    GastoCategoria = apps.get_model('contas', 'GastoCategoria')
+
+    linhas = Transacao.objects.filter(tipo='D', categoria__isnull=False).order_by().annotate(
+        mes=TruncMonth('data'),
+    ).values('categoria_id', 'mes').annotate(total=Sum('valor'), quantidade=Count('id'))
+    GastoCategoria.objects.bulk_create((GastoCategoria(**linha) for linha in linhas.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contas', '0011_orcamentos'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_gastos, migrations.RunPython.noop),
+    ]
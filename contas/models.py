@@ -1,14 +1,28 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import TruncMonth
 from django.contrib.auth.models import User
+from django.utils import timezone
 
+from datetime import date
+from decimal import Decimal
 import hashlib
 
+from .referencias import invalidar_referencias
+
 
 
 class Categoria(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     nome = models.CharField(max_length=100)
     dt_criacao = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Sincronização incremental (ver sincronizacao.py)
+            models.Index(fields=['usuario', 'atualizado_em'], name='categoria_usuario_atual_idx'),
+        ]
 
     def __str__(self):
         return self.nome
@@ -19,10 +33,131 @@ class Conta(models.Model):
     nome = models.CharField(max_length=100)  # Ex: Nubank, Carteira
     saldo_inicial = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     instituicao = models.CharField(max_length=100, blank=True, null=True)  # Para uso futuro na importação
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'atualizado_em'], name='conta_usuario_atual_idx'),
+        ]
 
     def __str__(self):
         return self.nome
 
+    def save(self, *args, **kwargs):
+        # Se a conta mudar de dono, as transações e recorrências (que guardam o dono) acompanham
+        usuario_anterior = None
+        if self.pk is not None:
+            usuario_anterior = Conta.objects.filter(pk=self.pk).values_list('usuario_id', flat=True).first()
+
+        super().save(*args, **kwargs)
+
+        if usuario_anterior is not None and usuario_anterior != self.usuario_id:
+            # Para o dono anterior, a conta e as transações deixam de existir
+            Exclusao.registrar(Exclusao.CONTA, [(self.pk, usuario_anterior)])
+            Exclusao.registrar(Exclusao.TRANSACAO, self.transacao_set.values_list('id', 'usuario_id'))
+            self.transacao_set.update(usuario_id=self.usuario_id)
+            self.recorrencia_set.update(usuario_id=self.usuario_id)
+            invalidar_referencias(usuario_anterior)
+
+
+# Campos que mudam os contadores de GastoCategoria
+CAMPOS_GASTO = {'categoria', 'categoria_id', 'data', 'valor', 'tipo'}
+TAMANHO_IN = 500  # Parâmetros por IN (o SQLite limita a quantidade de variáveis)
+
+
+class TransacaoQuerySet(models.QuerySet):
+    def for_user(self, user):
+        # ✅ Filtra pelo dono desnormalizado: sem JOIN com contas_conta
+        return self.filter(usuario=user)
+
+    def gastos(self):
+        """Despesas agrupadas por categoria e mês: {(categoria_id, mes): (total, quantidade)}."""
+        linhas = self.filter(tipo='D', categoria__isnull=False).order_by().annotate(
+            mes=TruncMonth('data'),
+        ).values('categoria_id', 'mes').annotate(total=Sum('valor'), quantidade=Count('id'))
+        return {(l['categoria_id'], l['mes']): (l['total'], l['quantidade']) for l in linhas}
+
+    def _grupos_gasto(self):
+        """Linhas agrupadas por categoria, mês e tipo, com o valor somado (base do antes/depois do update)."""
+        return list(self.order_by().annotate(mes=TruncMonth('data')).values(
+            'categoria_id', 'mes', 'tipo',
+        ).annotate(total=Sum('valor'), quantidade=Count('id')))
+
+    @staticmethod
+    def _gastos_dos_grupos(grupos, novos):
+        """Gastos dos grupos de _grupos_gasto() depois de receberem os valores constantes de `novos`."""
+        novos = dict(novos)
+        if 'categoria' in novos:
+            categoria = novos['categoria']
+            novos['categoria_id'] = categoria.pk if isinstance(categoria, models.Model) else categoria
+        if novos.get('categoria_id') is not None:
+            novos['categoria_id'] = int(novos['categoria_id'])
+        if 'data' in novos:
+            data = novos['data'] if isinstance(novos['data'], date) else date.fromisoformat(str(novos['data'])[:10])
+            novos['mes'] = date(data.year, data.month, 1)
+
+        gastos = {}
+        for grupo in grupos:
+            categoria_id = novos.get('categoria_id', grupo['categoria_id'])
+            if novos.get('tipo', grupo['tipo']) != 'D' or categoria_id is None:
+                continue
+            total = Decimal(str(novos['valor'])) * grupo['quantidade'] if 'valor' in novos else grupo['total']
+            mes = novos.get('mes', grupo['mes'])
+            GastoCategoria.acumular(gastos, {(categoria_id, mes): (total, grupo['quantidade'])})
+        return gastos
+
+    def update(self, **kwargs):
+        # UPDATE em massa não passa pelo auto_now: marca a alteração para a sincronização
+        kwargs.setdefault('atualizado_em', timezone.now())
+        campos = {campo: valor for campo, valor in kwargs.items() if campo in CAMPOS_GASTO}
+        if not campos:
+            return super().update(**kwargs)
+
+        # Os contadores recebem a diferença entre os gastos das mesmas linhas antes e depois
+        with transaction.atomic(using=self.db):
+            if not any(hasattr(valor, 'resolve_expression') for valor in campos.values()):
+                # Valores constantes (o caso das alterações em lote): um SELECT agrupado dá o
+                # antes, e o depois sai dele mesmo, sem reler as linhas nem listar os ids
+                grupos = self._grupos_gasto()
+                alteradas = super().update(**kwargs)
+                GastoCategoria.aplicar(self._gastos_dos_grupos(grupos, campos), self._gastos_dos_grupos(grupos, {}))
+                return alteradas
+
+            # Expressões (o bulk_update, um UPDATE com CASE por lote): relê as mesmas linhas depois.
+            # O IN tem o tamanho do lote do bulk_update
+            ids = list(self.values_list('pk', flat=True))
+            antes = self.gastos()
+            alteradas = super().update(**kwargs)
+            GastoCategoria.aplicar(Transacao.objects.using(self.db).filter(pk__in=ids).gastos(), antes)
+        return alteradas
+
+    update.alters_data = True
+
+    def delete(self):
+        # Registra as exclusões (um INSERT em lote) antes do DELETE
+        with transaction.atomic(using=self.db):
+            Exclusao.registrar(Exclusao.TRANSACAO, self.values_list('id', 'usuario_id'))
+            GastoCategoria.aplicar(subtrair=self.gastos())
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False, update_conflicts=False,
+                    update_fields=None, unique_fields=None):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            criadas = super().bulk_create(
+                objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts,
+                update_conflicts=update_conflicts, update_fields=update_fields, unique_fields=unique_fields,
+            )
+            if ignore_conflicts or update_conflicts:
+                # Não dá para saber quais linhas entraram: recalcula os meses tocados
+                GastoCategoria.recalcular(GastoCategoria.somar(objs))
+            else:
+                GastoCategoria.aplicar(GastoCategoria.somar(objs))
+        return criadas
+
 
 class Transacao(models.Model):
     TIPO_CHOICES = (
@@ -31,6 +166,8 @@ class Transacao(models.Model):
     )
 
     conta = models.ForeignKey(Conta, on_delete=models.CASCADE)
+    # Cópia de conta.usuario, mantida pelo save(); indexada junto com a data (ver Meta)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, null=True, editable=False, db_index=False)
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True)
 
     data = models.DateField()
@@ -38,6 +175,24 @@ class Transacao(models.Model):
     valor = models.DecimalField(max_digits=10, decimal_places=2)
     tipo = models.CharField(max_length=1, choices=TIPO_CHOICES, default='D')
     observacoes = models.TextField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    # Chave de idempotência enviada por clientes offline (única por usuário)
+    chave_cliente = models.CharField(max_length=64, blank=True, null=True, editable=False)
+
+    objects = TransacaoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Consultas por usuário e período começam pelo dono
+            models.Index(fields=['usuario', 'data'], name='transacao_usuario_data_idx'),
+            # Filtros por período (API, admin date_hierarchy e ordenação do changelist)
+            models.Index(fields=['data'], name='transacao_data_idx'),
+            models.Index(fields=['tipo', 'data'], name='transacao_tipo_data_idx'),
+            models.Index(fields=['usuario', 'atualizado_em'], name='transacao_usuario_atual_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'chave_cliente'], name='transacao_chave_cliente_unica'),
+        ]
 
     def __str__(self):
         return f"{self.descricao} - R$ {self.valor}"
@@ -45,11 +200,260 @@ class Transacao(models.Model):
     # Campo para controle de duplicidade
     hash_id = models.CharField(max_length=32, blank=True, null=True, unique=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Guarda o gasto como veio do banco: o save() aplica só a diferença nos contadores
+        if {'categoria_id', 'data', 'valor', 'tipo'} <= set(field_names):
+            instancia._gasto_salvo = instancia.gasto()
+        return instancia
+
+    def gasto(self):
+        """Contribuição desta transação para GastoCategoria, no formato de TransacaoQuerySet.gastos()."""
+        if self.tipo != 'D' or self.categoria_id is None or not self.data:
+            return {}
+        # Vindo de formulários/importação, data e valor ainda podem ser texto
+        data = self.data if isinstance(self.data, date) else date.fromisoformat(str(self.data)[:10])
+        return {(self.categoria_id, date(data.year, data.month, 1)): (Decimal(str(self.valor)), 1)}
+
     def save(self, *args, **kwargs):
+        # Mantém o dono desnormalizado igual ao da conta
+        if self.conta_id is not None:
+            self.usuario_id = self.conta.usuario_id
+
         # Gera o hash automaticamente antes de salvar se não existir
         if not self.hash_id:
-            # Cria uma string única: DATA + VALOR + DESCRIÇÃO
-            string_unica = f"{self.data}{self.valor}{self.descricao}"
-            self.hash_id = hashlib.md5(string_unica.encode('utf-8')).hexdigest()
+            self.hash_id = self.gerar_hash(self.data, self.valor, self.descricao)
+
+        campos = kwargs.get('update_fields')
+        if campos is not None and not CAMPOS_GASTO & set(campos):
+            return super().save(*args, **kwargs)
+
+        if self._state.adding:
+            antes = {}
+        elif hasattr(self, '_gasto_salvo'):
+            antes = self._gasto_salvo
+        else:
+            antes = Transacao.objects.filter(pk=self.pk).gastos()
+        depois = self.gasto()
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            GastoCategoria.aplicar(depois, antes)
+        self._gasto_salvo = depois
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            Exclusao.registrar(Exclusao.TRANSACAO, [(self.pk, self.usuario_id)])
+            GastoCategoria.aplicar(subtrair=self._gasto_salvo if hasattr(self, '_gasto_salvo') else self.gasto())
+            return super().delete(*args, **kwargs)
+
+    @staticmethod
+    def gerar_hash(data, valor, descricao):
+        # Cria uma string única: DATA + VALOR + DESCRIÇÃO
+        string_unica = f"{data}{valor}{descricao}"
+        return hashlib.md5(string_unica.encode('utf-8')).hexdigest()
+
+
+class Exclusao(models.Model):
+    """
+    Marca de exclusão ("tombstone"): permite que a sincronização incremental
+    avise os clientes sobre registros apagados.
+    """
+    TRANSACAO = 'transacao'
+    CONTA = 'conta'
+    CATEGORIA = 'categoria'
+    MODELO_CHOICES = (
+        (TRANSACAO, 'Transação'),
+        (CONTA, 'Conta'),
+        (CATEGORIA, 'Categoria'),
+    )
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    modelo = models.CharField(max_length=10, choices=MODELO_CHOICES)
+    objeto_id = models.BigIntegerField()
+    excluido_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'excluido_em'], name='exclusao_usuario_excl_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.modelo} {self.objeto_id}"
+
+    @classmethod
+    def registrar(cls, modelo, ids_e_usuarios):
+        """Grava as marcas de exclusão de [(id, usuario_id), ...] num único INSERT."""
+        agora = timezone.now()
+        cls.objects.bulk_create(
+            [cls(usuario_id=usuario_id, modelo=modelo, objeto_id=objeto_id, excluido_em=agora)
+             for objeto_id, usuario_id in ids_e_usuarios if usuario_id is not None],
+            batch_size=1000,
+        )
+
+
+class Recorrencia(models.Model):
+    """
+    Transação que se repete (aluguel, salário, assinaturas). As ocorrências são
+    criadas pelo comando `materializar_recorrencias` (ver recorrencias.py).
+    """
+    FREQUENCIA_CHOICES = (
+        ('semanal', 'Semanal'),
+        ('mensal', 'Mensal'),
+        ('anual', 'Anual'),
+    )
+
+    conta = models.ForeignKey(Conta, on_delete=models.CASCADE)
+    # Cópia de conta.usuario, como em Transacao
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, editable=False)
+    categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True)
+
+    descricao = models.CharField(max_length=200)
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    tipo = models.CharField(max_length=1, choices=Transacao.TIPO_CHOICES, default='D')
+
+    frequencia = models.CharField(max_length=10, choices=FREQUENCIA_CHOICES, default='mensal')
+    intervalo = models.PositiveSmallIntegerField(default=1)  # A cada N semanas/meses/anos
+    data_inicio = models.DateField()  # Também define o dia do mês das ocorrências
+    data_fim = models.DateField(null=True, blank=True)
+
+    # Próxima ocorrência ainda não criada; o comando avança a data
+    proxima_data = models.DateField(editable=False)
+    ativa = models.BooleanField(default=True)
+    dt_criacao = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Varredura do agendador: só regras ativas, em ordem de (proxima_data, id)
+            models.Index(fields=['proxima_data', 'id'], condition=models.Q(ativa=True),
+                         name='recorrencia_devidas_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.descricao} ({self.get_frequencia_display()})"
+
+    def save(self, *args, **kwargs):
+        if self.conta_id is not None:
+            self.usuario_id = self.conta.usuario_id
+        if self.proxima_data is None:
+            self.proxima_data = self.data_inicio
+        super().save(*args, **kwargs)
+
+
+class Orcamento(models.Model):
+    """Limite de despesas de uma categoria num mês."""
+    # Cópia de categoria.usuario: a consulta do mês vai direto pelo índice (usuario, mes)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, editable=False, db_index=False)
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
+    mes = models.DateField()  # Sempre o dia 1
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'mes'], name='orcamento_usuario_mes_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['categoria', 'mes'], name='orcamento_categoria_mes_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.categoria} {self.mes:%m/%Y} - R$ {self.valor}"
+
+    def save(self, *args, **kwargs):
+        if self.categoria_id is not None:
+            self.usuario_id = self.categoria.usuario_id
+        self.mes = self.mes.replace(day=1)
+        super().save(*args, **kwargs)
+
+
+class GastoCategoria(models.Model):
+    """
+    Total de despesas de uma categoria num mês. Mantido pelas próprias escritas
+    de Transacao (save/delete e as operações em massa do QuerySet) com UPDATEs
+    de F('total') + delta, então o painel de orçamentos não agrega transações.
+    O comando `reconciliar_gastos` confere (e corrige) contra os dados brutos.
+    """
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, db_index=False)
+    mes = models.DateField()
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    quantidade = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Também é o índice das consultas por categoria
+            models.UniqueConstraint(fields=['categoria', 'mes'], name='gasto_categoria_mes_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.categoria_id} {self.mes:%m/%Y} - R$ {self.total}"
+
+    @staticmethod
+    def acumular(destino, gastos, sinal=1):
+        for chave, (total, quantidade) in gastos.items():
+            atual_total, atual_quantidade = destino.get(chave, (Decimal('0'), 0))
+            destino[chave] = (atual_total + sinal * total, atual_quantidade + sinal * quantidade)
+        return destino
+
+    @classmethod
+    def somar(cls, transacoes):
+        gastos = {}
+        for transacao in transacoes:
+            cls.acumular(gastos, transacao.gasto())
+        return gastos
+
+    @classmethod
+    def aplicar(cls, somar=None, subtrair=None):
+        """
+        Soma `somar` e desconta `subtrair` dos contadores ({(categoria_id, mes): (total, quantidade)}).
+        Uma chave: um UPDATE atômico, e a linha só é criada quando ainda não existe. Várias chaves
+        (operações em massa): um INSERT das linhas que faltam e um UPDATE com CASE por bloco.
+        """
+        deltas = cls.acumular(cls.acumular({}, somar or {}), subtrair or {}, sinal=-1)
+        deltas = {chave: delta for chave, delta in deltas.items() if delta[0] or delta[1]}
+        if len(deltas) == 1:
+            [((categoria_id, mes), (total, quantidade))] = deltas.items()
+            linha = cls.objects.filter(categoria_id=categoria_id, mes=mes)
+            if not linha.update(total=F('total') + total, quantidade=F('quantidade') + quantidade):
+                # ON CONFLICT DO NOTHING: se outra escrita criou a linha agora, soma nela
+                cls.objects.bulk_create([cls(categoria_id=categoria_id, mes=mes)], ignore_conflicts=True)
+                linha.update(total=F('total') + total, quantidade=F('quantidade') + quantidade)
+            return
+
+        # Ordem fixa das chaves: escritas concorrentes travam as linhas na mesma sequência
+        chaves = sorted(deltas)
+        cls.objects.bulk_create([cls(categoria_id=c, mes=m) for c, m in chaves], ignore_conflicts=True)
+        por_update = TAMANHO_IN // 8  # Cada chave usa até 8 parâmetros (dois When e os dois IN)
+        for inicio in range(0, len(chaves), por_update):
+            parte = chaves[inicio:inicio + por_update]
+            totais = [When(categoria_id=c, mes=m, then=Value(deltas[c, m][0])) for c, m in parte]
+            quantidades = [When(categoria_id=c, mes=m, then=Value(deltas[c, m][1])) for c, m in parte]
+            cls.objects.filter(categoria_id__in={c for c, _ in parte}, mes__in={m for _, m in parte}).update(
+                total=F('total') + Case(*totais, default=Value(Decimal('0')), output_field=models.DecimalField()),
+                quantidade=F('quantidade') + Case(*quantidades, default=Value(0)),
+            )
+
+    @classmethod
+    def recalcular(cls, chaves):
+        """Regrava os contadores de `chaves` a partir das transações (para INSERTs com conflitos ignorados)."""
+        chaves = sorted(chaves)
+        for inicio in range(0, len(chaves), TAMANHO_IN):
+            parte = chaves[inicio:inicio + TAMANHO_IN]
+            categorias = {categoria_id for categoria_id, _ in parte}
+            meses = {mes for _, mes in parte}
+
+            # Garante as linhas e as trava antes de somar: escritas concorrentes esperam
+            # (ou já terminaram) e os deltas delas não se perdem na regravação
+            cls.objects.bulk_create([cls(categoria_id=c, mes=m) for c, m in parte], ignore_conflicts=True)
+            list(cls.objects.select_for_update().filter(categoria_id__in=categorias, mes__in=meses).values_list('id'))
 
-        super().save(*args, **kwargs)
\ No newline at end of file
+            ultimo_mes = max(meses)
+            fim = date(ultimo_mes.year + ultimo_mes.month // 12, ultimo_mes.month % 12 + 1, 1)
+            gastos = Transacao.objects.filter(
+                categoria_id__in=categorias, data__gte=min(meses), data__lt=fim,
+            ).gastos()
+            cls.objects.bulk_create(
+                [cls(categoria_id=c, mes=m, total=gastos.get((c, m), (0, 0))[0],
+                     quantidade=gastos.get((c, m), (0, 0))[1]) for c, m in parte],
+                update_conflicts=True, unique_fields=['categoria', 'mes'], update_fields=['total', 'quantidade'],
+            )
@@ -0,0 +1,77 @@
+"""
+Orçamentos por categoria e mês.
+
+O gasto de cada categoria não é agregado na hora: vem de GastoCategoria, que
+as escritas de Transacao mantêm em dia. O status do mês são duas consultas
+por índice (orçamentos do usuário e contadores das categorias dele), sem
+passar pela tabela de transações.
+"""
+from datetime import date
+
+from .models import GastoCategoria, Orcamento, Transacao
+from .referencias import obter_referencias
+
+
+def status_orcamentos(usuario, ano, mes):
+    mes_referencia = date(ano, mes, 1)
+    orcamentos = dict(
+        Orcamento.objects.filter(usuario=usuario, mes=mes_referencia).values_list('categoria_id', 'valor')
+    )
+    gastos = dict(
+        GastoCategoria.objects.filter(categoria__usuario=usuario, mes=mes_referencia).values_list('categoria_id', 'total')
+    )
+
+    categorias = []
+    # Nomes do cache de referências (sem JOIN); só entra categoria com orçamento ou gasto no mês
+    for categoria_id, nome in obter_referencias(usuario.id).categorias:
+        orcado = orcamentos.get(categoria_id)
+        gasto = gastos.get(categoria_id) or 0
+        if orcado is None and not gasto:
+            continue
+        categorias.append({
+            'categoria_id': categoria_id,
+            'categoria': nome,
+            'orcamento': float(orcado) if orcado is not None else None,
+            'gasto': float(gasto),
+            'restante': float(orcado - gasto) if orcado is not None else None,
+            'percentual': round(float(gasto / orcado * 100), 1) if orcado else None,
+            'estourado': orcado is not None and gasto > orcado,
+        })
+
+    return {
+        'ano': ano,
+        'mes': mes,
+        'total_orcado': float(sum(orcamentos.values())),
+        'total_gasto': sum(c['gasto'] for c in categorias if c['orcamento'] is not None),
+        'categorias': categorias,
+    }
+
+
+def reconciliar(usuario_id=None, corrigir=False):
+    """
+    Compara os contadores com as transações. Retorna [(categoria_id, mes, contador, real)]
+    das divergências, onde contador/real são (total, quantidade); com `corrigir`,
+    regrava essas chaves a partir das transações.
+    """
+    transacoes = Transacao.objects.all()
+    contadores = GastoCategoria.objects.all()
+    if usuario_id is not None:
+        transacoes = transacoes.filter(usuario_id=usuario_id)
+        contadores = contadores.filter(categoria__usuario_id=usuario_id)
+
+    reais = transacoes.gastos()
+    salvos = {
+        (categoria_id, mes): (total, quantidade)
+        for categoria_id, mes, total, quantidade in contadores.values_list('categoria_id', 'mes', 'total', 'quantidade')
+    }
+
+    divergencias = []
+    for chave in sorted(set(reais) | set(salvos)):
+        contador = salvos.get(chave, (0, 0))
+        real = reais.get(chave, (0, 0))
+        if contador[0] != real[0] or contador[1] != real[1]:
+            divergencias.append((chave[0], chave[1], contador, real))
+
+    if corrigir and divergencias:
+        GastoCategoria.recalcular({(categoria_id, mes) for categoria_id, mes, _, _ in divergencias})
+    return divergencias
@@ -0,0 +1,106 @@
+"""
+Dados do painel (resumo, gráficos e extrato de um mês ou de um ano).
+
+Usado pela API (mudança de filtros no navegador) e pela própria listagem, que
+já entrega o mês inicial dentro do HTML: a primeira pintura não espera uma
+segunda requisição.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth
+
+from .models import Transacao
+from .referencias import obter_referencias
+from .serializers import TransacaoSerializer
+
+
+def ler_filtros(parametros, hoje=None):
+    """(ano, mes, ano_inteiro) a partir de GET; valores inválidos caem no mês atual."""
+    hoje = hoje or datetime.now()
+    eh_ano_inteiro = parametros.get('ano_inteiro') == 'true'
+
+    try:
+        ano_filtrado = int(parametros.get('ano'))
+    except (TypeError, ValueError):
+        ano_filtrado = hoje.year
+
+    try:
+        mes_filtrado = int(parametros.get('mes'))
+    except (TypeError, ValueError):
+        mes_filtrado = hoje.month
+
+    return ano_filtrado, mes_filtrado, eh_ano_inteiro
+
+
+def _centavos(valor):
+    # A soma do SQLite volta com casas a mais (0.300000000000000)
+    return (valor or Decimal('0')).quantize(Decimal('0.01'))
+
+
+def calcular_painel(usuario, ano_filtrado, mes_filtrado, eh_ano_inteiro=False):
+    # --- 1. QUERYSET PRINCIPAL ---
+    # ✅ SEGURANÇA: Filtra apenas transações do usuário logado (dono desnormalizado, sem JOIN)
+    # Os nomes de conta/categoria vêm do cache de referências (sem JOIN)
+    referencias = obter_referencias(usuario.id)
+    transacoes_qs = Transacao.objects.for_user(usuario).filter(
+        data__year=ano_filtrado,
+    ).order_by('-data')
+
+    if not eh_ano_inteiro:
+        transacoes_qs = transacoes_qs.filter(data__month=mes_filtrado)
+
+    # --- 2. CÁLCULOS TOTAIS ---
+    # Decimal em centavos: dinheiro não passa por float (o json_script o escreve como texto)
+    total_receitas = _centavos(transacoes_qs.filter(tipo='R').aggregate(Sum('valor'))['valor__sum'])
+    total_despesas = _centavos(transacoes_qs.filter(tipo='D').aggregate(Sum('valor'))['valor__sum'])
+    saldo = total_receitas - total_despesas
+
+    # --- 3. DADOS PARA GRÁFICO DE FLUXO (BARRA) ---
+    if eh_ano_inteiro:
+        dados_agrupados = transacoes_qs.annotate(periodo=TruncMonth('data')).values('periodo', 'tipo').annotate(
+            total=Sum('valor')).order_by('periodo')
+        formato_data = "%b"
+    else:
+        dados_agrupados = transacoes_qs.annotate(periodo=TruncDay('data')).values('periodo', 'tipo').annotate(
+            total=Sum('valor')).order_by('periodo')
+        formato_data = "%d"
+
+    dados_dict = {}
+    for item in dados_agrupados:
+        label = item['periodo'].strftime(formato_data)
+        tipo = item['tipo']
+        valor = float(item['total'])
+        if label not in dados_dict: dados_dict[label] = {'R': 0, 'D': 0}
+        dados_dict[label][tipo] = valor
+
+    grafico_labels = sorted(dados_dict.keys())
+    grafico_receitas = [dados_dict[label]['R'] for label in grafico_labels]
+    grafico_despesas = [dados_dict[label]['D'] for label in grafico_labels]
+
+    # --- 4. DADOS PARA GRÁFICOS DE ROSCA (CATEGORIAS) ---
+    rec_cat = transacoes_qs.filter(tipo='R').values('categoria_id').annotate(total=Sum('valor')).order_by('-total')
+    cat_receitas_labels = [referencias.nomes_categorias.get(item['categoria_id'], 'Sem categoria') for item in rec_cat]
+    cat_receitas_data = [float(item['total']) for item in rec_cat]
+
+    desp_cat = transacoes_qs.filter(tipo='D').values('categoria_id').annotate(total=Sum('valor')).order_by('-total')
+    cat_despesas_labels = [referencias.nomes_categorias.get(item['categoria_id'], 'Sem categoria') for item in desp_cat]
+    cat_despesas_data = [float(item['total']) for item in desp_cat]
+
+    # --- 5. SERIALIZER ---
+    serializer = TransacaoSerializer(transacoes_qs, many=True, context={'referencias': referencias})
+
+    return {
+        'transacoes': serializer.data,
+        'saldo': saldo,
+        'total_receitas': total_receitas,
+        'total_despesas': total_despesas,
+        'grafico_labels': grafico_labels,
+        'grafico_receitas': grafico_receitas,
+        'grafico_despesas': grafico_despesas,
+        'cat_receitas_labels': cat_receitas_labels,
+        'cat_receitas_data': cat_receitas_data,
+        'cat_despesas_labels': cat_despesas_labels,
+        'cat_despesas_data': cat_despesas_data,
+    }
@@ -0,0 +1,143 @@
+"""
+Materialização das recorrências em transações.
+
+O agendador percorre as regras ativas vencidas em lotes, em ordem de
+(proxima_data, id) com paginação por chave (sem OFFSET), e para cada lote:
+- calcula as ocorrências até a data de referência (limitadas por regra);
+- grava tudo num bulk_create com ignore_conflicts;
+- avança proxima_data das regras (um UPDATE por data nova).
+
+A chave de idempotência é a `chave_cliente` da transação ("rec:<regra>:<data>",
+única por usuário): rodar de novo, ou duas execuções ao mesmo tempo, não
+duplica nada. O hash_id segue o da importação; se ele já existe para o mesmo
+usuário (a transação foi importada ou lançada à mão), a ocorrência é pulada.
+"""
+import calendar
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import transaction
+
+from .models import Recorrencia, Transacao
+
+TAMANHO_LOTE = 1000
+MAX_OCORRENCIAS_POR_REGRA = 60  # Por execução; regras muito atrasadas alcançam na próxima
+TAMANHO_IN = 500  # Parâmetros por IN (o SQLite limita a quantidade de variáveis)
+
+
+def _somar_meses(data, meses, dia):
+    indice = data.month - 1 + meses
+    ano, mes = data.year + indice // 12, indice % 12 + 1
+    return date(ano, mes, min(dia, calendar.monthrange(ano, mes)[1]))
+
+
+def proxima_ocorrencia(recorrencia, data):
+    """Ocorrência seguinte a `data`, mantendo o dia de data_inicio (31 vira o último dia do mês)."""
+    if recorrencia.frequencia == 'semanal':
+        return data + timedelta(weeks=recorrencia.intervalo)
+    meses = recorrencia.intervalo * (12 if recorrencia.frequencia == 'anual' else 1)
+    return _somar_meses(data, meses, recorrencia.data_inicio.day)
+
+
+def _ocorrencias(recorrencia, ate):
+    """Datas devidas da regra até `ate` e a nova proxima_data."""
+    datas = []
+    data = recorrencia.proxima_data
+    while data <= ate and len(datas) < MAX_OCORRENCIAS_POR_REGRA:
+        if recorrencia.data_fim and data > recorrencia.data_fim:
+            break
+        datas.append(data)
+        data = proxima_ocorrencia(recorrencia, data)
+    return datas, data
+
+
+def _materializar_lote(regras, ate):
+    novas = []
+    for regra in regras:
+        datas, regra.proxima_data = _ocorrencias(regra, ate)
+        if regra.data_fim and regra.proxima_data > regra.data_fim:
+            regra.ativa = False
+        for data in datas:
+            novas.append(Transacao(
+                usuario_id=regra.usuario_id,
+                conta_id=regra.conta_id,
+                categoria_id=regra.categoria_id,
+                data=data,
+                descricao=regra.descricao,
+                valor=regra.valor,
+                tipo=regra.tipo,
+                chave_cliente=f'rec:{regra.id}:{data.isoformat()}',
+                hash_id=Transacao.gerar_hash(data, regra.valor, regra.descricao),
+            ))
+
+    # Hash já usado: pelo mesmo usuário = transação já existe; por outro = só não guarda o hash
+    hashes = [t.hash_id for t in novas]
+    donos_hash = {}
+    for inicio in range(0, len(hashes), TAMANHO_IN):
+        donos_hash.update(
+            Transacao.objects.filter(hash_id__in=hashes[inicio:inicio + TAMANHO_IN]).values_list('hash_id', 'usuario_id')
+        )
+    criar = []
+    for transacao in novas:
+        dono = donos_hash.get(transacao.hash_id)
+        if dono == transacao.usuario_id:
+            continue
+        if dono is not None:
+            transacao.hash_id = None
+        donos_hash[transacao.hash_id] = transacao.usuario_id  # Duplicatas dentro do próprio lote
+        criar.append(transacao)
+
+    # As regras de um lote costumam cair em poucas datas: um UPDATE por (proxima_data, ativa)
+    # sai bem mais barato que o CASE gigante do bulk_update
+    grupos = defaultdict(list)
+    for regra in regras:
+        grupos[(regra.proxima_data, regra.ativa)].append(regra.id)
+
+    with transaction.atomic():
+        Transacao.objects.bulk_create(criar, batch_size=TAMANHO_LOTE, ignore_conflicts=True)
+        for (proxima_data, ativa), ids in grupos.items():
+            Recorrencia.objects.filter(id__in=ids).update(proxima_data=proxima_data, ativa=ativa)
+    return len(criar)
+
+
+def materializar(ate=None, regras=None, tamanho_lote=TAMANHO_LOTE, tempo_maximo=None):
+    """
+    Cria as ocorrências devidas até `ate` (hoje, por padrão). `regras` restringe
+    a um queryset (ex.: uma regra recém-criada). Retorna (regras, transações, lotes).
+    """
+    ate = ate or date.today()
+    consulta = (regras if regras is not None else Recorrencia.objects.all()).filter(
+        ativa=True, proxima_data__lte=ate,
+    ).only(
+        'id', 'usuario_id', 'conta_id', 'categoria_id', 'descricao', 'valor', 'tipo',
+        'frequencia', 'intervalo', 'data_inicio', 'data_fim', 'proxima_data', 'ativa',
+    ).order_by('proxima_data', 'id')
+
+    inicio = time.monotonic()
+    total_regras = total_transacoes = lotes = 0
+    ultima = None
+    # Regra que bateu no teto e continua vencida reaparece mais à frente na
+    # varredura: fica de fora até a próxima execução. Só essas são guardadas
+    # (as demais já passaram de `ate`), então a memória não cresce com o total
+    atrasadas = set()
+    while True:
+        pagina = consulta
+        if ultima is not None:
+            # Paginação por chave em (proxima_data, id). Escrito como ">= data" (faixa do
+            # índice) menos o que já passou nessa data; com OR o SQLite não usa o índice
+            pagina = pagina.filter(proxima_data__gte=ultima[0]).exclude(proxima_data=ultima[0], id__lte=ultima[1])
+        lote = list(pagina[:tamanho_lote])
+        if not lote:
+            break
+        ultima = (lote[-1].proxima_data, lote[-1].id)
+
+        lote = [regra for regra in lote if regra.id not in atrasadas]
+        if lote:
+            total_transacoes += _materializar_lote(lote, ate)
+            atrasadas.update(regra.id for regra in lote if regra.ativa and regra.proxima_data <= ate)
+            total_regras += len(lote)
+            lotes += 1
+        if tempo_maximo and time.monotonic() - inicio > tempo_maximo:
+            break
+    return total_regras, total_transacoes, lotes
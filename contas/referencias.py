@@ -0,0 +1,56 @@
+"""
+Cache por usuário dos dados de referência (contas e categorias).
+
+Formulários, importação e serializers precisam só de id -> nome; em vez de
+consultar o banco a cada renderização, a lista fica no cache sob uma chave
+versionada. Qualquer alteração em Conta/Categoria incrementa a versão do
+usuário (ver signals.py), e a próxima leitura recarrega do banco.
+
+Sem Redis o cache é um por máquina e a invalidação não chega às outras: lá a
+lista pode continuar com uma conta que mudou de dono. Por isso as escritas
+(alteração em lote, sincronização, confirmação da importação) conferem o dono
+com `do_banco=True`, e o cache serve só para exibir nomes e opções.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _chave_versao(usuario_id):
+    return f'ref:versao:{usuario_id}'
+
+
+class Referencias:
+    def __init__(self, contas, categorias):
+        self.contas = contas            # [(id, nome), ...] ordenado por nome
+        self.categorias = categorias
+        self.nomes_contas = dict(contas)
+        self.nomes_categorias = dict(categorias)
+
+    def opcoes_categorias(self):
+        """Formato usado pelos templates ({{ cat.id }} / {{ cat.nome }})."""
+        return [{'id': id_, 'nome': nome} for id_, nome in self.categorias]
+
+
+def obter_referencias(usuario_id, do_banco=False):
+    """Contas e categorias do usuário. `do_banco=True` ignora o cache (e o renova): para validar escritas."""
+    from .models import Categoria, Conta
+
+    versao = cache.get_or_set(_chave_versao(usuario_id), time.time_ns, timeout=None)
+    chave = f'ref:{usuario_id}:{versao}'
+
+    dados = None if do_banco else cache.get(chave)
+    if dados is None:
+        dados = (
+            list(Conta.objects.filter(usuario_id=usuario_id).order_by('nome').values_list('id', 'nome')),
+            list(Categoria.objects.filter(usuario_id=usuario_id).order_by('nome').values_list('id', 'nome')),
+        )
+        cache.set(chave, dados, timeout=getattr(settings, 'REFERENCIAS_CACHE_TIMEOUT', 3600))
+    return Referencias(*dados)
+
+
+def invalidar_referencias(usuario_id):
+    # Versão baseada no relógio (e não um contador): se a chave da versão for
+    # descartada pelo cache, a próxima nunca reaproveita uma lista antiga
+    cache.set(_chave_versao(usuario_id), time.time_ns(), timeout=None)
@@ -0,0 +1,166 @@
+"""
+Relatórios dinâmicos (tabela dinâmica) sobre as transações do usuário.
+
+O pedido escolhe dimensões e medidas de uma lista fechada; cada combinação
+vira uma única consulta agrupada, sempre filtrada por usuário e período (o
+índice (usuario, data)). Nenhum nome vindo da URL chega ao SQL: só as
+expressões cadastradas em DIMENSOES e MEDIDAS.
+
+A resposta é colunar ({coluna: [valores]}), bem menor que uma lista de
+objetos repetindo os nomes dos campos, e fica no cache por usuário. A chave
+inclui a versão dos dados do usuário: o último atualizado_em das transações
+e a última marca de exclusão. Toda escrita mexe em um dos dois (ver
+sincronizacao.py), então um relatório nunca sai do cache desatualizado.
+"""
+import hashlib
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from .models import Exclusao, Transacao
+from .referencias import obter_referencias
+
+# nome na URL -> (campo em values(), expressão a anotar ou None)
+DIMENSOES = {
+    'conta': ('conta_id', None),
+    'categoria': ('categoria_id', None),
+    'tipo': ('tipo', None),
+    'dia': ('dia', TruncDay('data')),
+    'semana': ('semana', TruncWeek('data')),
+    'mes': ('mes', TruncMonth('data')),
+    'ano': ('ano', TruncYear('data')),
+}
+
+MEDIDAS = {
+    'soma': Sum('valor'),
+    'contagem': Count('id'),
+    'media': Avg('valor'),
+}
+
+MAX_DIMENSOES = 3
+LIMITE_LINHAS = 5000
+
+
+class RelatorioInvalido(Exception):
+    pass
+
+
+def _lista(parametros, nome, padrao, permitidos):
+    valores = [v.strip() for v in (parametros.get(nome) or padrao).split(',') if v.strip()]
+    invalidos = [v for v in valores if v not in permitidos]
+    if invalidos:
+        raise RelatorioInvalido(f"{nome}: {', '.join(invalidos)} não disponível. Use: {', '.join(permitidos)}.")
+    if len(set(valores)) != len(valores):
+        raise RelatorioInvalido(f"{nome}: valores repetidos.")
+    return valores
+
+
+def _data(parametros, nome, padrao):
+    valor = parametros.get(nome)
+    if not valor:
+        return padrao
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise RelatorioInvalido(f"{nome}: data inválida (use AAAA-MM-DD).")
+
+
+def ler_parametros(parametros, hoje=None):
+    """Valida ?dimensoes=&medidas=&inicio=&fim=. Padrão: soma por mês no ano atual."""
+    hoje = hoje or date.today()
+    dimensoes = _lista(parametros, 'dimensoes', 'mes', DIMENSOES)
+    medidas = _lista(parametros, 'medidas', 'soma', MEDIDAS)
+    if not dimensoes or not medidas:
+        raise RelatorioInvalido("Informe ao menos uma dimensão e uma medida.")
+    if len(dimensoes) > MAX_DIMENSOES:
+        raise RelatorioInvalido(f"No máximo {MAX_DIMENSOES} dimensões.")
+
+    inicio = _data(parametros, 'inicio', date(hoje.year, 1, 1))
+    fim = _data(parametros, 'fim', date(hoje.year, 12, 31))
+    if fim < inicio:
+        raise RelatorioInvalido("fim: não pode ser antes do início.")
+    return dimensoes, medidas, inicio, fim
+
+
+# --- CONSULTA ---
+def montar_consulta(usuario_id, dimensoes, medidas, inicio, fim):
+    """Uma consulta: WHERE usuario/período, GROUP BY nas dimensões, ordenada por elas."""
+    campos = [DIMENSOES[d][0] for d in dimensoes]
+    consulta = Transacao.objects.filter(usuario_id=usuario_id, data__gte=inicio, data__lte=fim).order_by()
+
+    anotacoes = {DIMENSOES[d][0]: DIMENSOES[d][1] for d in dimensoes if DIMENSOES[d][1] is not None}
+    if anotacoes:
+        consulta = consulta.annotate(**anotacoes)
+    return consulta.values(*campos).annotate(**{m: MEDIDAS[m] for m in medidas}).order_by(*campos)
+
+
+def _formatar(valor):
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if valor is None or isinstance(valor, (int, str)):
+        return valor
+    # Decimal/float: mesmo formato do painel
+    return round(float(valor), 2)
+
+
+def gerar_relatorio(usuario_id, dimensoes, medidas, inicio, fim):
+    campos = [DIMENSOES[d][0] for d in dimensoes]
+    linhas = list(montar_consulta(usuario_id, dimensoes, medidas, inicio, fim).values_list(
+        *campos, *medidas)[:LIMITE_LINHAS + 1])
+    truncado = len(linhas) > LIMITE_LINHAS
+    linhas = linhas[:LIMITE_LINHAS]
+
+    nomes = dimensoes + medidas
+    colunas = {nome: [_formatar(valor) for valor in coluna] for nome, coluna in zip(nomes, zip(*linhas))}
+    if not linhas:
+        colunas = {nome: [] for nome in nomes}
+
+    # Os ids ficam nas colunas; os nomes vão uma vez só, do cache de referências
+    referencias = obter_referencias(usuario_id)
+    rotulos = {}
+    if 'conta' in dimensoes:
+        rotulos['conta'] = referencias.nomes_contas
+    if 'categoria' in dimensoes:
+        rotulos['categoria'] = referencias.nomes_categorias
+    if 'tipo' in dimensoes:
+        rotulos['tipo'] = dict(Transacao.TIPO_CHOICES)
+
+    return {
+        'dimensoes': dimensoes,
+        'medidas': medidas,
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'linhas': len(linhas),
+        'truncado': truncado,
+        'colunas': colunas,
+        'rotulos': rotulos,
+    }
+
+
+# --- CACHE ---
+def versao_dados(usuario_id):
+    """Última alteração e última exclusão do usuário (duas leituras de índice)."""
+    alterado = Transacao.objects.filter(usuario_id=usuario_id).aggregate(ultimo=Max('atualizado_em'))['ultimo']
+    excluido = Exclusao.objects.filter(usuario_id=usuario_id).aggregate(ultimo=Max('excluido_em'))['ultimo']
+    return alterado, excluido
+
+
+def relatorio(usuario_id, dimensoes, medidas, inicio, fim):
+    alterado, excluido = versao_dados(usuario_id)
+    pedido = f"{alterado}|{excluido}|{','.join(dimensoes)}|{','.join(medidas)}|{inicio}|{fim}"
+    chave = f'relatorio:{usuario_id}:{hashlib.md5(pedido.encode()).hexdigest()}'
+
+    dados = cache.get(chave)
+    if dados is None:
+        dados = gerar_relatorio(usuario_id, dimensoes, medidas, inicio, fim)
+        # Escrita muito recente pode ter vizinhas ainda sem COMMIT (com atualizado_em
+        # menor): não guarda, senão a versão não mudaria quando elas aparecessem
+        margem = timedelta(seconds=getattr(settings, 'SINCRONIZACAO_MARGEM_SEGUNDOS', 5))
+        recentes = [m for m in (alterado, excluido) if m and m > timezone.now() - margem]
+        if not recentes:
+            cache.set(chave, dados, timeout=getattr(settings, 'RELATORIOS_CACHE_TIMEOUT', 600))
+    return dados
@@ -15,10 +15,105 @@ class ContaSerializer(serializers.ModelSerializer):
 
 
 class TransacaoSerializer(serializers.ModelSerializer):
-    categoria = CategoriaSerializer(read_only=True)
-    conta = ContaSerializer(read_only=True)
+    """
+    Com `referencias` no contexto (ver referencias.py), os nomes de conta e
+    categoria saem do cache e a consulta não precisa de JOIN.
+    """
+    categoria = serializers.SerializerMethodField()
+    conta = serializers.SerializerMethodField()
 
     class Meta:
         model = Transacao
         fields = ['id', 'data', 'descricao', 'valor', 'tipo', 'categoria', 'conta']
 
+    def get_categoria(self, obj):
+        if obj.categoria_id is None:
+            return None
+        referencias = self.context.get('referencias')
+        if referencias is not None:
+            return {'nome': referencias.nomes_categorias.get(obj.categoria_id)}
+        return CategoriaSerializer(obj.categoria).data
+
+    def get_conta(self, obj):
+        referencias = self.context.get('referencias')
+        if referencias is not None:
+            return {'nome': referencias.nomes_contas.get(obj.conta_id)}
+        return ContaSerializer(obj.conta).data
+
+
+
+class TransacaoLoteSerializer(serializers.Serializer):
+    """
+    Valida uma alteração em lote. Precisa de `referencias` no contexto, lidas
+    do banco (do_banco=True), para conferir que a conta/categoria de destino é do usuário.
+    """
+    # Os ids vão num único IN (sem blocos): cabe no limite de variáveis do SQLite (32766 desde a 3.32)
+    LIMITE_IDS = 10000
+    OPERACOES = ['categoria', 'conta', 'tipo', 'excluir']
+
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=LIMITE_IDS)
+    operacao = serializers.ChoiceField(choices=OPERACOES)
+    valor = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+    def validate(self, dados):
+        referencias = self.context['referencias']
+        operacao = dados['operacao']
+        valor = dados.get('valor')
+
+        if operacao == 'tipo':
+            if valor not in dict(Transacao.TIPO_CHOICES):
+                raise serializers.ValidationError({'valor': "Tipo inválido."})
+
+        elif operacao == 'categoria':
+            # Vazio = remover a categoria
+            if valor in (None, ''):
+                valor = None
+            elif not valor.isdigit() or int(valor) not in referencias.nomes_categorias:
+                raise serializers.ValidationError({'valor': "Categoria não encontrada."})
+            else:
+                valor = int(valor)
+
+        elif operacao == 'conta':
+            if not valor or not valor.isdigit() or int(valor) not in referencias.nomes_contas:
+                raise serializers.ValidationError({'valor': "Conta não encontrada."})
+            valor = int(valor)
+
+        dados['valor'] = valor
+        dados['ids'] = list(set(dados['ids']))
+        return dados
+
+
+class TransacaoSyncSerializer(serializers.Serializer):
+    """Uma transação enviada por um cliente offline (ver sincronizacao.py). Como o de lote, confere o dono nas `referencias`."""
+    chave_cliente = serializers.CharField(max_length=64)
+    conta = serializers.IntegerField()
+    categoria = serializers.IntegerField(required=False, allow_null=True)
+    data = serializers.DateField()
+    descricao = serializers.CharField(max_length=200, required=False, allow_null=True, allow_blank=True)
+    valor = serializers.DecimalField(max_digits=10, decimal_places=2)
+    tipo = serializers.ChoiceField(choices=Transacao.TIPO_CHOICES, default='D')
+    observacoes = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+    def validate(self, dados):
+        referencias = self.context['referencias']
+        if dados['conta'] not in referencias.nomes_contas:
+            raise serializers.ValidationError({'conta': "Conta não encontrada."})
+        if dados.get('categoria') is not None and dados['categoria'] not in referencias.nomes_categorias:
+            raise serializers.ValidationError({'categoria': "Categoria não encontrada."})
+
+        dados['conta_id'] = dados.pop('conta')
+        if 'categoria' in dados:
+            dados['categoria_id'] = dados.pop('categoria')
+        return dados
+
+
+class EnvioSyncSerializer(serializers.Serializer):
+    LIMITE_ITENS = 500
+
+    transacoes = TransacaoSyncSerializer(many=True, allow_empty=False, max_length=LIMITE_ITENS)
+
+    def validate_transacoes(self, itens):
+        chaves = [item['chave_cliente'] for item in itens]
+        if len(chaves) != len(set(chaves)):
+            raise serializers.ValidationError("chave_cliente repetida no mesmo envio.")
+        return itens
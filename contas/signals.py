@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Categoria, Conta, Exclusao, GastoCategoria
+from .referencias import invalidar_referencias
+from .sqlite import aplicar_pragmas
+
+
+@receiver(post_save, sender=Conta)
+@receiver(post_delete, sender=Conta)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def referencias_alteradas(sender, instance, **kwargs):
+    invalidar_referencias(instance.usuario_id)
+
+
+# --- SINCRONIZAÇÃO (marcas de exclusão) ---
+def _dono_sendo_excluido(usuario_id, origin):
+    """
+    A exclusão começou pelo próprio usuário (User.delete() ou um queryset de
+    User): não há para quem sincronizar, e uma marca nova apontaria para um
+    usuário que o mesmo DELETE está apagando (erro de FK no COMMIT).
+    """
+    if isinstance(origin, User):
+        return origin.pk == usuario_id
+    if isinstance(origin, QuerySet) and origin.model is User:
+        return origin.filter(pk=usuario_id).exists()
+    return False
+
+
+@receiver(pre_delete, sender=Conta)
+def conta_sera_excluida(sender, instance, origin=None, **kwargs):
+    if _dono_sendo_excluido(instance.usuario_id, origin):
+        return
+    # O CASCADE apaga as transações direto no banco, sem passar pelo QuerySet.delete()
+    Exclusao.registrar(Exclusao.TRANSACAO, instance.transacao_set.values_list('id', 'usuario_id'))
+    # Pelo mesmo motivo, os gastos das transações saem dos contadores aqui
+    GastoCategoria.aplicar(subtrair=instance.transacao_set.gastos())
+
+
+@receiver(pre_delete, sender=Categoria)
+def categoria_sera_excluida(sender, instance, **kwargs):
+    # O SET_NULL também não atualiza atualizado_em: marca as transações afetadas
+    instance.transacao_set.update()
+
+
+@receiver(post_delete, sender=Conta)
+@receiver(post_delete, sender=Categoria)
+def registrar_exclusao(sender, instance, origin=None, **kwargs):
+    if _dono_sendo_excluido(instance.usuario_id, origin):
+        return
+    modelo = Exclusao.CONTA if sender is Conta else Exclusao.CATEGORIA
+    Exclusao.registrar(modelo, [(instance.pk, instance.usuario_id)])
+
+
+# --- SQLITE ---
+@receiver(connection_created)
+def configurar_sqlite(sender, connection, **kwargs):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor == 'sqlite' and pragmas and getattr(settings, 'SQLITE_OTIMIZADO', False):
+        with connection.cursor() as cursor:
+            aplicar_pragmas(cursor, pragmas)
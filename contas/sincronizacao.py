@@ -0,0 +1,188 @@
+"""
+Sincronização incremental para clientes móveis/offline.
+
+Cada fluxo (transações, contas, categorias e exclusões) é lido em ordem de
+(atualizado_em, id) a partir da posição guardada no cursor. O cursor é opaco
+para o cliente: um JSON assinado com as posições de cada fluxo e o id do
+usuário, de modo que não pode ser forjado nem reaproveitado por outra conta.
+
+Registros alterados há menos de MARGEM segundos ficam para a próxima rodada:
+uma transação que ainda não fez COMMIT pode ter um atualizado_em anterior ao
+de linhas já visíveis, e sem a margem ela seria pulada pelo cursor.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Categoria, Conta, Exclusao, Transacao
+
+SALT_CURSOR = 'contas.sincronizacao'
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 2000
+
+CAMPOS_TRANSACAO = ['id', 'conta_id', 'categoria_id', 'data', 'descricao', 'valor', 'tipo',
+                    'observacoes', 'hash_id', 'chave_cliente', 'atualizado_em']
+CAMPOS_CONTA = ['id', 'nome', 'instituicao', 'saldo_inicial', 'atualizado_em']
+CAMPOS_CATEGORIA = ['id', 'nome', 'atualizado_em']
+
+# nome do fluxo -> (modelo, campo de data, campos devolvidos)
+FLUXOS = {
+    'transacoes': (Transacao, 'atualizado_em', CAMPOS_TRANSACAO),
+    'contas': (Conta, 'atualizado_em', CAMPOS_CONTA),
+    'categorias': (Categoria, 'atualizado_em', CAMPOS_CATEGORIA),
+    'exclusoes': (Exclusao, 'excluido_em', ['id', 'modelo', 'objeto_id', 'excluido_em']),
+}
+
+
+class CursorInvalido(Exception):
+    pass
+
+
+def _margem():
+    return timedelta(seconds=getattr(settings, 'SINCRONIZACAO_MARGEM_SEGUNDOS', 5))
+
+
+def gerar_cursor(usuario_id, posicoes):
+    return signing.dumps({'u': usuario_id, 'p': posicoes}, salt=SALT_CURSOR, compress=True)
+
+
+def ler_cursor(cursor, usuario_id):
+    """Devolve {fluxo: (datetime, id)}; sem cursor, tudo começa do zero."""
+    if not cursor:
+        return {}
+    try:
+        dados = signing.loads(cursor, salt=SALT_CURSOR)
+    except signing.BadSignature:
+        raise CursorInvalido("Cursor inválido.")
+    if dados.get('u') != usuario_id:
+        raise CursorInvalido("Cursor de outro usuário.")
+    return {
+        fluxo: (datetime.fromisoformat(momento), ultimo_id)
+        for fluxo, (momento, ultimo_id) in dados['p'].items()
+    }
+
+
+def alteracoes(usuario_id, cursor=None, limite=LIMITE_PADRAO):
+    """
+    Devolve as alterações do usuário depois do cursor, no máximo `limite` por
+    fluxo, com o próximo cursor e `tem_mais` indicando se há outra página.
+    """
+    posicoes = ler_cursor(cursor, usuario_id)
+    ate = timezone.now() - _margem()
+
+    resultado = {}
+    novas_posicoes = {}
+    tem_mais = False
+    for fluxo, (modelo, campo_data, campos) in FLUXOS.items():
+        consulta = modelo.objects.filter(usuario_id=usuario_id, **{f'{campo_data}__lte': ate})
+        if fluxo in posicoes:
+            momento, ultimo_id = posicoes[fluxo]
+            consulta = consulta.filter(
+                Q(**{f'{campo_data}__gt': momento}) | Q(**{campo_data: momento, 'id__gt': ultimo_id})
+            )
+
+        # Um registro a mais só para saber se existe outra página
+        linhas = list(consulta.order_by(campo_data, 'id').values(*campos)[:limite + 1])
+        if len(linhas) > limite:
+            tem_mais = True
+            linhas = linhas[:limite]
+
+        if linhas:
+            ultima = linhas[-1]
+            novas_posicoes[fluxo] = [ultima[campo_data].isoformat(), ultima['id']]
+        elif fluxo in posicoes:
+            momento, ultimo_id = posicoes[fluxo]
+            novas_posicoes[fluxo] = [momento.isoformat(), ultimo_id]
+        resultado[fluxo] = linhas
+
+    resultado['cursor'] = gerar_cursor(usuario_id, novas_posicoes)
+    resultado['tem_mais'] = tem_mais
+    return resultado
+
+
+# --- ENVIO DE TRANSAÇÕES CRIADAS OFFLINE ---
+CAMPOS_EDITAVEIS = ['conta_id', 'categoria_id', 'data', 'descricao', 'valor', 'tipo', 'observacoes']
+
+
+def gravar_transacoes(usuario_id, itens):
+    """
+    Cria ou atualiza transações enviadas pelo cliente (já validadas).
+
+    A chave `chave_cliente` torna o envio idempotente: reenviar o mesmo lote
+    atualiza as mesmas linhas em vez de duplicar. Itens novos cujo hash o
+    usuário já tem voltam como "duplicada". São poucas consultas por lote,
+    independente do tamanho: uma para as chaves, duas para os hashes, um
+    INSERT em lote (ON CONFLICT DO NOTHING), a releitura dos ids e um UPDATE
+    em lote.
+    """
+    chaves = [item['chave_cliente'] for item in itens]
+    existentes = {
+        t.chave_cliente: t
+        for t in Transacao.objects.filter(usuario_id=usuario_id, chave_cliente__in=chaves)
+    }
+
+    novas, alteradas, resultados = [], [], []
+    for item in itens:
+        transacao = existentes.get(item['chave_cliente'])
+        if transacao is None:
+            transacao = Transacao(usuario_id=usuario_id, chave_cliente=item['chave_cliente'])
+            novas.append(transacao)
+        else:
+            alteradas.append(transacao)
+        for campo in CAMPOS_EDITAVEIS:
+            if campo in item:
+                setattr(transacao, campo, item[campo])
+        resultados.append(transacao)
+
+    # Duplicidade pelo mesmo hash usado na importação, só entre as transações do
+    # usuário. O hash é único no banco todo: se outro usuário já o usa, a linha
+    # só não guarda o hash (como nas recorrências)
+    for transacao in novas:
+        transacao.hash_id = Transacao.gerar_hash(transacao.data, transacao.valor, transacao.descricao)
+    hashes = [t.hash_id for t in novas]
+    vistos = set(Transacao.objects.filter(usuario_id=usuario_id, hash_id__in=hashes).values_list('hash_id', flat=True))
+    de_outros = set(
+        Transacao.objects.filter(hash_id__in=hashes).exclude(usuario_id=usuario_id).values_list('hash_id', flat=True)
+    )
+    duplicadas = set()
+    for transacao in novas:
+        if transacao.hash_id in vistos:
+            duplicadas.add(transacao.chave_cliente)
+            continue
+        vistos.add(transacao.hash_id)  # Duplicatas dentro do próprio lote
+        if transacao.hash_id in de_outros:
+            transacao.hash_id = None
+    novas = [t for t in novas if t.chave_cliente not in duplicadas]
+
+    # Um reenvio simultâneo do mesmo lote pode inserir as mesmas chaves entre a
+    # leitura acima e este INSERT: os conflitos são ignorados e os ids relidos
+    # pela chave (o que não aparecer bateu no hash de outra linha = duplicada)
+    Transacao.objects.bulk_create(novas, batch_size=500, ignore_conflicts=True)
+    ids_gravados = dict(
+        Transacao.objects.filter(
+            usuario_id=usuario_id, chave_cliente__in=[t.chave_cliente for t in novas],
+        ).values_list('chave_cliente', 'id')
+    ) if novas else {}
+    for transacao in novas:
+        transacao.id = ids_gravados.get(transacao.chave_cliente)
+        if transacao.id is None:
+            duplicadas.add(transacao.chave_cliente)
+
+    agora = timezone.now()
+    for transacao in alteradas:
+        transacao.atualizado_em = agora
+    Transacao.objects.bulk_update(alteradas, CAMPOS_EDITAVEIS + ['atualizado_em'], batch_size=500)
+
+    ids_novas = {id(t) for t in novas}
+    return [
+        {
+            'chave_cliente': t.chave_cliente,
+            'id': None if t.chave_cliente in duplicadas else t.id,
+            'status': ('duplicada' if t.chave_cliente in duplicadas
+                       else 'criada' if id(t) in ids_novas else 'atualizada'),
+        }
+        for t in resultados
+    ]
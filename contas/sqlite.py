@@ -0,0 +1,24 @@
+"""
+Ajustes do SQLite para quando o app roda num único servidor sem Postgres.
+
+Os PRAGMAs (settings.SQLITE_PRAGMAS) são aplicados em cada conexão nova, de qualquer
+processo, quando settings.SQLITE_OTIMIZADO está ligado (ver signals.py):
+- journal_mode=WAL: leitores não esperam o escritor (a importação não trava o painel);
+- synchronous=NORMAL: seguro com WAL; só o último commit pode se perder numa queda de energia;
+- mmap_size / cache_size: leituras servidas da memória;
+- busy_timeout: espera o lock em vez de falhar com "database is locked";
+- temp_store=MEMORY: ordenações e tabelas temporárias fora do disco.
+"""
+
+
+def aplicar_pragmas(cursor, pragmas):
+    for nome, valor in pragmas.items():
+        cursor.execute(f'PRAGMA {nome} = {valor}')
+
+
+def manutencao(cursor):
+    """PRAGMA optimize + checkpoint do WAL. Retorna (páginas no WAL, páginas copiadas)."""
+    cursor.execute('PRAGMA optimize')
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    _, paginas_wal, copiadas = cursor.fetchone()
+    return paginas_wal, copiadas
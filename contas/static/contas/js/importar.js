@@ -0,0 +1,118 @@
+// Envio do extrato com a prévia em stream (SSE): cada transação aparece assim que a IA a gera.
+
+document.addEventListener("DOMContentLoaded", function() {
+    const formUpload = document.getElementById('formUpload');
+    const formPreview = document.getElementById('formPreview');
+    const linhas = document.getElementById('linhasPreview');
+    const modelo = document.getElementById('modeloLinha');
+    const status = document.getElementById('statusStream');
+    const btnConfirmar = document.getElementById('btnConfirmar');
+    const btnProcessar = document.getElementById('btnProcessar');
+
+    // Sem suporte a leitura de stream: fica o envio tradicional do formulário
+    if (!window.fetch || !window.ReadableStream || !window.TextDecoder) return;
+
+    function adicionarLinha(t) {
+        const linha = modelo.content.firstElementChild.cloneNode(true);
+        linha.querySelector('[name="data"]').value = t.data;
+        linha.querySelector('[name="descricao"]').value = t.descricao;
+        linha.querySelector('[name="valor"]').value = Number(t.valor).toFixed(2);
+        linha.querySelector('[name="tipo"]').value = t.tipo;
+
+        const selectCat = linha.querySelector('[name="categoria"]');
+        const opcao = Array.from(selectCat.options).find(o => o.text.trim() === t.categoria);
+        if (opcao) {
+            opcao.selected = true;
+        } else if (t.categoria === 'Importados') {
+            selectCat.add(new Option('Importados (Novo)', '', true, true));
+        }
+        linhas.appendChild(linha);
+    }
+
+    function processarEvento(bloco, estado) {
+        let nome = 'message';
+        let dados = '';
+        bloco.split('\n').forEach(l => {
+            if (l.startsWith('event:')) nome = l.slice(6).trim();
+            else if (l.startsWith('data:')) dados += l.slice(5).trim();
+        });
+        if (!dados) return;
+        const payload = JSON.parse(dados);
+
+        if (nome === 'transacao') {
+            if (estado.total === 0) {
+                estado.primeira = ((performance.now() - estado.inicio) / 1000).toFixed(1);
+                formPreview.style.display = '';
+            }
+            estado.total++;
+            adicionarLinha(payload);
+            status.textContent = `${estado.total} recebidas (primeira em ${estado.primeira}s)...`;
+        } else if (nome === 'fim') {
+            estado.encerrado = true;
+            status.textContent = `${payload.total} transações (primeira em ${estado.primeira}s)`;
+            btnConfirmar.disabled = false;
+            if (payload.total === 0) {
+                alert('A IA não encontrou transações ou houve um erro.');
+                window.location.reload();
+            }
+        } else if (nome === 'erro') {
+            falhar(payload.mensagem, estado);
+        }
+    }
+
+    // Erro do servidor, rede fora do ar ou stream cortado: sem nada recebido volta ao
+    // formulário; com a prévia parcial, libera a confirmação do que chegou
+    function falhar(mensagem, estado) {
+        estado.encerrado = true;
+        alert(mensagem);
+        if (estado.total === 0) {
+            window.location.reload();
+            return;
+        }
+        status.textContent = `${estado.total} transações recebidas antes do erro (a lista pode estar incompleta)`;
+        btnConfirmar.disabled = false;
+    }
+
+    formUpload.addEventListener('submit', async function(evento) {
+        evento.preventDefault();
+        btnProcessar.disabled = true;
+        btnProcessar.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Lendo extrato...';
+        btnConfirmar.disabled = true;
+
+        const estado = { total: 0, inicio: performance.now(), primeira: null, encerrado: false };
+        try {
+            const resposta = await fetch(formUpload.dataset.urlStream, {
+                method: 'POST',
+                body: new FormData(formUpload),
+                credentials: 'same-origin'
+            });
+
+            // Erro de validação: reenvia do jeito tradicional para mostrar os erros no form
+            if (!resposta.ok) {
+                formUpload.submit();
+                return;
+            }
+
+            document.getElementById('cardUpload').style.display = 'none';
+            const leitor = resposta.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await leitor.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let fim;
+                while ((fim = buffer.indexOf('\n\n')) >= 0) {
+                    processarEvento(buffer.slice(0, fim), estado);
+                    buffer = buffer.slice(fim + 2);
+                }
+            }
+
+            // O stream terminou sem "fim" nem "erro" (worker reiniciado, proxy cortou a conexão...)
+            if (!estado.encerrado) falhar('A leitura do extrato foi interrompida.', estado);
+        } catch (erro) {
+            // fetch rejeitado (sem rede) ou leitura abortada no meio do stream
+            if (!estado.encerrado) falhar('Não foi possível ler o extrato. Verifique a conexão e tente de novo.', estado);
+        }
+    });
+});
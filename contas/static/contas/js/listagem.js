@@ -0,0 +1,253 @@
+// Painel da listagem: busca os dados na API e desenha resumo, gráficos e tabela.
+// As URLs vêm dos atributos data-* da própria tag <script> (ver listagem.html).
+const urls = document.currentScript.dataset;
+
+document.addEventListener("DOMContentLoaded", function() {
+    // --- 1. INICIALIZAÇÃO ---
+    const filtrosForm = document.getElementById('filtrosForm');
+    const loadingDiv = document.getElementById('loading');
+    const conteudoDiv = document.getElementById('conteudo');
+
+    let chartFluxo, chartReceitasCat, chartDespesasCat;
+
+    // --- 2. FUNÇÕES DE RENDERIZAÇÃO ---
+    function formatarMoeda(valor) {
+        // Valores em dinheiro podem chegar como texto ("10.50"): Decimal no json_script e nos serializers
+        return Number(valor).toLocaleString('pt-BR', { style: 'currency', currency: 'BRL' });
+    }
+
+    function renderizarResumo(data) {
+        const saldoEl = document.getElementById('saldo');
+        saldoEl.textContent = formatarMoeda(data.saldo);
+        saldoEl.className = `display-3 fw-bold ${Number(data.saldo) < 0 ? 'text-danger' : 'text-primary'}`;
+        document.getElementById('totalReceitas').textContent = formatarMoeda(data.total_receitas);
+        document.getElementById('totalDespesas').textContent = formatarMoeda(data.total_despesas);
+    }
+
+    function renderizarTabela(transacoes) {
+        const tbody = document.getElementById('tabelaTransacoes');
+        tbody.innerHTML = '';
+
+        if (transacoes.length === 0) {
+            tbody.innerHTML = `<tr><td colspan="7" class="text-center py-5 text-muted">Nenhuma transação encontrada.</td></tr>`;
+            return;
+        }
+
+        transacoes.forEach(t => {
+            const valorFormatado = formatarMoeda(t.valor);
+            const classeValor = t.tipo === 'D' ? 'text-danger' : 'text-success';
+            const sinal = t.tipo === 'D' ? '-' : '';
+            const dataFormatada = new Date(t.data + 'T00:00:00').toLocaleDateString('pt-BR');
+
+            const row = `
+                <tr>
+                    <td><input type="checkbox" class="form-check-input sel-transacao" value="${t.id}"></td>
+                    <td class="text-muted" style="width: 120px;">${dataFormatada}</td>
+                    <td class="fw-bold text-dark">${t.descricao || '-'}</td>
+                    <td><span class="badge bg-light text-dark border">${t.categoria ? t.categoria.nome : 'Sem categoria'}</span></td>
+                    <td class="small text-muted">${t.conta.nome}</td>
+                    <td class="text-end fw-bold ${classeValor}">
+                        ${sinal} ${valorFormatado}
+                    </td>
+                    <td class="text-center">
+                        <a href="/update/${t.id}/" class="btn btn-sm btn-link text-secondary"><i class="bi bi-pencil"></i></a>
+                        <a href="/delete/${t.id}/" class="btn btn-sm btn-link text-danger"><i class="bi bi-trash"></i></a>
+                    </td>
+                </tr>`;
+            tbody.innerHTML += row;
+        });
+        atualizarBarraLote();
+    }
+
+    // --- AÇÕES EM LOTE ---
+    const opcoesLote = JSON.parse(document.getElementById('opcoes-lote').textContent);
+    const barraLote = document.getElementById('barraLote');
+    const loteOperacao = document.getElementById('loteOperacao');
+    const loteValor = document.getElementById('loteValor');
+
+    function idsSelecionados() {
+        return Array.from(document.querySelectorAll('.sel-transacao:checked')).map(c => Number(c.value));
+    }
+
+    function atualizarBarraLote() {
+        const qtd = idsSelecionados().length;
+        barraLote.style.setProperty('display', qtd ? 'flex' : 'none', 'important');
+        document.getElementById('qtdSelecionadas').textContent = `${qtd} selecionada(s)`;
+        if (!qtd) document.getElementById('selecionarTodas').checked = false;
+    }
+
+    function preencherValoresLote() {
+        const opcoes = {
+            categoria: [['', 'Sem categoria'], ...opcoesLote.categorias],
+            conta: opcoesLote.contas,
+            tipo: [['D', 'Despesa'], ['R', 'Receita']],
+            excluir: []
+        }[loteOperacao.value];
+        loteValor.innerHTML = '';
+        opcoes.forEach(([valor, nome]) => loteValor.add(new Option(nome, valor)));
+        loteValor.style.display = opcoes.length ? '' : 'none';
+    }
+
+    async function aplicarLote() {
+        const ids = idsSelecionados();
+        const operacao = loteOperacao.value;
+        if (!ids.length) return;
+        if (operacao === 'excluir' && !confirm(`Excluir ${ids.length} transação(ões)?`)) return;
+
+        const response = await fetch(urls.lote, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+                'Content-Type': 'application/json'
+            },
+            credentials: 'same-origin',
+            body: JSON.stringify({ ids, operacao, valor: loteValor.value })
+        });
+        if (!response.ok) {
+            alert('Não foi possível aplicar a alteração.');
+            return;
+        }
+        buscarDados();
+    }
+
+    document.getElementById('selecionarTodas').addEventListener('change', function() {
+        document.querySelectorAll('.sel-transacao').forEach(c => c.checked = this.checked);
+        atualizarBarraLote();
+    });
+    document.getElementById('tabelaTransacoes').addEventListener('change', function(e) {
+        if (e.target.classList.contains('sel-transacao')) atualizarBarraLote();
+    });
+    loteOperacao.addEventListener('change', preencherValoresLote);
+    document.getElementById('btnAplicarLote').addEventListener('click', aplicarLote);
+    preencherValoresLote();
+
+    function renderizarGraficos(data) {
+        if (chartFluxo) chartFluxo.destroy();
+        if (chartReceitasCat) chartReceitasCat.destroy();
+        if (chartDespesasCat) chartDespesasCat.destroy();
+
+        chartFluxo = new Chart(document.getElementById("chartFluxo"), {
+            type: 'bar',
+            data: {
+                labels: data.grafico_labels,
+                datasets: [
+                    { label: 'Receitas', data: data.grafico_receitas, backgroundColor: '#198754', borderRadius: 4 },
+                    { label: 'Despesas', data: data.grafico_despesas, backgroundColor: '#dc3545', borderRadius: 4 }
+                ]
+            },
+            options: { responsive: true, maintainAspectRatio: false, scales: { y: { beginAtZero: true }, x: { grid: { display: false } } } }
+        });
+
+        chartReceitasCat = new Chart(document.getElementById("chartReceitasCat"), {
+            type: 'doughnut',
+            data: {
+                labels: data.cat_receitas_labels,
+                datasets: [{ data: data.cat_receitas_data, backgroundColor: ['#20c997', '#198754', '#0f5132', '#75b798', '#a3cfbb'], borderWidth: 0 }]
+            },
+            options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { position: 'right' } } }
+        });
+
+        chartDespesasCat = new Chart(document.getElementById("chartDespesasCat"), {
+            type: 'doughnut',
+            data: {
+                labels: data.cat_despesas_labels,
+                datasets: [{ data: data.cat_despesas_data, backgroundColor: ['#dc3545', '#b02a37', '#842029', '#ea868f', '#f1aeb5'], borderWidth: 0 }]
+            },
+            options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { position: 'right' } } }
+        });
+    }
+
+    // --- 3. BUSCAR DADOS (VERSÃO SEGURA - SEM JWT) ---
+
+    // ✅ Pega o CSRF token do cookie (Django injeta automaticamente)
+    function getCookie(name) {
+        let cookieValue = null;
+        if (document.cookie && document.cookie !== '') {
+            const cookies = document.cookie.split(';');
+            for (let i = 0; i < cookies.length; i++) {
+                const cookie = cookies[i].trim();
+                if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                    cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                    break;
+                }
+            }
+        }
+        return cookieValue;
+    }
+
+    async function buscarDados() {
+        loadingDiv.style.display = 'block';
+        conteudoDiv.style.visibility = 'hidden';
+
+        const ano = document.getElementById('filtroAno').value;
+        const mes = document.getElementById('filtroMes').value;
+        const anoInteiro = document.getElementById('chkAno').checked;
+        document.getElementById('filtroMes').disabled = anoInteiro;
+
+        const url = `${urls.api}?ano=${ano}&mes=${mes}&ano_inteiro=${anoInteiro}`;
+
+        try {
+            // ✅ FETCH SEGURO: Usa cookie de sessão automaticamente
+            // Não precisa de Authorization header, o navegador envia o cookie sessionid
+            const response = await fetch(url, {
+                method: 'GET',
+                headers: {
+                    'X-CSRFToken': getCookie('csrftoken'),  // CSRF protection
+                    'Content-Type': 'application/json'
+                },
+                credentials: 'same-origin'  // ✅ IMPORTANTE: Envia cookies
+            });
+
+            if (response.status === 403) {
+                // Se não estiver autenticado, redireciona para login
+                window.location.href = urls.login + "?next=" + window.location.pathname;
+                return;
+            }
+
+            if (!response.ok) {
+                throw new Error(`Erro HTTP: ${response.status}`);
+            }
+
+            renderizarPainel(await response.json());
+
+        } catch (error) {
+            console.error("Erro ao buscar dados:", error);
+            document.getElementById('tabelaTransacoes').innerHTML =
+                `<tr><td colspan="7" class="text-center py-5 text-danger">
+                    Ocorreu um erro ao carregar os dados. Tente recarregar a página.
+                </td></tr>`;
+        } finally {
+            loadingDiv.style.display = 'none';
+            conteudoDiv.style.visibility = 'visible';
+        }
+    }
+
+    function renderizarPainel(data) {
+        renderizarResumo(data);
+        renderizarTabela(data.transacoes);
+        renderizarGraficos(data);
+    }
+
+    // --- 4. EVENTOS ---
+    filtrosForm.addEventListener('change', buscarDados);
+
+    // O período inicial já veio no HTML (json_script): desenha sem ir à API
+    let buscarNaApi = false;
+    try {
+        renderizarPainel(JSON.parse(document.getElementById('painel-inicial').textContent));
+    } catch (error) {
+        console.error("Erro ao desenhar o painel inicial:", error);
+        buscarNaApi = true;
+    } finally {
+        conteudoDiv.style.visibility = 'visible';
+    }
+    // Se o painel embutido falhar, busca pela API (que mostra a linha de erro se falhar também)
+    if (buscarNaApi) buscarDados();
+
+    // Tempo até o painel aparecer, contado do início da navegação
+    requestAnimationFrame(function() {
+        performance.mark('painel-visivel');
+        const medida = performance.measure('painel-primeira-pintura', { start: 0, end: 'painel-visivel' });
+        console.info(`Painel visível em ${Math.round(medida.duration)} ms`);
+    });
+});
@@ -1,3 +1,1228 @@
-from django.test import TestCase
+import io
+import json
+import multiprocessing
+import re
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from . import governador, recorrencias, sincronizacao
+from .admin import PaginadorEstimado
+from .importacao_lote import LoteInvalido, expandir_uploads, mesclar
+from .models import Categoria, Conta, Exclusao, GastoCategoria, Recorrencia, Transacao, TransacaoQuerySet
+from .orcamentos import reconciliar
+from .painel import calcular_painel
+from .referencias import obter_referencias
+from .governador import ClienteFalso, IAOcupada
+from .utils import ArquivoNaoSuportado, ParserArrayJSON, extrair_transacoes_stream, preprocessar_imagem
+
+
+GOVERNADOR_TESTE = {
+    'REQUISICOES_POR_MINUTO': 0,
+    'MAX_SIMULTANEAS': 2,
+    'MAX_POR_USUARIO': 1,
+    'ESPERA_MAXIMA': 0,
+    'TENTATIVAS': 3,
+    'BACKOFF_BASE': 0,
+}
+
+
+def _incrementar_varias_vezes():
+    # Roda num processo filho (fork): no cache em disco, só a trava de arquivo evita perder incrementos
+    for _ in range(50):
+        governador._incrementar('ia:teste')
+
+
+@override_settings(GEMINI_GOVERNADOR=GOVERNADOR_TESTE)
+class GovernadorIATests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cliente = ClienteFalso()
+        governador._cliente = self.cliente
+        self.addCleanup(governador.redefinir_cliente)
+
+    def test_retenta_apos_429(self):
+        self.cliente.falhas = 2
+        resposta = governador.executar(lambda c: c.models.generate_content(), usuario_id=1)
+        self.assertIn('Transação simulada', resposta.text)
+        self.assertEqual(self.cliente.chamadas, 3)
+        self.assertEqual(governador.metricas()['retentativas'], 2)
+
+    def test_429_persistente_vira_ia_ocupada(self):
+        self.cliente.falhas = 10
+        with self.assertRaises(IAOcupada):
+            governador.executar(lambda c: c.models.generate_content(), usuario_id=1)
+        self.assertEqual(self.cliente.chamadas, 3)
+
+    def test_outros_erros_nao_sao_retentados(self):
+        def falha(cliente):
+            raise ValueError("erro qualquer")
+
+        with self.assertRaises(ValueError):
+            governador.executar(falha, usuario_id=1)
+
+    def test_limite_por_usuario(self):
+        with governador.reservar(usuario_id=1):
+            with self.assertRaises(IAOcupada):
+                with governador.reservar(usuario_id=1):
+                    pass
+            # Outro usuário ainda tem vaga
+            with governador.reservar(usuario_id=2):
+                pass
+        # A vaga foi devolvida
+        with governador.reservar(usuario_id=1):
+            pass
+
+    def test_limite_global(self):
+        with governador.reservar(usuario_id=1), governador.reservar(usuario_id=2):
+            with self.assertRaises(IAOcupada):
+                with governador.reservar(usuario_id=3):
+                    pass
+        self.assertEqual(governador.metricas()['rejeicoes'], 1)
+
+    @override_settings(GEMINI_GOVERNADOR={**GOVERNADOR_TESTE, 'REQUISICOES_POR_MINUTO': 2})
+    def test_cada_chamada_ao_provedor_leva_um_token(self):
+        # Uma reserva só (como numa importação): upload e geração já gastam os 2 tokens
+        with governador.reservar(usuario_id=1):
+            governador.com_retentativas(lambda c: c.files.upload(file='extrato.pdf'))
+            governador.com_retentativas(lambda c: c.models.generate_content())
+            with self.assertRaises(IAOcupada):
+                governador.com_retentativas(lambda c: c.models.generate_content())
+        self.assertEqual(self.cliente.chamadas, 2)
+
+    @override_settings(GEMINI_GOVERNADOR={**GOVERNADOR_TESTE, 'REQUISICOES_POR_MINUTO': 2})
+    def test_retentativas_tambem_levam_token(self):
+        self.cliente.falhas = 10
+        with self.assertRaises(IAOcupada):
+            governador.executar(lambda c: c.models.generate_content(), usuario_id=1)
+        # A terceira tentativa já não tinha token
+        self.assertEqual(self.cliente.chamadas, 2)
+
+    def test_contadores_sem_redis_entre_processos(self):
+        contexto = multiprocessing.get_context('fork')
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio)
+        disco = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': diretorio}
+
+        with override_settings(CACHES={**settings.CACHES, 'disco': disco},
+                               GEMINI_GOVERNADOR={**GOVERNADOR_TESTE, 'CACHE': 'disco'}):
+            processos = [contexto.Process(target=_incrementar_varias_vezes) for _ in range(4)]
+            for processo in processos:
+                processo.start()
+            for processo in processos:
+                processo.join()
+            self.assertEqual(caches['disco'].get('ia:teste'), 4 * 50)
+
+    @override_settings(GEMINI_GOVERNADOR={**GOVERNADOR_TESTE, 'REQUISICOES_POR_MINUTO': 60})
+    def test_balde_repoe_aos_poucos(self):
+        # 60/min = um token por segundo, no máximo 60 de uma vez
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertEqual(sum(governador._consumir_token() for _ in range(70)), 60)
+        with mock.patch('time.time', return_value=1001.0):
+            self.assertTrue(governador._consumir_token())
+            self.assertFalse(governador._consumir_token())
+        # Sem estouro na virada do minuto: 30s depois, só 30 tokens voltaram
+        with mock.patch('time.time', return_value=1031.0):
+            self.assertEqual(sum(governador._consumir_token() for _ in range(60)), 30)
+
+
+class PreprocessarImagemTests(SimpleTestCase):
+
+    def _imagem(self, tamanho=(200, 100), modo='RGB', cor='black', formato='PNG', **opcoes):
+        from PIL import Image
+        saida = io.BytesIO()
+        Image.new(modo, tamanho, cor).save(saida, formato, **opcoes)
+        saida.seek(0)
+        return saida
+
+    def _abrir(self, dados):
+        from PIL import Image
+        return Image.open(io.BytesIO(dados))
+
+    def test_corrige_orientacao_exif(self):
+        from PIL import Image
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: girar 90°
+        imagem = self._abrir(preprocessar_imagem(self._imagem(formato='JPEG', exif=exif)))
+        self.assertEqual(imagem.size, (100, 200))
+
+    def test_transparencia_vira_fundo_branco(self):
+        imagem = self._abrir(preprocessar_imagem(self._imagem(modo='RGBA', cor=(0, 0, 0, 0))))
+        self.assertEqual(imagem.mode, 'L')
+        self.assertGreater(imagem.getpixel((10, 10)), 250)
+
+    def test_reduz_para_o_dpi_de_uma_pagina_a4(self):
+        original = self._imagem(tamanho=(4000, 3000), cor='white', formato='BMP')
+        tamanho_original = len(original.getvalue())
+        dados = preprocessar_imagem(original, dpi=100)
+        imagem = self._abrir(dados)
+        self.assertEqual(imagem.format, 'JPEG')
+        self.assertEqual(max(imagem.size), 1170)  # 11.7 pol x 100 dpi
+        self.assertLess(len(dados), tamanho_original)
+
+    def test_arquivo_invalido_retorna_none(self):
+        self.assertIsNone(preprocessar_imagem(io.BytesIO(b'nao e uma imagem')))
+
+
+RESPOSTA_IA = '```json\n' + json.dumps([
+    {'data': '2025-01-10', 'descricao': 'Loja [centro], "filial" {2}', 'valor': 10.5, 'tipo': 'D', 'categoria': 'Mercado'},
+    {'data': '2025-01-11', 'descricao': 'Pix ] , [', 'valor': 99, 'tipo': 'R'},
+], ensure_ascii=False, indent=2) + '\n```'
+
+
+class ParserArrayJSONTests(SimpleTestCase):
+
+    def _alimentar(self, texto, tamanho):
+        parser = ParserArrayJSON()
+        elementos = []
+        for inicio in range(0, len(texto), tamanho):
+            elementos.extend(parser.alimentar(texto[inicio:inicio + tamanho]))
+        return parser, elementos
+
+    def test_qualquer_fronteira_de_pedaco(self):
+        esperado = json.loads(RESPOSTA_IA[len('```json'):-len('```')])
+        for tamanho in (1, 2, 3, 7, 40, len(RESPOSTA_IA)):
+            parser, elementos = self._alimentar(RESPOSTA_IA, tamanho)
+            self.assertEqual(elementos, esperado, tamanho)
+            self.assertTrue(parser.terminou)
+
+    def test_entrega_cada_elemento_assim_que_fecha(self):
+        parser = ParserArrayJSON()
+        self.assertEqual(parser.alimentar('[{"a": "x]"}, {"b"'), [{'a': 'x]'}])
+        self.assertEqual(parser.alimentar(': 1}]'), [{'b': 1}])
+
+    def test_ignora_o_que_vem_depois_do_fim(self):
+        parser = ParserArrayJSON()
+        self.assertEqual(parser.alimentar('[{"a": 1}] [{"b": 2}]'), [{'a': 1}])
+        self.assertEqual(parser.alimentar('[{"c": 3}]'), [])
+
+
+@override_settings(GEMINI_GOVERNADOR=GOVERNADOR_TESTE)
+class ExtrairTransacoesStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        governador._cliente = ClienteFalso(resposta=RESPOSTA_IA)
+        self.addCleanup(governador.redefinir_cliente)
+
+    def test_transacoes_normalizadas_do_stream(self):
+        arquivo = SimpleUploadedFile('extrato.pdf', b'%PDF-1.4')
+        transacoes = list(extrair_transacoes_stream(arquivo, ['Mercado'], usuario_id=1))
+        self.assertEqual(transacoes, [
+            {'data': '2025-01-10', 'descricao': 'Loja [centro], "filial" {2}', 'valor': 10.5, 'tipo': 'D',
+             'categoria': 'Mercado'},
+            {'data': '2025-01-11', 'descricao': 'Pix ] , [', 'valor': 99.0, 'tipo': 'R', 'categoria': 'Importados'},
+        ])
+        self.assertEqual(governador.metricas()['ativas'], 0)  # Vaga devolvida
+
+    def test_item_invalido_e_ignorado(self):
+        governador._cliente.resposta = json.dumps([
+            {'data': '10/01/2025', 'descricao': 'x', 'valor': 1, 'tipo': 'D'},
+            {'descricao': 'sem data', 'valor': 1, 'tipo': 'D'},
+            {'data': '2025-01-12', 'descricao': 'ok', 'valor': '2.5', 'tipo': 'D'},
+        ])
+        arquivo = SimpleUploadedFile('extrato.pdf', b'%PDF-1.4')
+        with self.assertLogs('contas.utils', 'WARNING'):
+            transacoes = list(extrair_transacoes_stream(arquivo, [], usuario_id=1))
+        self.assertEqual([t['descricao'] for t in transacoes], ['ok'])
+
+    def test_tiff_vai_para_a_ia_como_jpeg(self):
+        from PIL import Image
+        original = io.BytesIO()
+        Image.new('L', (8, 8), 'white').save(original, 'TIFF')  # Pequeno: o JPEG nem fica menor
+        arquivo = SimpleUploadedFile('extrato.tif', original.getvalue())
+        with mock.patch.object(governador._cliente.files, 'upload', wraps=governador._cliente.files.upload) as upload:
+            self.assertEqual(len(list(extrair_transacoes_stream(arquivo, ['Mercado'], usuario_id=1))), 2)
+        self.assertEqual(upload.call_args.kwargs['config'].mime_type, 'image/jpeg')
+
+    def test_bmp_ilegivel_e_recusado_sem_chamar_a_ia(self):
+        arquivo = SimpleUploadedFile('extrato.bmp', b'nao e uma imagem')
+        with self.assertRaises(ArquivoNaoSuportado), self.assertLogs('contas.utils', 'WARNING'):
+            list(extrair_transacoes_stream(arquivo, ['Mercado'], usuario_id=1))
+        self.assertEqual(governador._cliente.chamadas, 0)
+        self.assertEqual(governador.metricas()['ativas'], 0)
+
+
+@override_settings(GEMINI_GOVERNADOR=GOVERNADOR_TESTE, SECURE_SSL_REDIRECT=False)
+class ImportarExtratoStreamTests(TestCase):
+    url = '/importar/stream/'
+
+    def setUp(self):
+        cache.clear()
+        governador._cliente = ClienteFalso(resposta=RESPOSTA_IA)
+        self.addCleanup(governador.redefinir_cliente)
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.conta = Conta.objects.create(usuario=self.usuario, nome='Nubank')
+        Categoria.objects.create(usuario=self.usuario, nome='Mercado')
+        self.client.force_login(self.usuario)
+
+    def _eventos(self, resposta):
+        """[(nome, dados)] dos eventos SSE, consumindo o StreamingHttpResponse inteiro."""
+        self.assertTrue(resposta.streaming)
+        corpo = b''.join(resposta.streaming_content).decode()
+        eventos = []
+        for bloco in filter(None, corpo.split('\n\n')):
+            nome, dados = bloco.split('\n')
+            eventos.append((nome.removeprefix('event: '), json.loads(dados.removeprefix('data: '))))
+        return eventos
+
+    def _enviar(self, **campos):
+        dados = {'arquivo': SimpleUploadedFile('extrato.pdf', b'%PDF-1.4'), 'conta': self.conta.id}
+        return self.client.post(self.url, {**dados, **campos})
+
+    def test_transacoes_e_depois_o_fim(self):
+        resposta = self._enviar()
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        eventos = self._eventos(resposta)
+        self.assertEqual([nome for nome, _ in eventos], ['transacao', 'transacao', 'fim'])
+        self.assertEqual(eventos[0][1]['categoria'], 'Mercado')
+        self.assertEqual(eventos[-1][1], {'total': 2})
+        self.assertEqual(self.client.session['conta_temp_id'], self.conta.id)
+
+    def test_falha_no_meio_vira_evento_de_erro(self):
+        def extrair(*args):
+            yield {'data': '2025-01-10', 'descricao': 'ok', 'valor': 1.0, 'tipo': 'D', 'categoria': 'Mercado'}
+            raise RuntimeError("conexão com a IA caiu")
+
+        with mock.patch('contas.views.extrair_transacoes_stream', extrair), \
+                self.assertLogs('contas.views', 'ERROR'):
+            eventos = self._eventos(self._enviar())
+        self.assertEqual(eventos, [
+            ('transacao', {'data': '2025-01-10', 'descricao': 'ok', 'valor': 1.0, 'tipo': 'D', 'categoria': 'Mercado'}),
+            ('erro', {'mensagem': "Houve um erro ao processar o extrato."}),
+        ])
+
+    def test_ia_ocupada_avisa_o_motivo(self):
+        def extrair(*args):
+            raise IAOcupada("Muitas importações agora.")
+            yield
+
+        with mock.patch('contas.views.extrair_transacoes_stream', extrair):
+            eventos = self._eventos(self._enviar())
+        self.assertEqual(eventos, [('erro', {'mensagem': "Muitas importações agora."})])
+
+    def test_conta_de_outro_usuario_nao_abre_o_stream(self):
+        alheia = Conta.objects.create(usuario=User.objects.create_user('bia', password='x'), nome='Itaú')
+        resposta = self._enviar(conta=alheia.id)
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('conta', resposta.json()['erros'])
+
+
+class DonoDesnormalizadoTests(TestCase):
+
+    def setUp(self):
+        self.ana = User.objects.create_user('ana', password='x')
+        self.bia = User.objects.create_user('bia', password='x')
+        self.conta = Conta.objects.create(usuario=self.ana, nome='Nubank')
+
+    def test_dono_copiado_da_conta_ao_criar(self):
+        transacao = Transacao.objects.create(conta=self.conta, data='2025-01-10', valor=10, descricao='a')
+        self.assertEqual(transacao.usuario_id, self.ana.id)
+        self.assertEqual(list(Transacao.objects.for_user(self.ana)), [transacao])
+        self.assertFalse(Transacao.objects.for_user(self.bia).exists())
+
+    def test_dono_segue_a_conta_ao_trocar_de_conta(self):
+        transacao = Transacao.objects.create(conta=self.conta, data='2025-01-10', valor=10, descricao='a')
+        transacao.conta = Conta.objects.create(usuario=self.bia, nome='Carteira')
+        transacao.save()
+        transacao.refresh_from_db()
+        self.assertEqual(transacao.usuario_id, self.bia.id)
+
+    def test_dono_segue_a_conta_quando_ela_muda_de_usuario(self):
+        Transacao.objects.create(conta=self.conta, data='2025-01-10', valor=10, descricao='a')
+        Transacao.objects.create(conta=self.conta, data='2025-01-11', valor=20, descricao='b')
+        self.conta.usuario = self.bia
+        self.conta.save()
+        self.assertEqual(Transacao.objects.for_user(self.bia).count(), 2)
+        self.assertFalse(Transacao.objects.for_user(self.ana).exists())
+
+
+class PreencherUsuarioMigrationTests(TransactionTestCase):
+    antes = [('contas', '0007_transacao_usuario')]
+    depois = [('contas', '0008_preencher_transacao_usuario')]
+
+    def _migrar(self, alvo):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(alvo)
+        return executor.loader.project_state(alvo).apps
+
+    def test_preenche_o_dono_das_transacoes_existentes(self):
+        # No fim, volta o banco para a última migração (os demais testes usam o esquema atual)
+        self.addCleanup(self._migrar, MigrationExecutor(connection).loader.graph.leaf_nodes('contas'))
+        apps = self._migrar(self.antes)
+        usuario = apps.get_model('auth', 'User').objects.create(username='ana')
+        conta = apps.get_model('contas', 'Conta').objects.create(usuario_id=usuario.id, nome='Nubank')
+        Transacao7 = apps.get_model('contas', 'Transacao')
+        for dia in (1, 2, 3):
+            Transacao7.objects.create(conta_id=conta.id, data=f'2025-01-0{dia}', valor=dia, descricao=str(dia))
+        self.assertEqual(Transacao7.objects.filter(usuario__isnull=True).count(), 3)
+
+        apps = self._migrar(self.depois)
+        Transacao8 = apps.get_model('contas', 'Transacao')
+        self.assertEqual(Transacao8.objects.filter(usuario_id=usuario.id).count(), 3)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ReferenciasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create_user('ana', password='x')
+        self.bia = User.objects.create_user('bia', password='x')
+        self.conta = Conta.objects.create(usuario=self.ana, nome='Nubank')
+        self.categoria = Categoria.objects.create(usuario=self.ana, nome='Mercado')
+        self.transacao = Transacao.objects.create(conta=self.conta, data='2025-01-10', valor=5, descricao='t')
+        self.client.force_login(self.ana)
+        self.client.get('/nova-transacao/')  # Aquece a sessão e o cache de referências
+
+    def test_formulario_com_cache_quente_nao_consulta_contas_nem_categorias(self):
+        with self.assertNumQueries(1):  # Só o usuário (a sessão cached_db vem do cache)
+            resposta = self.client.get('/nova-transacao/')
+        self.assertContains(resposta, 'Mercado')
+
+    def test_escritas_conferem_o_dono_no_banco(self):
+        # Categoria que mudou de dono sem invalidar este cache (ex.: cache em disco de outra máquina)
+        Categoria.objects.filter(pk=self.categoria.pk).update(usuario=self.bia)
+        self.assertIn(self.categoria.pk, obter_referencias(self.ana.id).nomes_categorias)
+
+        resposta = self.client.post('/api/transacoes/lote/', {
+            'ids': [self.transacao.id], 'operacao': 'categoria', 'valor': str(self.categoria.pk),
+        }, content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+
+        resposta = self.client.post('/api/sync/transacoes/', {'transacoes': [{
+            'chave_cliente': 'k1', 'conta': self.conta.id, 'categoria': self.categoria.pk,
+            'data': '2025-01-10', 'valor': '5.00',
+        }]}, content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+
+        sessao = self.client.session
+        sessao['conta_temp_id'] = self.conta.id
+        sessao.save()
+        resposta = self.client.post('/importar/', {
+            'confirmar_dados': '1', 'data': ['2025-01-05'], 'descricao': ['Café'],
+            'valor': ['7.00'], 'tipo': ['saida'], 'categoria': [str(self.categoria.pk)],
+        })
+        self.assertRedirects(resposta, '/importar/', fetch_redirect_response=False)  # "Erro ao salvar"
+        self.assertFalse(Transacao.objects.filter(categoria=self.categoria).exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TransacoesLoteAPITests(TestCase):
+    url = '/api/transacoes/lote/'
+
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create_user('ana', password='x')
+        self.bia = User.objects.create_user('bia', password='x')
+        self.conta = Conta.objects.create(usuario=self.ana, nome='Nubank')
+        self.outra_conta = Conta.objects.create(usuario=self.ana, nome='Carteira')
+        self.categoria = Categoria.objects.create(usuario=self.ana, nome='Mercado')
+        self.conta_bia = Conta.objects.create(usuario=self.bia, nome='Itaú')
+        self.categoria_bia = Categoria.objects.create(usuario=self.bia, nome='Lazer')
+        self.ids = [
+            Transacao.objects.create(conta=self.conta, data='2025-01-10', valor=i + 1, descricao=f'c{i}').id
+            for i in range(3)
+        ]
+        self.alheia = Transacao.objects.create(conta=self.conta_bia, categoria=self.categoria_bia,
+                                               data='2025-01-10', valor=5, descricao='bia')
+        self.client.force_login(self.ana)
+
+    def _enviar(self, **corpo):
+        return self.client.post(self.url, corpo, content_type='application/json')
+
+    def test_altera_so_as_transacoes_do_usuario(self):
+        resposta = self._enviar(ids=self.ids + [self.alheia.id], operacao='categoria', valor=str(self.categoria.id))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json(), {'operacao': 'categoria', 'afetadas': 3})
+        self.assertEqual(Transacao.objects.filter(categoria=self.categoria).count(), 3)
+        self.alheia.refresh_from_db()
+        self.assertEqual(self.alheia.categoria_id, self.categoria_bia.id)
+
+    def test_exclui_so_as_transacoes_do_usuario(self):
+        resposta = self._enviar(ids=self.ids[:2] + [self.alheia.id], operacao='excluir')
+        self.assertEqual(resposta.json()['afetadas'], 2)
+        self.assertEqual(set(Transacao.objects.values_list('id', flat=True)), {self.ids[2], self.alheia.id})
+
+    def test_ids_so_de_outro_usuario_nao_afetam_nada(self):
+        resposta = self._enviar(ids=[self.alheia.id], operacao='tipo', valor='R')
+        self.assertEqual(resposta.json()['afetadas'], 0)
+        self.alheia.refresh_from_db()
+        self.assertEqual(self.alheia.tipo, 'D')
+
+    def test_destino_de_outro_usuario_e_recusado(self):
+        self.assertEqual(self._enviar(ids=self.ids, operacao='categoria', valor=str(self.categoria_bia.id)).status_code, 400)
+        self.assertEqual(self._enviar(ids=self.ids, operacao='conta', valor=str(self.conta_bia.id)).status_code, 400)
+        self.assertFalse(Transacao.objects.filter(id__in=self.ids, conta=self.conta_bia).exists())
+
+    def test_operacoes_invalidas_retornam_400(self):
+        for corpo in (
+            {'ids': self.ids, 'operacao': 'apagar_tudo'},
+            {'ids': self.ids, 'operacao': 'tipo', 'valor': 'X'},
+            {'ids': self.ids, 'operacao': 'conta'},
+            {'ids': [], 'operacao': 'excluir'},
+            {'ids': ['abc'], 'operacao': 'excluir'},
+        ):
+            self.assertEqual(self._enviar(**corpo).status_code, 400, corpo)
+        self.assertEqual(Transacao.objects.filter(id__in=self.ids).count(), 3)
+
+    def test_remover_categoria_aparece_como_sem_categoria_no_painel(self):
+        self._enviar(ids=self.ids, operacao='categoria', valor=str(self.categoria.id))
+        self._enviar(ids=self.ids, operacao='categoria', valor='')
+        painel = self.client.get('/api/transacoes/?ano=2025&mes=1').json()
+        self.assertEqual([t['categoria'] for t in painel['transacoes']], [None, None, None])
+        self.assertEqual(painel['cat_despesas_labels'], ['Sem categoria'])
+
+    def test_recategorizar_muitas_linhas_custa_poucas_consultas(self):
+        # As linhas se espalham por 12 meses e 3 categorias: o custo não cresce com elas
+        categorias = [self.categoria] + [Categoria.objects.create(usuario=self.ana, nome=f'c{i}') for i in range(2)]
+        ids = [t.id for t in Transacao.objects.bulk_create(
+            Transacao(conta=self.conta, usuario=self.ana, categoria=categorias[i % 3], data=date(2024, i % 12 + 1, 5),
+                      valor=Decimal('1.50'), descricao=f'lote{i}')
+            for i in range(600)
+        )]
+        destino = Categoria.objects.create(usuario=self.ana, nome='Destino')
+        self._enviar(ids=self.ids, operacao='tipo', valor='D')  # Aquece a sessão
+
+        # Usuário, contas e categorias (o dono é conferido no banco), SELECT agrupado, UPDATE,
+        # 2 nos contadores (INSERT e UPDATE com CASE) e 4 de savepoint
+        with self.assertNumQueries(11):
+            resposta = self._enviar(ids=ids, operacao='categoria', valor=str(destino.id))
+        self.assertEqual(resposta.json()['afetadas'], 600)
+        self.assertEqual(reconciliar(), [])
+        self.assertEqual(GastoCategoria.objects.get(categoria=destino, mes=date(2024, 3, 1)).quantidade, 50)
+
+    def test_exige_login(self):
+        self.client.logout()
+        self.assertIn(self._enviar(ids=self.ids, operacao='excluir').status_code, (401, 403))
+        self.assertEqual(Transacao.objects.filter(id__in=self.ids).count(), 3)
+
+
+class ExclusaoUsuarioTests(TestCase):
+
+    def setUp(self):
+        self.ana = User.objects.create_user('ana', password='x')
+        conta = Conta.objects.create(usuario=self.ana, nome='Nubank')
+        categoria = Categoria.objects.create(usuario=self.ana, nome='Mercado')
+        for dia in (1, 2):
+            Transacao.objects.create(conta=conta, categoria=categoria, data=f'2025-01-0{dia}', valor=dia, descricao=str(dia))
+
+    def _conferir_banco(self):
+        # FKs do SQLite só são conferidas no COMMIT: força a conferência aqui
+        connection.check_constraints()
+        self.assertFalse(Exclusao.objects.exists())
+        self.assertFalse(Transacao.objects.exists())
+
+    def test_excluir_usuario_com_contas_e_transacoes(self):
+        self.ana.delete()
+        self._conferir_banco()
+
+    def test_excluir_usuarios_em_massa(self):
+        User.objects.filter(username='ana').delete()
+        self._conferir_banco()
+
+    def test_excluir_so_a_conta_ainda_registra_marcas(self):
+        Conta.objects.get().delete()
+        connection.check_constraints()
+        self.assertEqual(
+            sorted(Exclusao.objects.values_list('modelo', flat=True)),
+            [Exclusao.CONTA, Exclusao.TRANSACAO, Exclusao.TRANSACAO],
+        )
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, SINCRONIZACAO_MARGEM_SEGUNDOS=0)
+class SincronizacaoAPITests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create_user('ana', password='x')
+        self.bia = User.objects.create_user('bia', password='x')
+        self.conta = Conta.objects.create(usuario=self.ana, nome='Nubank')
+        Conta.objects.create(usuario=self.bia, nome='Itaú')
+        self.ids = [
+            Transacao.objects.create(conta=self.conta, data='2025-01-10', valor=i + 1, descricao=f's{i}').id
+            for i in range(5)
+        ]
+        self.client.force_login(self.ana)
+
+    def _sincronizar(self, cursor='', limite=None):
+        parametros = {'cursor': cursor}
+        if limite:
+            parametros['limite'] = limite
+        return self.client.get('/api/sync/', parametros)
+
+    def _enviar(self, itens):
+        return self.client.post('/api/sync/transacoes/', {'transacoes': itens}, content_type='application/json')
+
+    def test_paginacao_ate_o_fim(self):
+        recebidas, cursor, paginas = [], '', 0
+        while True:
+            dados = self._sincronizar(cursor, limite=2).json()
+            recebidas += [t['id'] for t in dados['transacoes']]
+            cursor, paginas = dados['cursor'], paginas + 1
+            if not dados['tem_mais']:
+                break
+        self.assertEqual(recebidas, self.ids)
+        self.assertEqual(paginas, 3)
+        # Nada novo: a próxima rodada volta vazia
+        dados = self._sincronizar(cursor).json()
+        self.assertEqual(dados['transacoes'] + dados['contas'] + dados['exclusoes'], [])
+
+    def test_so_devolve_dados_do_usuario(self):
+        dados = self._sincronizar().json()
+        self.assertEqual([c['nome'] for c in dados['contas']], ['Nubank'])
+        self.assertEqual(len(dados['transacoes']), 5)
+
+    def test_cursor_adulterado_ou_de_outro_usuario(self):
+        cursor = self._sincronizar().json()['cursor']
+        self.assertEqual(self._sincronizar(cursor[:-2] + 'xx').status_code, 400)
+        self.assertEqual(self._sincronizar('nao-e-um-cursor').status_code, 400)
+        self.client.force_login(self.bia)
+        self.assertEqual(self._sincronizar(cursor).status_code, 400)
+
+    def test_exclusoes_viram_marcas(self):
+        cursor = self._sincronizar().json()['cursor']
+        Transacao.objects.get(id=self.ids[0]).delete()
+        Transacao.objects.filter(id__in=self.ids[1:3]).delete()
+        dados = self._sincronizar(cursor).json()
+        self.assertEqual(
+            sorted((e['modelo'], e['objeto_id']) for e in dados['exclusoes']),
+            [(Exclusao.TRANSACAO, i) for i in self.ids[:3]],
+        )
+
+    def test_envio_idempotente(self):
+        itens = [{'chave_cliente': f'off-{i}', 'conta': self.conta.id, 'data': '2025-02-01',
+                  'valor': '3.50', 'descricao': f'offline {i}'} for i in range(3)]
+        primeiro = self._enviar(itens).json()['resultados']
+        self.assertEqual([r['status'] for r in primeiro], ['criada'] * 3)
+
+        itens[0]['valor'] = '9.99'
+        segundo = self._enviar(itens).json()['resultados']
+        self.assertEqual([r['status'] for r in segundo], ['atualizada'] * 3)
+        self.assertEqual([r['id'] for r in segundo], [r['id'] for r in primeiro])
+        self.assertEqual(Transacao.objects.filter(chave_cliente__startswith='off-').count(), 3)
+        self.assertEqual(Transacao.objects.get(chave_cliente='off-0').valor, Decimal('9.99'))
+
+    def test_mesmo_conteudo_com_outra_chave_e_duplicada(self):
+        item = {'chave_cliente': 'a', 'conta': self.conta.id, 'data': '2025-01-10', 'valor': '1', 'descricao': 's0'}
+        Transacao.objects.filter(id=self.ids[0]).update(hash_id=Transacao.gerar_hash(date(2025, 1, 10), Decimal('1.00'), 's0'))
+        resultado = self._enviar([item]).json()['resultados'][0]
+        self.assertEqual(resultado, {'chave_cliente': 'a', 'id': None, 'status': 'duplicada'})
+
+    def test_hash_de_outro_usuario_nao_bloqueia(self):
+        # A Bia já tem uma transação com o mesmo dia, valor e descrição
+        conta_bia = Conta.objects.get(usuario=self.bia)
+        Transacao.objects.create(conta=conta_bia, data=date(2025, 4, 1), valor=Decimal('12.00'), descricao='padaria')
+
+        # (repetido no mesmo lote: o segundo é duplicata do primeiro, como sem a colisão)
+        itens = [{'chave_cliente': f'p{i}', 'conta': self.conta.id, 'data': '2025-04-01',
+                  'valor': '12.00', 'descricao': 'padaria'} for i in range(2)]
+        resultados = self._enviar(itens).json()['resultados']
+        self.assertEqual([r['status'] for r in resultados], ['criada', 'duplicada'])
+        criada = Transacao.objects.get(usuario=self.ana, descricao='padaria')
+        self.assertEqual(resultados[0]['id'], criada.id)
+        self.assertIsNone(criada.hash_id)
+
+        # Para a própria Ana, o mesmo conteúdo com outra chave continua duplicado
+        Transacao.objects.create(conta=self.conta, data=date(2025, 4, 2), valor=Decimal('3.00'), descricao='café')
+        item = {'chave_cliente': 'c1', 'conta': self.conta.id, 'data': '2025-04-02', 'valor': '3.00',
+                'descricao': 'café'}
+        self.assertEqual(self._enviar([item]).json()['resultados'][0]['status'], 'duplicada')
+
+    def test_reenvio_simultaneo_nao_quebra(self):
+        # Simula outro worker gravando a mesma chave entre a leitura das chaves e o INSERT
+        bulk_create = TransacaoQuerySet.bulk_create
+
+        def concorrente(queryset, objs, *args, **kwargs):
+            if not Transacao.objects.filter(chave_cliente='k1').exists():
+                Transacao.objects.create(conta=self.conta, chave_cliente='k1', data='2025-03-01',
+                                         valor=Decimal('7.00'), descricao='pix')
+            return bulk_create(queryset, objs, *args, **kwargs)
+
+        item = {'chave_cliente': 'k1', 'conta_id': self.conta.id, 'data': date(2025, 3, 1),
+                'valor': Decimal('7.00'), 'descricao': 'pix'}
+        with mock.patch.object(TransacaoQuerySet, 'bulk_create', concorrente):
+            resultado = sincronizacao.gravar_transacoes(self.ana.id, [item])
+        existente = Transacao.objects.get(chave_cliente='k1')
+        self.assertEqual(resultado, [{'chave_cliente': 'k1', 'id': existente.id, 'status': 'criada'}])
+
+
+# --- IMPORTAÇÃO EM LOTE ---
+def _zip(entradas, criptografadas=()):
+    """Monta um .zip em memória; `criptografadas` marca o bit 0x1 no diretório central."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as pacote:
+        for nome, conteudo in entradas:
+            pacote.writestr(nome, conteudo)
+    dados = bytearray(buffer.getvalue())
+    for nome in criptografadas:
+        inicio = dados.index(b'PK\x01\x02')
+        while True:
+            # Cabeçalho do diretório central: flags em +8, nome em +46
+            tamanho_nome = int.from_bytes(dados[inicio + 28:inicio + 30], 'little')
+            if dados[inicio + 46:inicio + 46 + tamanho_nome] == nome.encode():
+                dados[inicio + 8] |= 0x1
+                break
+            inicio = dados.index(b'PK\x01\x02', inicio + 4)
+    return SimpleUploadedFile('extratos.zip', bytes(dados), content_type='application/zip')
+
+
+class ExpandirUploadsTests(SimpleTestCase):
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+
+    def _nomes(self, *arquivos):
+        return [nome for nome, _, _ in expandir_uploads(arquivos, self.diretorio)]
+
+    def test_extrai_pdfs_e_imagens_do_zip(self):
+        pacote = _zip([('jan.pdf', b'%PDF jan'), ('fotos/fev.png', b'png'), ('leia.txt', b'texto')])
+        entradas = expandir_uploads([pacote], self.diretorio)
+        self.assertEqual([(nome, ext) for nome, _, ext in entradas], [('jan.pdf', '.pdf'), ('fev.png', '.png')])
+        with open(entradas[0][1], 'rb') as arquivo:
+            self.assertEqual(arquivo.read(), b'%PDF jan')
+
+    def test_ignora_zip_aninhado_lixo_e_criptografadas(self):
+        pacote = _zip([
+            ('dentro.zip', b'PK'), ('__MACOSX/._jan.pdf', b'x'), ('.oculto.pdf', b'x'),
+            ('pasta/', b''), ('secreto.pdf', b'%PDF'), ('ok.pdf', b'%PDF'),
+        ], criptografadas=['secreto.pdf'])
+        self.assertEqual(self._nomes(pacote), ['ok.pdf'])
+
+    def test_zip_invalido(self):
+        with self.assertRaisesMessage(LoteInvalido, 'arquivo .zip inválido'):
+            self._nomes(SimpleUploadedFile('quebrado.zip', b'nao e zip'))
+
+    @override_settings(IMPORTACAO_LOTE={'MAX_TAXA_COMPRESSAO': 10})
+    def test_recusa_taxa_de_compressao_suspeita(self):
+        with self.assertRaisesMessage(LoteInvalido, 'taxa de compressão suspeita'):
+            self._nomes(_zip([('bomba.pdf', bytes(1024 * 1024))]))
+
+    @override_settings(IMPORTACAO_LOTE={'MAX_ARQUIVOS': 2})
+    def test_limite_de_arquivos_conta_soltos_e_do_zip(self):
+        solto = SimpleUploadedFile('solto.pdf', b'%PDF')
+        self.assertEqual(len(self._nomes(solto, _zip([('a.pdf', b'%PDF')]))), 2)
+        with self.assertRaisesMessage(LoteInvalido, 'no máximo 2 extratos'):
+            self._nomes(solto, _zip([('a.pdf', b'%PDF'), ('b.pdf', b'%PDF')]))
+
+    @override_settings(IMPORTACAO_LOTE={'MAX_BYTES_ARQUIVO': 100})
+    def test_limite_por_arquivo(self):
+        self.assertEqual(self._nomes(_zip([('ok.pdf', b'x' * 100)])), ['ok.pdf'])
+        with self.assertRaisesMessage(LoteInvalido, 'grande.pdf: arquivo grande demais'):
+            self._nomes(_zip([('grande.pdf', b'x' * 101)]))
+        with self.assertRaisesMessage(LoteInvalido, 'grande demais'):
+            self._nomes(SimpleUploadedFile('solto.pdf', b'x' * 101))
+
+    @override_settings(IMPORTACAO_LOTE={'MAX_BYTES_TOTAL': 250})
+    def test_limite_do_lote(self):
+        arquivos = [SimpleUploadedFile(f'{i}.pdf', b'x' * 100) for i in range(2)]
+        self.assertEqual(len(self._nomes(*arquivos)), 2)
+        with self.assertRaisesMessage(LoteInvalido, 'tamanho máximo'):
+            self._nomes(*arquivos, _zip([('c.pdf', b'x' * 100)]))
+
+
+class MesclarTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.conta = Conta.objects.create(nome='Banco', usuario=self.usuario)
+
+    def _item(self, dia, valor, descricao):
+        return {'data': f'2025-01-{dia:02d}', 'valor': valor, 'descricao': descricao, 'tipo': 'saida'}
+
+    def _resumo(self, itens):
+        return [(i['data'], str(i['valor']), i['descricao']) for i in itens]
+
+    def test_compras_iguais_no_mesmo_extrato_ficam(self):
+        cafe = self._item(5, 7, 'Café')
+        resultado = mesclar({0: [dict(cafe), dict(cafe), self._item(3, 10, 'Pão')]}, self.conta)
+        self.assertEqual(self._resumo(resultado), [
+            ('2025-01-03', '10', 'Pão'), ('2025-01-05', '7', 'Café'), ('2025-01-05', '7', 'Café'),
+        ])
+
+    def test_extratos_sobrepostos_nao_repetem(self):
+        cafe = self._item(5, 7, 'Café')
+        resultados = {
+            0: [dict(cafe), dict(cafe), self._item(1, 1, 'A')],
+            # Mesmo período no outro extrato, com valor e descrição escritos diferente
+            1: [{**cafe, 'valor': '7.00', 'descricao': ' café '}, self._item(9, 2, 'B')],
+        }
+        self.assertEqual(self._resumo(mesclar(resultados, self.conta)), [
+            ('2025-01-01', '1', 'A'), ('2025-01-05', '7', 'Café'), ('2025-01-05', '7', 'Café'),
+            ('2025-01-09', '2', 'B'),
+        ])
+
+    def test_desconta_as_que_ja_estao_na_conta(self):
+        Transacao.objects.create(conta=self.conta, data=date(2025, 1, 5), valor=Decimal('7.00'), descricao='Café')
+        outra = Conta.objects.create(nome='Outra', usuario=self.usuario)
+        Transacao.objects.create(conta=outra, data=date(2025, 1, 3), valor=Decimal('10.00'), descricao='Pão')
+        cafe = self._item(5, 7, 'Café')
+        resultado = mesclar({0: [dict(cafe), dict(cafe), self._item(3, 10, 'Pão')]}, self.conta)
+        self.assertEqual(self._resumo(resultado), [('2025-01-03', '10', 'Pão'), ('2025-01-05', '7', 'Café')])
+
+    def test_normaliza_datas(self):
+        resultado = mesclar({0: [{'data': date(2025, 1, 2), 'valor': 1, 'descricao': 'x'}]}, self.conta)
+        self.assertEqual(resultado[0]['data'], '2025-01-02')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ConfirmarImportacaoTests(TestCase):
+    def test_compras_iguais_geram_transacoes_distintas(self):
+        usuario = User.objects.create_user('ana', password='x')
+        conta = Conta.objects.create(nome='Banco', usuario=usuario)
+        self.client.force_login(usuario)
+        sessao = self.client.session
+        sessao['conta_temp_id'] = conta.id
+        sessao.save()
+
+        resposta = self.client.post('/importar/', {
+            'confirmar_dados': '1', 'data': ['2025-01-05'] * 2, 'descricao': ['Café'] * 2,
+            'valor': ['7.00'] * 2, 'tipo': ['saida'] * 2, 'categoria': [''] * 2,
+        })
+        self.assertRedirects(resposta, '/', fetch_redirect_response=False)
+        self.assertEqual(Transacao.objects.filter(conta=conta, descricao='Café').count(), 2)
+
+
+# --- RECORRÊNCIAS ---
+class RecorrenciasTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user('ana', password='x')
+        self.conta = Conta.objects.create(nome='Banco', usuario=self.ana)
+
+    def test_troca_de_dono_da_conta_leva_as_recorrencias(self):
+        bia = User.objects.create_user('bia', password='x')
+        regra = Recorrencia.objects.create(conta=self.conta, descricao='Aluguel', valor=Decimal('1500.00'),
+                                           data_inicio=date(2025, 1, 5))
+        self.conta.usuario = bia
+        self.conta.save()
+
+        regra.refresh_from_db()
+        self.assertEqual(regra.usuario_id, bia.id)
+        recorrencias.materializar(ate=date(2025, 1, 31))
+        self.assertEqual(list(Transacao.objects.values_list('usuario_id', flat=True)), [bia.id])
+
+    def test_teto_de_ocorrencias_vale_para_a_execucao(self):
+        # Lote de 1: a regra atrasada volta a aparecer na varredura depois de avançar
+        atrasada = Recorrencia.objects.create(conta=self.conta, descricao='Academia', valor=Decimal('90.00'),
+                                              frequencia='semanal', data_inicio=date(2020, 1, 1))
+        Recorrencia.objects.create(conta=self.conta, descricao='Aluguel', valor=Decimal('1500.00'),
+                                   data_inicio=date(2024, 12, 5))
+
+        total_regras, _, _ = recorrencias.materializar(ate=date(2025, 1, 31), tamanho_lote=1)
+        self.assertEqual(total_regras, 2)
+        self.assertEqual(Transacao.objects.filter(descricao='Academia').count(),
+                         recorrencias.MAX_OCORRENCIAS_POR_REGRA)
+        atrasada.refresh_from_db()
+        self.assertEqual(atrasada.proxima_data, date(2020, 1, 1) + timedelta(weeks=recorrencias.MAX_OCORRENCIAS_POR_REGRA))
+
+        # A execução seguinte continua de onde parou
+        recorrencias.materializar(ate=date(2025, 1, 31), tamanho_lote=1)
+        self.assertEqual(Transacao.objects.filter(descricao='Academia').count(),
+                         2 * recorrencias.MAX_OCORRENCIAS_POR_REGRA)
+
+
+# --- CONTADORES DE GASTO ---
+class GastoCategoriaTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.conta = Conta.objects.create(nome='Banco', usuario=self.usuario)
+        self.mercado = Categoria.objects.create(nome='Mercado', usuario=self.usuario)
+        self.lazer = Categoria.objects.create(nome='Lazer', usuario=self.usuario)
+
+    def _nova(self, **campos):
+        # bulk_create não passa pelo save(): o dono vai preenchido, como em sincronizacao.py
+        dados = {'conta': self.conta, 'usuario': self.usuario, 'categoria': self.mercado,
+                 'data': date(2025, 1, 10), 'valor': Decimal('50.00'), 'descricao': 'compra', 'tipo': 'D'}
+        dados.update(campos)
+        return Transacao(**dados)
+
+    def assertContadores(self, esperado):
+        """Os contadores batem com as transações e têm os valores esperados ({(categoria, mes): (total, qtd)})."""
+        self.assertEqual(reconciliar(), [])
+        self.assertEqual({
+            (categoria_id, mes): (total, quantidade)
+            for categoria_id, mes, total, quantidade in GastoCategoria.objects.filter(
+                quantidade__gt=0).values_list('categoria_id', 'mes', 'total', 'quantidade')
+        }, esperado)
+
+    def test_save_e_edicao(self):
+        transacao = self._nova()
+        transacao.save()
+        self._nova(tipo='R', valor=Decimal('900.00'), descricao='salário').save()
+        jan, fev = date(2025, 1, 1), date(2025, 2, 1)
+        self.assertContadores({(self.mercado.id, jan): (Decimal('50.00'), 1)})
+
+        transacao.valor = Decimal('80.00')
+        transacao.save()
+        self.assertContadores({(self.mercado.id, jan): (Decimal('80.00'), 1)})
+
+        transacao.categoria = self.lazer
+        transacao.data = date(2025, 2, 3)
+        transacao.save()
+        self.assertContadores({(self.lazer.id, fev): (Decimal('80.00'), 1)})
+
+        # Instância carregada do banco: o "antes" vem de from_db
+        recarregada = Transacao.objects.get(pk=transacao.pk)
+        recarregada.tipo = 'R'
+        recarregada.save()
+        self.assertContadores({})
+
+    def test_update_em_massa(self):
+        Transacao.objects.bulk_create([self._nova(descricao=f'c{i}') for i in range(3)])
+        Transacao.objects.filter(descricao='c0').update(categoria=self.lazer, valor=Decimal('10.00'))
+        Transacao.objects.filter(descricao='c1').update(data=date(2025, 3, 1))
+        Transacao.objects.bulk_create([self._nova(descricao='r', tipo='R'), self._nova(descricao='s', categoria=None)])
+        Transacao.objects.filter(descricao__in=['r', 's']).update(tipo='D', valor='7')
+        self.assertContadores({
+            (self.mercado.id, date(2025, 1, 1)): (Decimal('50.00'), 1),
+            (self.mercado.id, date(2025, 3, 1)): (Decimal('50.00'), 1),
+            (self.lazer.id, date(2025, 1, 1)): (Decimal('10.00'), 1),
+            (self.mercado.id, date(2025, 1, 1)): (Decimal('57.00'), 2),
+        })
+
+        transacoes = list(Transacao.objects.all())
+        for transacao in transacoes:
+            transacao.valor = Decimal('1.00')
+        Transacao.objects.bulk_update(transacoes, ['valor'])
+        self.assertEqual(reconciliar(), [])
+
+    def test_exclusao(self):
+        primeira, _ = Transacao.objects.bulk_create([self._nova(descricao='a'), self._nova(descricao='b')])
+        primeira.delete()
+        self.assertContadores({(self.mercado.id, date(2025, 1, 1)): (Decimal('50.00'), 1)})
+        Transacao.objects.all().delete()
+        self.assertContadores({})
+
+    def test_bulk_create_com_conflitos_ignorados(self):
+        self._nova(chave_cliente='k1').save()
+        Transacao.objects.bulk_create(
+            [self._nova(chave_cliente='k1', descricao='repetida'), self._nova(chave_cliente='k2', descricao='nova')],
+            ignore_conflicts=True,
+        )
+        self.assertEqual(Transacao.objects.count(), 2)
+        self.assertContadores({(self.mercado.id, date(2025, 1, 1)): (Decimal('100.00'), 2)})
+
+    def test_exclusao_de_conta_e_categoria(self):
+        outra = Conta.objects.create(nome='Cartão', usuario=self.usuario)
+        Transacao.objects.bulk_create([
+            self._nova(), self._nova(descricao='lazer', categoria=self.lazer),
+            self._nova(conta=outra, descricao='cartão'),
+        ])
+        outra.delete()
+        self.assertContadores({
+            (self.mercado.id, date(2025, 1, 1)): (Decimal('50.00'), 1),
+            (self.lazer.id, date(2025, 1, 1)): (Decimal('50.00'), 1),
+        })
+
+        # A transação fica sem categoria (SET_NULL) e sai dos contadores
+        self.lazer.delete()
+        self.assertContadores({(self.mercado.id, date(2025, 1, 1)): (Decimal('50.00'), 1)})
+
+
+# --- RELATÓRIOS ---
+@override_settings(SECURE_SSL_REDIRECT=False, SINCRONIZACAO_MARGEM_SEGUNDOS=0)
+class RelatorioAPITests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create_user('ana', password='x')
+        self.banco = Conta.objects.create(nome='Banco', usuario=self.ana)
+        self.cartao = Conta.objects.create(nome='Cartão', usuario=self.ana)
+        self.mercado = Categoria.objects.create(nome='Mercado', usuario=self.ana)
+        self.lazer = Categoria.objects.create(nome='Lazer', usuario=self.ana)
+        for conta, categoria, tipo, data, valor in [
+            (self.banco, self.mercado, 'D', date(2025, 1, 6), '10.00'),
+            (self.banco, self.mercado, 'D', date(2025, 1, 8), '20.00'),
+            (self.cartao, self.lazer, 'D', date(2025, 2, 10), '30.00'),
+            (self.banco, None, 'R', date(2025, 2, 10), '100.00'),
+            (self.banco, self.mercado, 'D', date(2024, 12, 31), '5.00'),
+        ]:
+            Transacao.objects.create(conta=conta, categoria=categoria, tipo=tipo, data=data,
+                                     valor=Decimal(valor), descricao=f'{tipo} {data}')
+
+        # Dados de outro usuário, no mesmo período
+        bia = User.objects.create_user('bia', password='x')
+        self.conta_bia = Conta.objects.create(nome='Banco da Bia', usuario=bia)
+        Transacao.objects.create(conta=self.conta_bia, data=date(2025, 1, 6), valor=Decimal('999.00'),
+                                 descricao='bia', tipo='D')
+        self.client.force_login(self.ana)
+
+    def _relatorio(self, **parametros):
+        parametros.setdefault('inicio', '2025-01-01')
+        parametros.setdefault('fim', '2025-12-31')
+        return self.client.get('/api/relatorios/', parametros)
+
+    def _linhas(self, dados):
+        """{(dimensões...): (medidas...)} a partir das colunas."""
+        colunas = dados['colunas']
+        dimensoes = zip(*(colunas[d] for d in dados['dimensoes']))
+        medidas = zip(*(colunas[m] for m in dados['medidas']))
+        return dict(zip(dimensoes, medidas))
+
+    def test_medidas(self):
+        dados = self._relatorio(dimensoes='conta', medidas='soma,contagem,media').json()
+        self.assertEqual(self._linhas(dados), {
+            (self.banco.id,): (130.0, 3, 43.33),
+            (self.cartao.id,): (30.0, 1, 30.0),
+        })
+        self.assertEqual(dados['linhas'], 2)
+        self.assertFalse(dados['truncado'])
+        self.assertEqual(dados['rotulos'], {'conta': {str(self.banco.id): 'Banco', str(self.cartao.id): 'Cartão'}})
+
+    def test_dimensoes(self):
+        esperados = {
+            'categoria': {(None,): (100.0,), (self.mercado.id,): (30.0,), (self.lazer.id,): (30.0,)},
+            'tipo': {('D',): (60.0,), ('R',): (100.0,)},
+            'dia': {('2025-01-06',): (10.0,), ('2025-01-08',): (20.0,), ('2025-02-10',): (130.0,)},
+            'semana': {('2025-01-06',): (30.0,), ('2025-02-10',): (130.0,)},
+            'mes': {('2025-01-01',): (30.0,), ('2025-02-01',): (130.0,)},
+        }
+        for dimensao, esperado in esperados.items():
+            with self.subTest(dimensao=dimensao):
+                resposta = self._relatorio(dimensoes=dimensao, medidas='soma')
+                self.assertEqual(resposta.status_code, 200)
+                self.assertEqual(self._linhas(resposta.json()), esperado)
+
+        dados = self._relatorio(dimensoes='ano', medidas='contagem', inicio='2024-01-01').json()
+        self.assertEqual(self._linhas(dados), {('2024-01-01',): (1,), ('2025-01-01',): (4,)})
+
+    def test_varias_dimensoes(self):
+        dados = self._relatorio(dimensoes='mes,tipo', medidas='soma,contagem').json()
+        self.assertEqual(self._linhas(dados), {
+            ('2025-01-01', 'D'): (30.0, 2),
+            ('2025-02-01', 'D'): (30.0, 1),
+            ('2025-02-01', 'R'): (100.0, 1),
+        })
+        self.assertEqual(dados['rotulos'], {'tipo': {'R': 'Receita', 'D': 'Despesa'}})
+
+    def test_parametros_invalidos(self):
+        for parametros in [
+            {'dimensoes': 'usuario'},
+            {'dimensoes': 'mes,mes'},
+            {'medidas': 'soma,maximo'},
+            {'medidas': 'soma,soma'},
+            {'dimensoes': 'conta,categoria,tipo,mes'},
+            {'inicio': '2025-13-01'},
+            {'fim': 'ontem'},
+            {'inicio': '2025-02-01', 'fim': '2025-01-31'},
+        ]:
+            with self.subTest(**parametros):
+                resposta = self._relatorio(**parametros)
+                self.assertEqual(resposta.status_code, 400)
+                self.assertIn('erro', resposta.json())
+
+    def test_isolamento_entre_usuarios(self):
+        dados = self._relatorio(dimensoes='conta', medidas='soma').json()
+        self.assertNotIn(self.conta_bia.id, dados['colunas']['conta'])
+        self.assertNotIn(str(self.conta_bia.id), dados['rotulos']['conta'])
+
+        self.client.force_login(User.objects.get(username='bia'))
+        dados = self._relatorio(dimensoes='conta', medidas='soma').json()
+        self.assertEqual(self._linhas(dados), {(self.conta_bia.id,): (999.0,)})
+
+        self.client.logout()
+        self.assertEqual(self._relatorio().status_code, 403)
+
+    def test_cache_acompanha_as_escritas(self):
+        self.assertEqual(self._linhas(self._relatorio().json()), {('2025-01-01',): (30.0,), ('2025-02-01',): (130.0,)})
+        Transacao.objects.create(conta=self.banco, data=date(2025, 3, 1), valor=Decimal('1.00'),
+                                 descricao='nova', tipo='D')
+        self.assertEqual(self._linhas(self._relatorio().json())[('2025-03-01',)], (1.0,))
+
+        Transacao.objects.filter(descricao='nova').delete()
+        self.assertNotIn(('2025-03-01',), self._linhas(self._relatorio().json()))
+
+
+# --- PAINEL ---
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PainelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['fragmentos'].clear()
+        self.ana = User.objects.create_user('ana', password='x')
+        conta = Conta.objects.create(usuario=self.ana, nome='Banco')
+        for dia, tipo, valor in [(5, 'R', '0.10'), (6, 'R', '0.20'), (7, 'D', '0.05')]:
+            Transacao.objects.create(conta=conta, data=date(2025, 1, dia), tipo=tipo, valor=Decimal(valor),
+                                     descricao=f'{tipo}{dia}')
+        self.client.force_login(self.ana)
+
+    def _listagem(self, hoje=datetime(2025, 1, 15)):
+        with mock.patch('contas.views.datetime') as relogio:
+            relogio.now.return_value = hoje
+            return self.client.get('/').content.decode()
+
+    def _painel_embutido(self, html):
+        return json.loads(re.search(r'<script id="painel-inicial" type="application/json">(.*?)</script>', html).group(1))
+
+    def test_totais_em_decimal(self):
+        painel = calcular_painel(self.ana, 2025, 1)
+        self.assertEqual(painel['total_receitas'], Decimal('0.30'))
+        self.assertEqual(painel['total_despesas'], Decimal('0.05'))
+        self.assertEqual(painel['saldo'], Decimal('0.25'))
+
+    def test_listagem_embute_o_mesmo_painel_da_api(self):
+        embutido = self._painel_embutido(self._listagem())
+        api = self.client.get('/api/transacoes/', {'ano': 2025, 'mes': 1}).json()
+
+        # Dinheiro sai exato: texto no json_script, o mesmo Decimal na API
+        self.assertEqual((embutido['total_receitas'], embutido['saldo']), ('0.30', '0.25'))
+        for campo in ('total_receitas', 'total_despesas', 'saldo'):
+            self.assertEqual(Decimal(embutido[campo]), Decimal(str(api[campo])))
+        self.assertEqual(embutido['transacoes'], api['transacoes'])
+        self.assertEqual(embutido['grafico_labels'], api['grafico_labels'])
+
+    def test_fragmentos_acompanham_os_filtros(self):
+        self.assertIn('<option value="1" selected>Janeiro</option>', self._listagem())
+        # O cache dos fragmentos não segura o período anterior
+        html = self._listagem(hoje=datetime(2025, 2, 3))
+        self.assertIn('<option value="2" selected>Fevereiro</option>', html)
+        self.assertNotIn('<option value="1" selected>', html)
+        self.assertNotIn(' checked>', html)
+
+        sessao = self.client.session
+        sessao['filtro_ano_inteiro'] = True
+        sessao.save()
+        self.assertRegex(self._listagem(hoje=datetime(2025, 2, 3)), r'id="chkAno"\s+checked')
+
+    def test_estrutura_em_cache_nao_leva_dados_do_usuario(self):
+        self._listagem()
+        self.client.force_login(User.objects.create_user('bia', password='x'))
+        html = self._listagem()
+        self.assertEqual(self._painel_embutido(html)['transacoes'], [])
+        self.assertNotIn('"R5"', html)  # Entre aspas: um token CSRF aleatório pode conter R5
+        self.assertEqual(self._painel_embutido(html)['saldo'], '0.00')
+
+
+
+# --- ADMIN ---
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PaginadorEstimadoTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='x')
+        conta = Conta.objects.create(usuario=self.admin, nome='Banco')
+        for dia in (1, 2, 3):
+            Transacao.objects.create(conta=conta, data=date(2025, 1, dia), valor=dia, descricao=f'd{dia}')
+
+    def _postgres_falso(self, linhas_estimadas):
+        """Conexão que responde ao EXPLAIN como o Postgres; guarda o SQL executado."""
+        cursor = mock.MagicMock()
+        cursor.fetchone.return_value = [[{'Plan': {'Plan Rows': linhas_estimadas}}]]
+        conexao = mock.MagicMock(vendor='postgresql')
+        conexao.cursor.return_value.__enter__.return_value = cursor
+        return mock.patch('contas.admin.connections', {'default': conexao}), cursor
+
+    def test_fora_do_postgres_conta_exato(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(PaginadorEstimado(Transacao.objects.all(), 50).count, 3)
+
+    def test_postgres_usa_a_estimativa_acima_do_limite(self):
+        conexao, cursor = self._postgres_falso(250000)
+        with conexao, self.assertNumQueries(0):
+            self.assertEqual(PaginadorEstimado(Transacao.objects.all(), 50).count, 250000)
+        self.assertTrue(cursor.execute.call_args.args[0].startswith('EXPLAIN (FORMAT JSON) SELECT'))
+
+    def test_postgres_conta_exato_abaixo_do_limite(self):
+        conexao, _ = self._postgres_falso(PaginadorEstimado.LIMITE_EXATO - 1)
+        with conexao:
+            self.assertEqual(PaginadorEstimado(Transacao.objects.all(), 50).count, 3)
+
+    def test_changelist_de_transacoes(self):
+        self.client.force_login(self.admin)
+        resposta = self.client.get('/admin/contas/transacao/', {'q': 'd2'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIsInstance(resposta.context['cl'].paginator, PaginadorEstimado)
+        self.assertEqual(resposta.context['cl'].result_count, 1)
+
+
+# --- SQLITE ---
+class SqlitePragmasTests(TestCase):
+    def _pragma(self, cursor, nome):
+        cursor.execute(f'PRAGMA {nome}')
+        return cursor.fetchone()[0]
+
+    def _conectar(self, nome):
+        """Conexão nova (dispara connection_created) a outro banco, com as mesmas configurações."""
+        padrao = connections['default']
+        conexao = type(padrao)({**padrao.settings_dict, 'NAME': nome}, alias='pragmas')
+        self.addCleanup(conexao.close)
+        return conexao
+
+    def test_conexao_dos_testes_recebe_os_pragmas(self):
+        # Nada de depender do comando: manage.py test, pytest e os comandos agendados passam por aqui
+        with connection.cursor() as cursor:
+            self.assertEqual(self._pragma(cursor, 'busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+            self.assertEqual(self._pragma(cursor, 'synchronous'), 1)  # NORMAL
+            self.assertEqual(self._pragma(cursor, 'temp_store'), 2)  # MEMORY
+
+    def test_banco_em_arquivo_fica_em_wal(self):
+        # O banco de teste fica em memória (journal_mode=memory): abre um arquivo à parte
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta)
+        with self._conectar(f'{pasta}/pragmas.sqlite3').cursor() as cursor:
+            self.assertEqual(self._pragma(cursor, 'journal_mode'), 'wal')
+            self.assertEqual(self._pragma(cursor, 'busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    @override_settings(SQLITE_OTIMIZADO=False)
+    def test_desligado_fica_com_os_padroes(self):
+        with self._conectar(':memory:').cursor() as cursor:
+            self.assertEqual(self._pragma(cursor, 'synchronous'), 2)  # FULL
+            self.assertEqual(self._pragma(cursor, 'temp_store'), 0)
+
+
+# --- COMANDOS DE DIAGNÓSTICO ---
+class BenchmarkSessaoTests(TestCase):
+    def test_mede_todas_as_estrategias(self):
+        # Já dentro do banco de teste: o comando não cria (nem destrói) outro
+        modulo = 'contas.management.commands.benchmark_sessao'
+        saida = io.StringIO()
+        with mock.patch(f'{modulo}.setup_test_environment'), mock.patch(f'{modulo}.teardown_test_environment'), \
+                mock.patch(f'{modulo}.setup_databases'), mock.patch(f'{modulo}.teardown_databases'):
+            call_command('benchmark_sessao', requisicoes=1, stdout=saida)
+
+        linhas = saida.getvalue().splitlines()[1:]
+        self.assertEqual(
+            [linha.split()[:2] for linha in linhas],
+            [[estrategia, endpoint] for estrategia in ('db', 'cached_db', 'cookies')
+             for endpoint in ('listagem_transacoes', 'transacoes_api')],
+        )
+        # Consultas à django_session por requisição: só a sessão em banco puro lê a tabela
+        self.assertEqual([linha.split()[3] for linha in linhas], ['1.0', '1.0', '0.0', '0.0', '0.0', '0.0'])
+
+
+
+class StartupProfileTests(SimpleTestCase):
+    def test_subida_sem_os_modulos_pesados(self):
+        # Roda de verdade (python -X importtime): o SDK do Gemini e o Pillow ficam para depois
+        saida = io.StringIO()
+        call_command('startup_profile', top=3, stdout=saida)
+        self.assertIn("Subida de 'financeiro.wsgi'", saida.getvalue())
+        self.assertIn("Nenhuma regressão", saida.getvalue())
+
+    def test_modulo_proibido_e_limite_viram_erro(self):
+        with self.assertRaisesMessage(CommandError, "'django' foi importado na subida"):
+            call_command('startup_profile', proibidos='django', stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, "limite: 0.0 ms"):
+            call_command('startup_profile', proibidos='', limite_ms=0, stdout=io.StringIO())
+
+
+class TesteCargaTests(TestCase):
+    def test_limpar_remove_so_os_usuarios_desta_execucao(self):
+        User.objects.create_user('carga_0', password='x')
+        User.objects.create_user('carga_antigo', password='x')
+        with mock.patch('contas.management.commands.teste_carga.Command._rodar', return_value={}) as rodar:
+            call_command('teste_carga', url='http://servidor', usuarios=2, limpar=True, stdout=io.StringIO())
+
+        credenciais = rodar.call_args.args[1]
+        self.assertEqual([username for username, _, _ in credenciais], ['carga_0', 'carga_1'])
+        self.assertEqual(set(User.objects.values_list('username', flat=True)), {'carga_0', 'carga_antigo'})
@@ -8,9 +8,18 @@ urlpatterns = [
     path('delete/<int:pk>/', views.delete_transacao, name='delete_transacao'),
     path('nova-categoria/', views.nova_categoria, name='nova_categoria'),
     path('nova-conta/', views.nova_conta, name='nova_conta'),
+    path('nova-recorrencia/', views.nova_recorrencia, name='nova_recorrencia'),
+    path('novo-orcamento/', views.novo_orcamento, name='novo_orcamento'),
     path('importar/', views.importar_extrato, name='importar_extrato'),
+    path('importar/stream/', views.importar_extrato_stream, name='importar_extrato_stream'),
+    path('importar/lote/', views.importar_lote, name='importar_lote'),
     path('nova-transacao/', views.nova_transacao, name='nova_transacao'),
     path('logout/', LogoutView.as_view(next_page='login'), name='logout'),
 
     path('api/transacoes/', views.transacoes_api, name='transacoes_api'),
+    path('api/transacoes/lote/', views.transacoes_lote_api, name='transacoes_lote_api'),
+    path('api/orcamentos/', views.orcamentos_api, name='orcamentos_api'),
+    path('api/relatorios/', views.relatorio_api, name='relatorio_api'),
+    path('api/sync/', views.sync_api, name='sync_api'),
+    path('api/sync/transacoes/', views.sync_transacoes_api, name='sync_transacoes_api'),
 ]
\ No newline at end of file
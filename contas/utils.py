@@ -1,21 +1,44 @@
-from google import genai
-from google.genai import types
+import io
+import itertools
 import os
 import json
+import logging
 import tempfile
 from datetime import datetime
 
+from django.conf import settings
 
-def importar_extrato_com_ia(arquivo_upload, categorias_disponiveis):
-    api_key = os.getenv('GEMINI_API_KEY')
-    if not api_key:
-        print("ERRO: Chave API não encontrada.")
+from . import governador
+from .governador import IAOcupada
+
+logger = logging.getLogger(__name__)
+
+NOME_MODELO = 'gemini-2.5-flash' # Atualizado para o modelo mais recente compatível com o SDK novo
+
+
+def importar_extrato_com_ia(arquivo_upload, categorias_disponiveis, usuario_id=None):
+    """Versão em lista de `extrair_transacoes_stream` (espera a resposta inteira)."""
+    try:
+        return list(extrair_transacoes_stream(arquivo_upload, categorias_disponiveis, usuario_id))
+
+    except (IAOcupada, ArquivoNaoSuportado):
+        # Fila cheia, 429 persistente ou formato recusado: a view mostra uma mensagem específica
+        raise
+
+    except Exception as e:
+        logger.exception("Erro na geração da IA: %s", e)
         return []
 
-    # --- CONFIGURAÇÃO CLI DO NOVO SDK ---
-    client = genai.Client(api_key=api_key)
 
-    nome_modelo = 'gemini-2.5-flash' # Atualizado para o modelo mais recente compatível com o SDK novo
+def extrair_transacoes_stream(arquivo_upload, categorias_disponiveis, usuario_id=None):
+    """
+    Envia o extrato para a IA e devolve cada transação assim que o objeto JSON
+    dela termina de chegar no stream, sem esperar o array completo.
+    """
+    # --- CLIENTE COMPARTILHADO (criado uma vez por processo) ---
+    if governador.obter_cliente() is None:
+        logger.error("Chave API não encontrada.")
+        return
 
     # --- ARQUIVO TEMPORÁRIO ---
     # Detecta a extensão do arquivo enviado
@@ -23,65 +46,169 @@ def importar_extrato_com_ia(arquivo_upload, categorias_disponiveis):
     if not ext:
         ext = '.pdf' # Fallback
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
+    tmp_path, ext = _salvar_temporario(arquivo_upload, ext)
+
+    try:
+        with governador.reservar(usuario_id):
+            yield from _extrair_transacoes(tmp_path, ext, categorias_disponiveis)
+
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# --- PRÉ-PROCESSAMENTO DE IMAGENS ---
+# Formatos que a IA recebe como vieram. As demais imagens (BMP, TIFF) sempre
+# viram JPEG no pré-processamento; se a conversão falhar, o arquivo é recusado
+MIME_TYPES = {
+    '.pdf': 'application/pdf',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+}
+EXTENSOES_IMAGEM = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff'}
+
+LADO_MAIOR_PAGINA_POL = 11.7  # Altura de uma folha A4 em polegadas
+LIMITE_MEMORIA_UPLOAD = 2 * 1024 * 1024  # Acima disso o buffer vai para o disco
+
+
+class ArquivoNaoSuportado(ValueError):
+    """Imagem num formato que a IA não aceita e que não pôde ser convertida para JPEG."""
+
+
+def precisa_converter(ext):
+    return ext in EXTENSOES_IMAGEM and ext not in MIME_TYPES
+
+
+def _salvar_temporario(arquivo_upload, ext):
+    """Grava o upload em um arquivo temporário; imagens são pré-processadas antes."""
+    if ext not in EXTENSOES_IMAGEM:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
+            for chunk in arquivo_upload.chunks():
+                tmp_file.write(chunk)
+            return tmp_file.name, ext
+
+    with tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_UPLOAD) as bruto:
         for chunk in arquivo_upload.chunks():
-            tmp_file.write(chunk)
-        tmp_path = tmp_file.name
+            bruto.write(chunk)
+        tamanho_original = bruto.tell()
+        bruto.seek(0)
+
+        processada = preprocessar_imagem(bruto)
+        if processada is not None and (len(processada) < tamanho_original or precisa_converter(ext)):
+            logger.info("Imagem reduzida: %d KB -> %d KB", tamanho_original // 1024, len(processada) // 1024)
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
+                tmp_file.write(processada)
+                return tmp_file.name, '.jpg'
+
+        # Não deu para reduzir: envia o original (BMP/TIFF são recusados em _extrair_transacoes)
+        bruto.seek(0)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
+            for chunk in iter(lambda: bruto.read(64 * 1024), b''):
+                tmp_file.write(chunk)
+            return tmp_file.name, ext
+
+
+def preprocessar_imagem(arquivo, dpi=None, qualidade=None):
+    """
+    Prepara a foto de um extrato para a IA: corrige a orientação (EXIF),
+    converte para tons de cinza, reduz para `dpi` numa página A4 e recodifica
+    como JPEG. Retorna os bytes ou None se o Pillow não estiver disponível
+    ou a imagem não puder ser lida.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+
+    dpi = dpi or getattr(settings, 'IA_IMAGEM_DPI', 200)
+    qualidade = qualidade or getattr(settings, 'IA_IMAGEM_QUALIDADE', 85)
+    lado_maximo = int(LADO_MAIOR_PAGINA_POL * dpi)
 
     try:
-        print(f"--- Enviando Arquivo ({ext}) ---")
-        
-        # Define MIME type correto
-        mime_type = 'application/pdf'
-        if ext in ['.jpg', '.jpeg']:
-            mime_type = 'image/jpeg'
-        elif ext == '.png':
-            mime_type = 'image/png'
-
-        # Upload usando o cliente da nova SDK
-        # O Client.files.upload retorna um objeto que pode ser passado pro generate_content
-        sample_file = client.files.upload(file=tmp_path, config=types.UploadFileConfig(display_name="Extrato", mime_type=mime_type))
-
-        # FORMATE AS CATEGORIAS PARA O PROMPT
-        # Opção A: Lista simples separada por vírgulas
-        # lista_cats_str = ", ".join(categorias_usuario)
-
-        # Opção B: Lista numerada (mais clara para a IA)
-        lista_cats_str = "\n".join([f"{i+1}. {cat}" for i, cat in enumerate(categorias_disponiveis)])
-
-        # USE F-STRING PARA INTERPOLAR
-        prompt = f"""
-        Analise este extrato bancário.
-        Extraia TODAS as transações para JSON.
-
-        SUA MISSÃO DE CATEGORIZAÇÃO:
-        Tente classificar cada compra em UMA das seguintes categorias existentes:
-        {lista_cats_str}
-
-        Regras:
-        1. Se a transação se encaixar claramente em uma categoria acima, use o nome EXATO dela.
-        2. Se não tiver certeza ou não encaixar, use a categoria "Importados".
-        3. Converta datas para "YYYY-MM-DD". se o ano não estiver explícito, assuma o ano atual.
-        4. Ignore saldos diários.
-        5. Valor: float positivo (ex: 20.50). SE O VALOR NÃO ESTIVER CLARO, procure pelo número que aparece após "R$", geralmente está ao lado ou logo abaixo da descrição.
-        6. Tipo: "D" (Débito) ou "R" (Crédito).
-        7. Descricao: Limpe o texto.
-
-        Retorne APENAS o JSON no formato:
-        [
-          {{
-            "data": "YYYY-MM-DD",
-            "descricao": "texto limpo",
-            "valor": 0.00,
-            "tipo": "D",
-            "categoria": "nome_exato_da_categoria_ou_Importados"
-          }}
-        ]
-        """
-
-        # --- ESTRATÉGIA DE GERAÇÃO ---
-        response = client.models.generate_content(
-            model=nome_modelo,
+        with Image.open(arquivo) as imagem:
+            # JPEG: o decodificador já entrega a imagem reduzida e em cinza (bem mais rápido)
+            imagem.draft('L', (lado_maximo, lado_maximo))
+            imagem = ImageOps.exif_transpose(imagem)
+
+            # Transparência vira fundo branco (senão fica preto ao tirar o alfa)
+            if imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info):
+                imagem = imagem.convert('RGBA')
+                fundo = Image.new('RGBA', imagem.size, 'white')
+                imagem = Image.alpha_composite(fundo, imagem)
+
+            imagem = imagem.convert('L')
+            imagem.thumbnail((lado_maximo, lado_maximo), Image.Resampling.LANCZOS)
+
+            saida = io.BytesIO()
+            imagem.save(saida, 'JPEG', quality=qualidade, optimize=True, dpi=(dpi, dpi))
+            return saida.getvalue()
+
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning("Não foi possível pré-processar a imagem: %s", e)
+        return None
+
+
+def _extrair_transacoes(tmp_path, ext, categorias_disponiveis):
+    # Import tardio: o SDK do Gemini é pesado e só esta etapa precisa dele
+    from google.genai import types
+
+    if precisa_converter(ext):
+        raise ArquivoNaoSuportado(f"Não foi possível ler a imagem {ext}. Envie PDF, JPG, PNG ou WEBP.")
+
+    logger.info("Enviando arquivo (%s)", ext)
+
+    # Define MIME type correto (sem extensão reconhecida, vai como PDF)
+    mime_type = MIME_TYPES.get(ext, 'application/pdf')
+
+    # Upload usando o cliente da nova SDK
+    # O Client.files.upload retorna um objeto que pode ser passado pro generate_content
+    sample_file = governador.com_retentativas(lambda client: client.files.upload(
+        file=tmp_path, config=types.UploadFileConfig(display_name="Extrato", mime_type=mime_type)
+    ))
+
+    # FORMATE AS CATEGORIAS PARA O PROMPT
+    # Opção A: Lista simples separada por vírgulas
+    # lista_cats_str = ", ".join(categorias_usuario)
+
+    # Opção B: Lista numerada (mais clara para a IA)
+    lista_cats_str = "\n".join([f"{i+1}. {cat}" for i, cat in enumerate(categorias_disponiveis)])
+
+    # USE F-STRING PARA INTERPOLAR
+    prompt = f"""
+    Analise este extrato bancário.
+    Extraia TODAS as transações para JSON.
+
+    SUA MISSÃO DE CATEGORIZAÇÃO:
+    Tente classificar cada compra em UMA das seguintes categorias existentes:
+    {lista_cats_str}
+
+    Regras:
+    1. Se a transação se encaixar claramente em uma categoria acima, use o nome EXATO dela.
+    2. Se não tiver certeza ou não encaixar, use a categoria "Importados".
+    3. Converta datas para "YYYY-MM-DD". se o ano não estiver explícito, assuma o ano atual.
+    4. Ignore saldos diários.
+    5. Valor: float positivo (ex: 20.50). SE O VALOR NÃO ESTIVER CLARO, procure pelo número que aparece após "R$", geralmente está ao lado ou logo abaixo da descrição.
+    6. Tipo: "D" (Débito) ou "R" (Crédito).
+    7. Descricao: Limpe o texto.
+
+    Retorne APENAS o JSON no formato:
+    [
+      {{
+        "data": "YYYY-MM-DD",
+        "descricao": "texto limpo",
+        "valor": 0.00,
+        "tipo": "D",
+        "categoria": "nome_exato_da_categoria_ou_Importados"
+      }}
+    ]
+    """
+
+    # --- ESTRATÉGIA DE GERAÇÃO (STREAM) ---
+    def abrir_stream(client):
+        stream = iter(client.models.generate_content_stream(
+            model=NOME_MODELO,
             contents=[prompt, sample_file],
             config=types.GenerateContentConfig(
                 response_mime_type="application/json", # Força JSON estruturado
@@ -92,60 +219,102 @@ def importar_extrato_com_ia(arquivo_upload, categorias_disponiveis):
                     types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
                 ]
             )
-        )
+        ))
+        # O 429 só aparece quando o primeiro pedaço é pedido
+        return next(stream, None), stream
 
-        # --- DEBUG ---
-        print(f"DEBUG - Resposta da IA: {response.text}")
+    primeiro, stream = governador.com_retentativas(abrir_stream)
+    if primeiro is None:
+        logger.warning("A IA retornou texto vazio.")
+        return
 
-        # Com response_mime_type="application/json", o texto já deve vir limpo,
-        # mas mantemos uma limpeza defensiva básica
-        texto = response.text.replace('```json', '').replace('```', '').strip()
+    parser = ParserArrayJSON()
+    total = 0
+    for chunk in itertools.chain([primeiro], stream):
+        for item in parser.alimentar(chunk.text or ''):
+            transacao = _normalizar_item(item)
+            if transacao:
+                total += 1
+                yield transacao
 
-        if not texto:
-            print("Erro: A IA retornou texto vazio.")
-            return []
+    logger.info("Resposta da IA: %d caracteres, %d transações", parser.recebido, total)
 
-        dados = json.loads(texto)
 
-        transacoes = []
-        for item in dados:
-            try:
-                # Validação básica
-                if not all(k in item for k in ['data', 'descricao', 'valor', 'tipo']):
-                    print(f"⚠️ Item ignorado (campos faltando): {item}")
-                    continue
-
-                # Mantém data como string
-                data_str = item['data']
-
-                # Valida formato da data
-                datetime.strptime(data_str, '%Y-%m-%d')  # Apenas valida, não converte
-
-                # Pega a categoria que a IA escolheu (ou "Importados" se não vier)
-                categoria_nome = item.get('categoria', 'Importados')
-
-                transacoes.append({
-                    'data': data_str,  # ✅ STRING, não objeto date
-                    'descricao': item['descricao'],
-                    'valor': float(item['valor']),
-                    'tipo': item['tipo'],
-                    'categoria': categoria_nome  # ✅ AGORA INCLUI A CATEGORIA
-                })
-
-            except ValueError as ve:
-                print(f"⚠️ Erro ao processar item (data inválida): {item} - {ve}")
-                continue
-            except Exception as e:
-                print(f"⚠️ Erro ao processar item: {item} - {e}")
-                continue
+def _normalizar_item(item):
+    try:
+        # Validação básica
+        if not all(k in item for k in ['data', 'descricao', 'valor', 'tipo']):
+            logger.warning("Item ignorado (campos faltando): %s", item)
+            return None
+
+        # Mantém data como string
+        data_str = item['data']
+
+        # Valida formato da data
+        datetime.strptime(data_str, '%Y-%m-%d')  # Apenas valida, não converte
+
+        # Pega a categoria que a IA escolheu (ou "Importados" se não vier)
+        categoria_nome = item.get('categoria', 'Importados')
 
-        print(f"✅ Total de transações processadas: {len(transacoes)}")
-        return transacoes
+        return {
+            'data': data_str,  # ✅ STRING, não objeto date
+            'descricao': item['descricao'],
+            'valor': float(item['valor']),
+            'tipo': item['tipo'],
+            'categoria': categoria_nome  # ✅ AGORA INCLUI A CATEGORIA
+        }
 
+    except ValueError as ve:
+        logger.warning("Erro ao processar item (data inválida): %s - %s", item, ve)
     except Exception as e:
-        print(f"Erro na geração da IA: {e}")
-        return []
+        logger.warning("Erro ao processar item: %s - %s", item, e)
+    return None
 
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
\ No newline at end of file
+
+class ParserArrayJSON:
+    """
+    Lê um array JSON que chega em pedaços e devolve cada elemento assim que
+    ele fecha. Ignora o que vier antes do '[' (ex: cercas ```json).
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._dentro = False
+        self.terminou = False
+        self.recebido = 0
+
+    def alimentar(self, pedaco):
+        self.recebido += len(pedaco)
+        self._buffer += pedaco
+        elementos = []
+        pos = 0
+
+        while not self.terminou:
+            if not self._dentro:
+                inicio = self._buffer.find('[', pos)
+                if inicio < 0:
+                    pos = len(self._buffer)
+                    break
+                pos = inicio + 1
+                self._dentro = True
+                continue
+
+            # Pula espaços e vírgulas entre os elementos
+            while pos < len(self._buffer) and self._buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(self._buffer):
+                break
+            if self._buffer[pos] == ']':
+                self.terminou = True
+                break
+
+            try:
+                elemento, pos_final = self._decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                break  # Elemento ainda incompleto: espera o próximo pedaço
+            elementos.append(elemento)
+            pos = pos_final
+
+        self._buffer = self._buffer[pos:]
+        return elementos
@@ -1,115 +1,148 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Sum
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 from datetime import date, datetime
 
-from .models import Transacao, Categoria, Conta
-from .forms import TransacaoForm, CategoriaForm, ContaForm, UploadFileForm
-from .utils import importar_extrato_com_ia
+from .models import Transacao, Categoria, Conta, Recorrencia
+from .forms import (
+    TransacaoForm, CategoriaForm, ContaForm, RecorrenciaForm, OrcamentoForm, UploadFileForm, UploadLoteForm,
+)
+from .utils import importar_extrato_com_ia, extrair_transacoes_stream, ArquivoNaoSuportado, IAOcupada
+from .importacao_lote import processar_lote, LoteInvalido
 
-from django.db.models import Sum
-from django.db.models.functions import TruncDay, TruncMonth
 import json
+import logging
+from collections import Counter
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .serializers import TransacaoSerializer
+from .serializers import TransacaoLoteSerializer, EnvioSyncSerializer
+from .referencias import obter_referencias
+from .painel import calcular_painel, ler_filtros
+from .recorrencias import materializar
+from .orcamentos import status_orcamentos
+from . import relatorios
+from . import sincronizacao
+
+logger = logging.getLogger(__name__)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def transacoes_api(request):
-    hoje = datetime.now()
+    # Mesma agregação que a listagem embute no HTML (ver painel.py)
+    ano_filtrado, mes_filtrado, eh_ano_inteiro = ler_filtros(request.GET)
+    return Response(calcular_painel(request.user, ano_filtrado, mes_filtrado, eh_ano_inteiro))
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def transacoes_lote_api(request):
+    """
+    Altera ou exclui várias transações de uma vez, num único UPDATE/DELETE.
+    Corpo: {"ids": [...], "operacao": "categoria" | "conta" | "tipo" | "excluir", "valor": ...}
+    """
+    # ✅ SEGURANÇA: o dono da conta/categoria de destino é conferido no banco, não no cache
+    serializer = TransacaoLoteSerializer(
+        data=request.data, context={'referencias': obter_referencias(request.user.id, do_banco=True)}
+    )
+    serializer.is_valid(raise_exception=True)
+    dados = serializer.validated_data
+
+    # ✅ SEGURANÇA: ids de outros usuários simplesmente não entram no WHERE
+    transacoes = Transacao.objects.for_user(request.user).filter(id__in=dados['ids'])
+    campos = {'categoria': 'categoria_id', 'conta': 'conta_id', 'tipo': 'tipo'}
+
+    with transaction.atomic():
+        if dados['operacao'] == 'excluir':
+            afetadas = transacoes.delete()[0]
+        else:
+            afetadas = transacoes.update(**{campos[dados['operacao']]: dados['valor']})
+
+    return Response({'operacao': dados['operacao'], 'afetadas': afetadas})
+
 
-    # --- 1. LÓGICA DE FILTROS ---
-    eh_ano_inteiro = request.GET.get('ano_inteiro') == 'true'
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def orcamentos_api(request):
+    """Orçado x gasto por categoria no mês (`?ano=&mes=`), a partir dos contadores."""
+    ano, mes, _ = ler_filtros(request.GET)
+    if not (1 <= mes <= 12 and 1 <= ano <= 9999):
+        return Response({'erro': "Período inválido."}, status=400)
+    return Response(status_orcamentos(request.user, ano, mes))
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def relatorio_api(request):
+    """
+    Tabela dinâmica: `?dimensoes=mes,categoria&medidas=soma,contagem&inicio=AAAA-MM-DD&fim=AAAA-MM-DD`.
+    Dimensões: conta, categoria, tipo, dia, semana, mes, ano. Medidas: soma, contagem, media.
+    """
     try:
-        ano_filtrado = int(request.GET.get('ano'))
-    except (TypeError, ValueError):
-        ano_filtrado = hoje.year
+        dimensoes, medidas, inicio, fim = relatorios.ler_parametros(request.query_params)
+    except relatorios.RelatorioInvalido as erro:
+        return Response({'erro': str(erro)}, status=400)
+    return Response(relatorios.relatorio(request.user.id, dimensoes, medidas, inicio, fim))
+
 
+# --- SINCRONIZAÇÃO INCREMENTAL (clientes móveis/offline) ---
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_api(request):
+    """
+    Alterações desde `?cursor=` (vazio na primeira vez), em páginas de `?limite=`.
+    Repetir com o cursor devolvido enquanto `tem_mais` for verdadeiro.
+    """
     try:
-        mes_filtrado = int(request.GET.get('mes'))
-    except (TypeError, ValueError):
-        mes_filtrado = hoje.month
-
-    # --- 2. QUERYSET PRINCIPAL ---
-    # ✅ SEGURANÇA: Filtra apenas transações das contas do usuário logado
-    transacoes_qs = Transacao.objects.select_related('categoria', 'conta').filter(
-        data__year=ano_filtrado,
-        conta__usuario=request.user  # ✅ FILTRO CRÍTICO
-    ).order_by('-data')
-
-    if not eh_ano_inteiro:
-        transacoes_qs = transacoes_qs.filter(data__month=mes_filtrado)
-
-    # --- 3. CÁLCULOS TOTAIS ---
-    total_receitas = transacoes_qs.filter(tipo='R').aggregate(Sum('valor'))['valor__sum'] or 0
-    total_despesas = transacoes_qs.filter(tipo='D').aggregate(Sum('valor'))['valor__sum'] or 0
-    saldo = total_receitas - total_despesas
-
-    # --- 4. DADOS PARA GRÁFICO DE FLUXO (BARRA) ---
-    if eh_ano_inteiro:
-        dados_agrupados = transacoes_qs.annotate(periodo=TruncMonth('data')).values('periodo', 'tipo').annotate(
-            total=Sum('valor')).order_by('periodo')
-        formato_data = "%b"
-    else:
-        dados_agrupados = transacoes_qs.annotate(periodo=TruncDay('data')).values('periodo', 'tipo').annotate(
-            total=Sum('valor')).order_by('periodo')
-        formato_data = "%d"
-
-    dados_dict = {}
-    for item in dados_agrupados:
-        label = item['periodo'].strftime(formato_data)
-        tipo = item['tipo']
-        valor = float(item['total'])
-        if label not in dados_dict: dados_dict[label] = {'R': 0, 'D': 0}
-        dados_dict[label][tipo] = valor
-
-    grafico_labels = sorted(dados_dict.keys())
-    grafico_receitas = [dados_dict[label]['R'] for label in grafico_labels]
-    grafico_despesas = [dados_dict[label]['D'] for label in grafico_labels]
-
-    # --- 5. DADOS PARA GRÁFICOS DE ROSCA (CATEGORIAS) ---
-    rec_cat = transacoes_qs.filter(tipo='R').values('categoria__nome').annotate(total=Sum('valor')).order_by('-total')
-    cat_receitas_labels = [item['categoria__nome'] for item in rec_cat]
-    cat_receitas_data = [float(item['total']) for item in rec_cat]
-
-    desp_cat = transacoes_qs.filter(tipo='D').values('categoria__nome').annotate(total=Sum('valor')).order_by('-total')
-    cat_despesas_labels = [item['categoria__nome'] for item in desp_cat]
-    cat_despesas_data = [float(item['total']) for item in desp_cat]
-
-    # --- 6. SERIALIZER E RESPOSTA ---
-    serializer = TransacaoSerializer(transacoes_qs, many=True)
-
-    return Response({
-        'transacoes': serializer.data,
-        'saldo': saldo,
-        'total_receitas': total_receitas,
-        'total_despesas': total_despesas,
-        'grafico_labels': grafico_labels,
-        'grafico_receitas': grafico_receitas,
-        'grafico_despesas': grafico_despesas,
-        'cat_receitas_labels': cat_receitas_labels,
-        'cat_receitas_data': cat_receitas_data,
-        'cat_despesas_labels': cat_despesas_labels,
-        'cat_despesas_data': cat_despesas_data,
-    })
+        limite = int(request.query_params.get('limite', sincronizacao.LIMITE_PADRAO))
+    except ValueError:
+        limite = sincronizacao.LIMITE_PADRAO
+    limite = max(1, min(limite, sincronizacao.LIMITE_MAXIMO))
+
+    try:
+        dados = sincronizacao.alteracoes(request.user.id, request.query_params.get('cursor'), limite)
+    except sincronizacao.CursorInvalido as erro:
+        return Response({'erro': str(erro)}, status=400)
+    return Response(dados)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sync_transacoes_api(request):
+    """
+    Cria/atualiza transações feitas offline. Corpo: {"transacoes": [{"chave_cliente": ..., ...}]}
+    Reenviar o mesmo lote é seguro: a chave_cliente identifica cada transação.
+    """
+    # ✅ SEGURANÇA: o dono da conta/categoria de destino é conferido no banco, não no cache
+    serializer = EnvioSyncSerializer(
+        data=request.data, context={'referencias': obter_referencias(request.user.id, do_banco=True)}
+    )
+    serializer.is_valid(raise_exception=True)
+
+    with transaction.atomic():
+        resultados = sincronizacao.gravar_transacoes(request.user.id, serializer.validated_data['transacoes'])
+    return Response({'resultados': resultados})
 
 
 @login_required
 def listagem_transacoes(request):
-    # A view agora apenas renderiza o template base.
-    # O JavaScript no frontend será responsável por chamar a API e preencher os dados.
+    # O JavaScript desenha o painel a partir do json_script e usa a API para os filtros seguintes.
     hoje = datetime.now()
+    referencias = obter_referencias(request.user.id)
+    eh_ano_inteiro = request.session.get('filtro_ano_inteiro', False)
     contexto = {
         'ano_atual': hoje.year,
         'mes_atual': hoje.month,
-        'eh_ano_inteiro': request.session.get('filtro_ano_inteiro', False)
+        'eh_ano_inteiro': eh_ano_inteiro,
+        # ✅ Dados do período inicial já no HTML: a API só é chamada quando o filtro muda
+        'painel': calcular_painel(request.user, hoje.year, hoje.month, eh_ano_inteiro),
+        # Opções da barra de ações em lote
+        'opcoes_lote': {'categorias': referencias.categorias, 'contas': referencias.contas},
     }
     return render(request, 'contas/listagem.html', contexto)
 
@@ -136,7 +169,7 @@ def nova_transacao(request):
 @login_required
 def update_transacao(request, pk):
     # ✅ SEGURANÇA: Garante que só pode editar transações próprias
-    transacao = get_object_or_404(Transacao, pk=pk, conta__usuario=request.user)
+    transacao = get_object_or_404(Transacao.objects.for_user(request.user), pk=pk)
 
     if request.method == 'POST':
         form = TransacaoForm(request.POST, instance=transacao, user=request.user)
@@ -153,7 +186,7 @@ def update_transacao(request, pk):
 @login_required
 def delete_transacao(request, pk):
     # ✅ SEGURANÇA: Garante que só pode deletar transações próprias
-    transacao = get_object_or_404(Transacao, pk=pk, conta__usuario=request.user)
+    transacao = get_object_or_404(Transacao.objects.for_user(request.user), pk=pk)
     transacao.delete()
     messages.success(request, "Transação excluída com sucesso!")
     return redirect('listagem')
@@ -191,10 +224,41 @@ def nova_conta(request):
     return render(request, 'contas/form_generico.html', {'form': form, 'titulo': 'Nova Conta'})
 
 
+@login_required
+def nova_recorrencia(request):
+    if request.method == 'POST':
+        form = RecorrenciaForm(request.POST, user=request.user)
+        if form.is_valid():
+            recorrencia = form.save()
+            # Ocorrências que já venceram aparecem agora; as próximas ficam com o agendador
+            criadas = materializar(regras=Recorrencia.objects.filter(pk=recorrencia.pk))[1]
+            messages.success(request, f"Recorrência criada com sucesso! ({criadas} lançamentos gerados)")
+            return redirect('listagem')
+    else:
+        form = RecorrenciaForm(user=request.user)
+
+    return render(request, 'contas/form_generico.html', {'form': form, 'titulo': 'Nova Recorrência'})
+
+
+@login_required
+def novo_orcamento(request):
+    if request.method == 'POST':
+        form = OrcamentoForm(request.POST, user=request.user)
+        if form.is_valid():
+            form.save()
+            messages.success(request, "Orçamento salvo com sucesso!")
+            return redirect('listagem')
+    else:
+        form = OrcamentoForm(user=request.user, initial={'mes': date.today().replace(day=1)})
+
+    return render(request, 'contas/form_generico.html', {'form': form, 'titulo': 'Orçamento da Categoria'})
+
+
 @login_required
 def importar_extrato(request):
-    # ✅ SEGURANÇA: Busca apenas categorias do usuário logado
-    categorias = Categoria.objects.filter(usuario=request.user)
+    # ✅ SEGURANÇA: Apenas categorias do usuário logado (do cache de referências)
+    referencias = obter_referencias(request.user.id)
+    categorias = referencias.opcoes_categorias()
 
     if request.method == 'POST':
 
@@ -210,17 +274,18 @@ def importar_extrato(request):
                 conta = get_object_or_404(Conta, id=conta_id, usuario=request.user)
 
                 # Prepara lista de nomes para a IA
-                nomes_categorias = [c.nome for c in categorias]
+                nomes_categorias = [c['nome'] for c in categorias]
 
                 # Chama a IA
                 try:
-                    dados_brutos = importar_extrato_com_ia(arquivo, nomes_categorias)
+                    dados_brutos = importar_extrato_com_ia(arquivo, nomes_categorias, usuario_id=request.user.id)
 
                     if not dados_brutos:
                         messages.error(request, "A IA não encontrou transações ou houve um erro.")
                         return redirect('importar_extrato')
 
-                    # Serializa dados para a sessão
+                    # Normaliza datas para o template (a prévia volta no POST de confirmação,
+                    # então não precisa ficar na sessão: ela pode morar num cookie assinado)
                     dados_serializaveis = []
                     for item in dados_brutos:
                         item_copy = item.copy()
@@ -228,7 +293,6 @@ def importar_extrato(request):
                             item_copy['data'] = item_copy['data'].strftime('%Y-%m-%d')
                         dados_serializaveis.append(item_copy)
 
-                    request.session['transacoes_temp'] = dados_serializaveis
                     request.session['conta_temp_id'] = conta_id
 
                     messages.info(request, "Analise os dados abaixo antes de confirmar.")
@@ -240,6 +304,10 @@ def importar_extrato(request):
                         'categorias': categorias
                     })
 
+                except (IAOcupada, ArquivoNaoSuportado) as e:
+                    messages.warning(request, str(e))
+                    return redirect('importar_extrato')
+
                 except Exception as e:
                     messages.error(request, f"Erro crítico: {e}")
                     return redirect('importar_extrato')
@@ -250,6 +318,8 @@ def importar_extrato(request):
 
             # ✅ SEGURANÇA: Valida que a conta pertence ao usuário
             conta = get_object_or_404(Conta, id=conta_id, usuario=request.user)
+            # As categorias enviadas também: confere no banco, não no cache
+            referencias = obter_referencias(request.user.id, do_banco=True)
 
             lista_datas = request.POST.getlist('data')
             lista_descricoes = request.POST.getlist('descricao')
@@ -258,18 +328,32 @@ def importar_extrato(request):
             lista_categorias = request.POST.getlist('categoria')
 
             count = 0
+            categoria_importados_id = None
+            repeticoes = Counter()
             try:
                 for i in range(len(lista_datas)):
                     cat_id = lista_categorias[i]
 
                     if cat_id:
-                        # ✅ SEGURANÇA: Valida que a categoria pertence ao usuário
-                        categoria = get_object_or_404(Categoria, id=cat_id, usuario=request.user)
+                        # ✅ SEGURANÇA: Valida que a categoria pertence ao usuário (sem consulta por linha)
+                        categoria_id = int(cat_id)
+                        if categoria_id not in referencias.nomes_categorias:
+                            raise Http404("Categoria não encontrada.")
                     else:
-                        categoria, _ = Categoria.objects.get_or_create(
-                            nome="Importados",
-                            usuario=request.user
-                        )
+                        if categoria_importados_id is None:
+                            categoria_importados_id = Categoria.objects.get_or_create(
+                                nome="Importados",
+                                usuario=request.user
+                            )[0].id
+                        categoria_id = categoria_importados_id
+
+                    # ✅ Compras iguais no mesmo extrato (mesmo dia, valor e descrição) são
+                    # legítimas: da segunda em diante o hash leva o número da repetição
+                    hash_id = Transacao.gerar_hash(lista_datas[i], lista_valores[i], lista_descricoes[i])
+                    repeticoes[hash_id] += 1
+                    if repeticoes[hash_id] > 1:
+                        hash_id = Transacao.gerar_hash(
+                            lista_datas[i], lista_valores[i], f"{lista_descricoes[i]}#{repeticoes[hash_id]}")
 
                     Transacao.objects.create(
                         data=lista_datas[i],
@@ -277,13 +361,12 @@ def importar_extrato(request):
                         valor=lista_valores[i],
                         tipo=lista_tipos[i],
                         conta=conta,
-                        categoria=categoria
+                        categoria_id=categoria_id,
+                        hash_id=hash_id
                     )
                     count += 1
 
                 # Limpa a sessão
-                if 'transacoes_temp' in request.session:
-                    del request.session['transacoes_temp']
                 if 'conta_temp_id' in request.session:
                     del request.session['conta_temp_id']
 
@@ -296,8 +379,6 @@ def importar_extrato(request):
 
         # --- CENÁRIO 3: CANCELAR ---
         elif 'cancelar' in request.POST:
-            if 'transacoes_temp' in request.session:
-                del request.session['transacoes_temp']
             if 'conta_temp_id' in request.session:
                 del request.session['conta_temp_id']
             messages.info(request, "Importação cancelada.")
@@ -307,4 +388,96 @@ def importar_extrato(request):
         # ✅ CORREÇÃO: Passa o usuário para o form
         form = UploadFileForm(user=request.user)
 
-    return render(request, 'contas/importar.html', {'form': form, 'categorias': categorias})
\ No newline at end of file
+    return render(request, 'contas/importar.html', {
+        'form': form,
+        'form_lote': UploadLoteForm(user=request.user),
+        'categorias': categorias
+    })
+
+
+@login_required
+@require_POST
+def importar_lote(request):
+    """
+    Vários extratos (ou um .zip) para a mesma conta: uma única prévia, sem
+    repetições, confirmada pelo mesmo fluxo de `importar_extrato`.
+    """
+    form = UploadLoteForm(request.POST, request.FILES, user=request.user)
+    if not form.is_valid():
+        for erros in form.errors.values():
+            messages.error(request, erros[0])
+        return redirect('importar_extrato')
+
+    # ✅ SEGURANÇA: O queryset do form já restringe às contas do usuário
+    conta = form.cleaned_data['conta']
+    categorias = obter_referencias(request.user.id).opcoes_categorias()
+    nomes_categorias = [c['nome'] for c in categorias]
+
+    try:
+        transacoes, falhas = processar_lote(
+            form.cleaned_data['arquivos'], conta, nomes_categorias, request.user.id
+        )
+    except LoteInvalido as e:
+        messages.error(request, str(e))
+        return redirect('importar_extrato')
+
+    for nome, erro in falhas.items():
+        messages.warning(request, f"{nome}: {erro}")
+
+    if not transacoes:
+        messages.error(request, "A IA não encontrou transações novas nos arquivos enviados.")
+        return redirect('importar_extrato')
+
+    request.session['conta_temp_id'] = conta.id
+    messages.info(request, f"{len(transacoes)} transações encontradas. Analise os dados abaixo antes de confirmar.")
+
+    return render(request, 'contas/importar.html', {
+        'preview': True,
+        'transacoes_temp': transacoes,
+        'categorias': categorias
+    })
+
+
+@login_required
+@require_POST
+def importar_extrato_stream(request):
+    """
+    Mesmo fluxo do upload em `importar_extrato`, mas responde em Server-Sent Events:
+    cada transação vira um evento assim que a IA termina de gerá-la.
+    """
+    form = UploadFileForm(request.POST, request.FILES, user=request.user)
+    if not form.is_valid():
+        return JsonResponse({'erros': form.errors}, status=400)
+
+    # ✅ SEGURANÇA: O queryset do form já restringe às contas do usuário
+    conta = form.cleaned_data['conta']
+    nomes_categorias = [nome for _, nome in obter_referencias(request.user.id).categorias]
+
+    # A sessão é gravada antes do corpo começar a ser enviado
+    request.session['conta_temp_id'] = conta.id
+
+    eventos = _eventos_importacao(request.FILES['arquivo'], nomes_categorias, request.user.id)
+    resposta = StreamingHttpResponse(eventos, content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'  # Desliga o buffer de proxies (nginx)
+    return resposta
+
+
+def _evento_sse(nome, dados):
+    return f"event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+def _eventos_importacao(arquivo, nomes_categorias, usuario_id):
+    total = 0
+    try:
+        for item in extrair_transacoes_stream(arquivo, nomes_categorias, usuario_id):
+            total += 1
+            yield _evento_sse('transacao', item)
+        yield _evento_sse('fim', {'total': total})
+
+    except (IAOcupada, ArquivoNaoSuportado) as e:
+        yield _evento_sse('erro', {'mensagem': str(e)})
+
+    except Exception as e:
+        logger.exception("Erro na geração da IA: %s", e)
+        yield _evento_sse('erro', {'mensagem': "Houve um erro ao processar o extrato."})
\ No newline at end of file
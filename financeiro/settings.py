@@ -5,6 +5,7 @@ import dj_database_url
 from urllib.parse import quote_plus
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Carrega as variáveis do arquivo .env
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 # ============================================
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # ✅ Comprime as respostas da API (antes de quem altera o corpo)
+    'contas.middleware.CompressaoJSONMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -119,10 +122,73 @@ else:
             'default': {
                 'ENGINE': 'django.db.backends.sqlite3',
                 'NAME': BASE_DIR / 'db.sqlite3',
+                # ✅ Conexão persistente: os PRAGMAs (ver abaixo) não são reaplicados a cada requisição
+                'CONN_MAX_AGE': int(os.getenv('SQLITE_CONN_MAX_AGE', '600')),
+                'OPTIONS': {
+                    # Escritas pegam o lock já no BEGIN: evita "database is locked" ao
+                    # promover uma transação de leitura para escrita
+                    'transaction_mode': 'IMMEDIATE',
+                },
             }
         }
         print("🔧 Usando SQLite local (sem credenciais de banco)")
 
+# ✅ PRAGMAs do SQLite (ver contas/sqlite.py), aplicados em toda conexão nova: servidor,
+# comandos agendados (materializar_recorrencias...) e testes. SQLITE_OTIMIZADO=False
+# volta aos padrões (útil para comparar)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,       # Negativo = em KiB (64 MB)
+    'busy_timeout': 5000,       # ms
+    'temp_store': 'MEMORY',
+}
+SQLITE_OTIMIZADO = os.getenv('SQLITE_OTIMIZADO', 'True') == 'True'
+
+
+# ============================================
+# CACHE
+# ============================================
+# ✅ Com REDIS_URL o cache é compartilhado entre máquinas e os contadores (limites da IA) são atômicos
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    # Sem Redis: cache em disco, ainda compartilhado pelos workers da mesma máquina
+    # (um LocMemCache deixaria cada worker com a sua cópia e invalidações não se propagariam)
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'financeiro-cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Fragmentos de template iguais para todos (ex.: estrutura da listagem): cópia
+# por processo, mais rápida que o disco e zerada a cada deploy
+CACHES['fragmentos'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'fragmentos',
+}
+
+# Contas/categorias por usuário (ver contas/referencias.py)
+REFERENCIAS_CACHE_TIMEOUT = 3600
+
+# Relatórios dinâmicos por usuário (ver contas/relatorios.py); a chave já muda
+# a cada alteração dos dados, o prazo só limpa combinações que ninguém repete
+RELATORIOS_CACHE_TIMEOUT = 600
+
+# Sincronização incremental: alterações mais recentes que isso ficam para a
+# próxima rodada (cobre transações que ainda não fizeram COMMIT)
+SINCRONIZACAO_MARGEM_SEGUNDOS = int(os.getenv('SINCRONIZACAO_MARGEM_SEGUNDOS', 5))
+
 
 # ============================================
 # VALIDAÇÃO DE SENHAS
@@ -148,6 +214,21 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# ✅ collectstatic gera cópias com hash no nome (cache "para sempre" no
+# navegador) e versões .gz/.br; o WhiteNoise serve a que o navegador aceitar
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Arquivos com hash no nome recebem Cache-Control immutable de 10 anos;
+# os demais (sem hash), um dia
+WHITENOISE_MAX_AGE = 24 * 60 * 60
+
 # ============================================
 # 🔒 CONFIGURAÇÕES DE SEGURANÇA (CRÍTICO)
 # ============================================
@@ -158,6 +239,23 @@ SESSION_COOKIE_SECURE = not DEBUG  # ✅ Cookies só via HTTPS em produção
 SESSION_COOKIE_SAMESITE = 'Lax'  # ✅ Proteção contra CSRF
 SESSION_COOKIE_AGE = 86400  # 24 horas (pode ajustar)
 
+# Onde a sessão mora (SESSION_ESTRATEGIA):
+# - 'cached_db' (padrão): lida do cache; o banco só é tocado quando a sessão muda
+# - 'cookies': assinada no próprio cookie, zero consultas (não dá para revogar no servidor
+#   antes de expirar; mantenha SESSION_COOKIE_AGE curto)
+# - 'cache': só no cache (some se o cache for limpo)
+# - 'db': padrão do Django (SELECT a cada requisição autenticada)
+SESSION_ESTRATEGIA = os.getenv('SESSION_ESTRATEGIA', 'cached_db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_ESTRATEGIA]
+
+# ✅ Mensagens no cookie: nunca escrevem na sessão (o padrão transborda para ela)
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 # 2. Proteção CSRF
 CSRF_COOKIE_HTTPONLY = True  # ✅ JavaScript não consegue ler token CSRF
 CSRF_COOKIE_SECURE = not DEBUG  # ✅ CSRF token só via HTTPS em produção
@@ -183,6 +281,32 @@ REST_FRAMEWORK = {
     ],
 }
 
+# ============================================
+# GEMINI (IA) - LIMITES DE USO
+# ============================================
+GEMINI_GOVERNADOR = {
+    'REQUISICOES_POR_MINUTO': int(os.getenv('GEMINI_RPM', '10')),
+    'MAX_SIMULTANEAS': int(os.getenv('GEMINI_MAX_SIMULTANEAS', '4')),
+    'MAX_POR_USUARIO': int(os.getenv('GEMINI_MAX_POR_USUARIO', '2')),
+    'ESPERA_MAXIMA': float(os.getenv('GEMINI_ESPERA_MAXIMA', '30')),
+    'TENTATIVAS': int(os.getenv('GEMINI_TENTATIVAS', '4')),
+    # ✅ Cliente local sem rede (testes de carga / desenvolvimento)
+    'CLIENTE_FALSO': os.getenv('GEMINI_CLIENTE_FALSO', 'False') == 'True',
+    'FALSO_TAXA_429': float(os.getenv('GEMINI_FALSO_TAXA_429', '0')),
+    'FALSO_LATENCIA': float(os.getenv('GEMINI_FALSO_LATENCIA', '0')),
+}
+
+# ✅ Fotos de extrato são reduzidas antes do envio (resolução numa página A4)
+IA_IMAGEM_DPI = int(os.getenv('IA_IMAGEM_DPI', '200'))
+IA_IMAGEM_QUALIDADE = int(os.getenv('IA_IMAGEM_QUALIDADE', '85'))
+
+# Importação em lote (vários extratos ou .zip), ver contas/importacao_lote.py
+IMPORTACAO_LOTE = {
+    'MAX_ARQUIVOS': int(os.getenv('IMPORTACAO_LOTE_MAX_ARQUIVOS', '24')),
+    'MAX_BYTES_TOTAL': int(os.getenv('IMPORTACAO_LOTE_MAX_MB', '100')) * 1024 * 1024,
+    'PROCESSOS': int(os.getenv('IMPORTACAO_LOTE_PROCESSOS', '2')),
+}
+
 # ============================================
 # CONFIGURAÇÕES DE LOGIN
 # ============================================
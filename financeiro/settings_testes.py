@@ -0,0 +1,23 @@
+"""
+Configurações dos testes: as de produção com os recursos compartilhados
+trocados por versões isoladas. Usadas pelo `manage.py test` (ver manage.py)
+e pelo pytest (ver pytest.ini).
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES, STORAGES
+
+# Cache em memória. O cache.clear() dos testes não pode apagar o cache
+# em disco de verdade (nem as sessões cached_db de quem estiver logado)
+CACHES = {
+    **CACHES,
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'testes',
+    },
+}
+
+# Sem manifesto (não exige collectstatic antes de renderizar templates)
+STORAGES = {
+    **STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
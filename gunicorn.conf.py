@@ -0,0 +1,31 @@
+"""
+Configuração do gunicorn (usada pelo Procfile).
+
+Os valores podem ser ajustados por variáveis de ambiente sem mudar o código.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# ✅ Carrega o Django uma única vez no processo master; os workers nascem por fork
+# com tudo já importado (subida mais rápida e memória compartilhada).
+# Nada abre conexão de banco ou cliente da IA durante o import, então o fork é seguro.
+preload_app = True
+
+# A carga é de I/O (Postgres remoto e chamadas longas ao Gemini/SSE):
+# threads atendem mais requisições por MB de memória do que processos.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Importações com IA podem levar bem mais que os 30s padrão
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recicla os workers aos poucos para conter crescimento de memória
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = 100
+
+accesslog = '-'
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'financeiro.settings')
+    # `manage.py test` roda com as configurações de teste (o pytest as pega do pytest.ini)
+    configuracoes = 'financeiro.settings_testes' if sys.argv[1:2] == ['test'] else 'financeiro.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', configuracoes)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: